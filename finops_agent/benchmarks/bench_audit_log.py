@@ -0,0 +1,69 @@
+"""
+Benchmarks the Git audit log writer.
+
+Measures commit throughput at different batch sizes, and the overhead an
+analysis node pays with the audit log on versus off. Run from the repository
+root:
+
+    python -m finops_agent.benchmarks.bench_audit_log --records 2000
+"""
+import argparse
+import json
+import os
+import statistics
+import tempfile
+import time
+from typing import Any, Dict, Optional
+
+from finops_agent.finops_agent import audit_log
+
+def bench_commits(records: int, batch_size: Optional[int]) -> Dict[str, Any]:
+    """Writes `records` records through one writer and times until they are all committed."""
+    with tempfile.TemporaryDirectory() as tmp:
+        log = audit_log.GitAuditLog(os.path.join(tmp, "audit"), batch_size=batch_size, flush_interval=60)
+        start = time.perf_counter()
+        for n in range(records):
+            log.record(f"REC-{n}", {"id": f"REC-{n}", "payload": {"n": n}})
+        log.flush()
+        elapsed = time.perf_counter() - start
+        log.close()
+    return {
+        "batch_size": batch_size,
+        "records": records,
+        "commits": log.stats.commits,
+        "seconds": round(elapsed, 4),
+        "commits_per_second": round(log.stats.commits / elapsed, 2),
+        "records_per_second": round(records / elapsed, 2),
+    }
+
+def bench_node_overhead(recs_per_node: int, runs: int, repo_dir: str) -> Dict[str, float]:
+    """Times an audited stand-in node that returns `recs_per_node` recommendations."""
+    recommendations = [{"id": f"REC-{n}", "payload": {"n": n}} for n in range(recs_per_node)]
+    node = audit_log.audited("bench", lambda state: {"recommendations": recommendations})
+    state = {"git_log_dir": repo_dir}
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        node(state)
+        timings.append(time.perf_counter() - start)
+    return {"median_ms": round(statistics.median(timings) * 1000, 4), "max_ms": round(max(timings) * 1000, 4)}
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--records", type=int, default=1000, help="Records written per commit benchmark.")
+    parser.add_argument("--recs-per-node", type=int, default=200, help="Recommendations returned by the stand-in node.")
+    parser.add_argument("--runs", type=int, default=20, help="Node invocations per overhead measurement.")
+    args = parser.parse_args()
+
+    results: Dict[str, Any] = {"commits": [bench_commits(args.records, batch_size) for batch_size in (1, 50, 500, None)]}
+
+    with tempfile.TemporaryDirectory() as tmp:
+        off = bench_node_overhead(args.recs_per_node, args.runs, "")
+        on = bench_node_overhead(args.recs_per_node, args.runs, os.path.join(tmp, "audit"))
+        audit_log.close_audit_logs()
+    results["node_overhead"] = {"recs_per_node": args.recs_per_node, "log_off": off, "log_on": on}
+
+    print(json.dumps(results, indent=2))
+
+if __name__ == "__main__":
+    main()
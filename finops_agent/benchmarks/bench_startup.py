@@ -0,0 +1,88 @@
+"""
+Benchmarks CLI startup time.
+
+Imports the module each CLI command loads in a fresh interpreter with
+`-X importtime`, and reports its cumulative import time and the heavy packages
+it pulled in. Exits non-zero when a command is over its import-time budget or
+loads a package it should not. Run from the repository root:
+
+    python -m finops_agent.benchmarks.bench_startup --repeat 5
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+from typing import Any, Dict, List, Tuple
+
+PACKAGE = "finops_agent.finops_agent"
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Per command: the module it imports before doing any work, its import-time
+# budget in milliseconds, and the heavy packages it must not load.
+COMMANDS: Dict[str, Tuple[str, float, Tuple[str, ...]]] = {
+    "cli": (f"{PACKAGE}.cli", 50.0, ("langgraph", "langchain_core", "numpy", "azure")),
+    "resource": (f"{PACKAGE}.nodes.analysis.tier_rightsizing", 600.0, ("langgraph", "langchain_core", "azure")),
+    "analyze": (f"{PACKAGE}.orchestrator", 3000.0, ("azure",)),
+}
+HEAVY_PACKAGES = ("langgraph", "langchain_core", "numpy", "httpx", "azure")
+
+def measure_import(module: str) -> Tuple[float, List[str]]:
+    """
+    Imports `module` in a fresh interpreter.
+
+    Returns:
+        Its cumulative import time in milliseconds, and the heavy packages loaded.
+    """
+    code = (f"import sys, {module}; "
+            f"print(','.join(p for p in {HEAVY_PACKAGES!r} if p in sys.modules))")
+    completed = subprocess.run([sys.executable, "-X", "importtime", "-c", code], cwd=REPO_ROOT,
+                               capture_output=True, text=True, check=True)
+    # Lines are 'import time: <self us> | <cumulative us> | <indented module name>'.
+    for line in completed.stderr.splitlines():
+        fields = line.split("|")
+        if len(fields) == 3 and fields[2].strip() == module:
+            cumulative_ms = int(fields[1]) / 1000
+            break
+    else:
+        raise RuntimeError(f"{module} does not appear in the import trace")
+    loaded = [name for name in completed.stdout.strip().split(",") if name]
+    return cumulative_ms, loaded
+
+def run_benchmark(repeat: int = 3) -> List[Dict[str, Any]]:
+    """Measures every command `repeat` times and checks it against its budget."""
+    results = []
+    for command, (module, budget_ms, forbidden) in COMMANDS.items():
+        timings, loaded = [], []
+        for _ in range(repeat):
+            elapsed_ms, loaded = measure_import(module)
+            timings.append(elapsed_ms)
+        median_ms = statistics.median(timings)
+        results.append({
+            "command": command,
+            "module": module,
+            "import_ms": round(median_ms, 1),
+            "budget_ms": budget_ms,
+            "loaded": loaded,
+            "within_budget": median_ms <= budget_ms and not set(loaded) & set(forbidden),
+        })
+    return results
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=3, help="Fresh interpreters per command; the median is reported.")
+    args = parser.parse_args()
+
+    results = run_benchmark(args.repeat)
+    print(json.dumps({"python": platform.python_version(), "machine": platform.machine(), "commands": results}, indent=2))
+    over = [result for result in results if not result["within_budget"]]
+    for result in over:
+        print(f"OVER BUDGET {result['command']}: {result['import_ms']} ms (budget {result['budget_ms']} ms), "
+              f"loaded {', '.join(result['loaded']) or 'nothing heavy'}", file=sys.stderr)
+    if over:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
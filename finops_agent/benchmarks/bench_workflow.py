@@ -0,0 +1,135 @@
+"""
+Benchmarks the analysis workflow on synthetic fleets.
+
+Runs `build_graph().invoke` against a synthetic fleet served by an in-process
+stand-in for `tools/azure.py`, and reports end-to-end and per-node wall time,
+throughput and peak memory. Results can be saved as a baseline, and later runs
+compared against it. Run from the repository root:
+
+    python -m finops_agent.benchmarks.bench_workflow --sizes 1000 10000 --save-baseline finops_agent/benchmarks/baselines/workflow.json
+    python -m finops_agent.benchmarks.bench_workflow --sizes 1000 10000 --compare finops_agent/benchmarks/baselines/workflow.json
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+from typing import Any, Dict, List, Optional
+
+from finops_agent.finops_agent import telemetry
+from finops_agent.finops_agent.orchestrator import build_graph
+from finops_agent.benchmarks.synthetic_fleet import FleetSpec, SyntheticAzure, generate_fleet
+
+# Relative slowdown (or memory growth) tolerated before a run counts as a regression.
+DEFAULT_TOLERANCE = 0.25
+
+def run_benchmark(spec: FleetSpec, latency: float = 0.0, max_concurrency: Optional[int] = None,
+                  measure_memory: bool = True) -> Dict[str, Any]:
+    """
+    Runs the workflow once over the fleet described by `spec`.
+
+    Args:
+        spec: The fleet to generate.
+        latency: Simulated seconds per Azure call.
+        max_concurrency: Concurrency limit of the Azure client, or None for its default.
+        measure_memory: Trace allocations to report peak memory. Tracing slows the run down.
+
+    Returns:
+        The run's measurements.
+    """
+    fleet = generate_fleet(spec)
+    app = build_graph()
+    initial_state = {"subscription_ids": fleet.subscription_ids, "resources": [], "recommendations": [], "git_log_dir": ""}
+
+    with SyntheticAzure(fleet, latency).patched(max_concurrency):
+        telemetry.REGISTRY.reset()
+        if measure_memory:
+            tracemalloc.start()
+        start = time.perf_counter()
+        try:
+            final_state = app.invoke(initial_state)
+            elapsed = time.perf_counter() - start
+            peak = tracemalloc.get_traced_memory()[1] if measure_memory else None
+        finally:
+            if measure_memory:
+                tracemalloc.stop()
+
+    exported = telemetry.export_json()["histograms"].get(telemetry.NODE_DURATION, [])
+    nodes = {series["labels"]["node"]: round(series["sum"], 4) for series in exported}
+    return {
+        "size": spec.size,
+        "latency": latency,
+        "seconds": round(elapsed, 4),
+        "resources_per_second": round(spec.size / elapsed, 2),
+        "peak_memory_mb": round(peak / 2**20, 2) if peak is not None else None,
+        "nodes": nodes,
+        "recommendations": len(final_state["recommendations"]),
+    }
+
+def compare_to_baseline(runs: List[Dict[str, Any]], baseline: Dict[str, Any],
+                        tolerance: float = DEFAULT_TOLERANCE) -> List[str]:
+    """
+    Compares runs with the baseline run of the same size and latency.
+
+    Returns:
+        One message per regression: throughput below, or peak memory above, the
+        baseline by more than `tolerance`.
+    """
+    baseline_runs = {(run["size"], run["latency"]): run for run in baseline.get("runs", [])}
+    regressions = []
+    for run in runs:
+        reference = baseline_runs.get((run["size"], run["latency"]))
+        if reference is None:
+            continue
+        label = f"size={run['size']} latency={run['latency']}"
+        if run["resources_per_second"] < reference["resources_per_second"] * (1 - tolerance):
+            regressions.append(f"{label}: {run['resources_per_second']} resources/s, "
+                               f"baseline {reference['resources_per_second']}")
+        if run["peak_memory_mb"] is not None and reference.get("peak_memory_mb") is not None \
+                and run["peak_memory_mb"] > reference["peak_memory_mb"] * (1 + tolerance):
+            regressions.append(f"{label}: peak memory {run['peak_memory_mb']} MB, "
+                               f"baseline {reference['peak_memory_mb']} MB")
+    return regressions
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000], help="Fleet sizes to run.")
+    parser.add_argument("--latency", type=float, default=0.0, help="Simulated seconds per Azure call.")
+    parser.add_argument("--max-concurrency", type=int, default=None, help="Concurrency limit of the Azure client.")
+    parser.add_argument("--instances-per-subscription", type=int, default=50)
+    parser.add_argument("--vnet-ratio", type=float, default=0.3)
+    parser.add_argument("--multi-region-ratio", type=float, default=0.2)
+    parser.add_argument("--capacity-mean", type=float, default=45.0)
+    parser.add_argument("--capacity-stddev", type=float, default=20.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--no-memory", action="store_true", help="Skip allocation tracing (faster, no peak memory).")
+    parser.add_argument("--save-baseline", metavar="PATH", help="Write the results to PATH as the new baseline.")
+    parser.add_argument("--compare", metavar="PATH", help="Compare against the baseline at PATH; exit 1 on regression.")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE)
+    args = parser.parse_args()
+
+    runs = []
+    for size in args.sizes:
+        spec = FleetSpec(size=size, instances_per_subscription=args.instances_per_subscription,
+                         vnet_ratio=args.vnet_ratio, multi_region_ratio=args.multi_region_ratio,
+                         capacity_mean=args.capacity_mean, capacity_stddev=args.capacity_stddev, seed=args.seed)
+        runs.append(run_benchmark(spec, args.latency, args.max_concurrency, measure_memory=not args.no_memory))
+    results = {"python": platform.python_version(), "machine": platform.machine(), "runs": runs}
+    print(json.dumps(results, indent=2))
+
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(os.path.abspath(args.save_baseline)), exist_ok=True)
+        with open(args.save_baseline, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare_to_baseline(runs, json.load(f), args.tolerance)
+        for message in regressions:
+            print(f"REGRESSION {message}", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+"""
+Synthetic APIM fleets and an in-process stand-in for `tools/azure.py`.
+
+`generate_fleet` builds a deterministic fleet from a `FleetSpec`. Wrapping a
+run in `SyntheticAzure(fleet, latency).patched()` makes the placeholder tool
+functions answer from that fleet, sleeping `latency` seconds per call to
+simulate Azure round trips.
+"""
+import contextlib
+import datetime
+import random
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterator, List, Optional
+from unittest.mock import patch
+
+from finops_agent.finops_agent.tools import azure
+
+DEFAULT_SKU_MIX = {"Developer": 0.1, "Basic": 0.3, "Standard": 0.35, "Premium": 0.25}
+DEFAULT_LOCATIONS = ["eastus", "westus2", "westeurope", "southeastasia"]
+
+@dataclass
+class FleetSpec:
+    """
+    Shape of a synthetic fleet.
+
+    Attributes:
+        size: Number of APIM instances.
+        instances_per_subscription: Instances placed in each subscription.
+        sku_mix: Relative weight of each SKU name.
+        vnet_ratio: Share of instances with a virtual network.
+        multi_region_ratio: Share of Premium instances with additional locations.
+        capacity_mean: Mean P95 Capacity, in percent.
+        capacity_stddev: Standard deviation of P95 Capacity (clipped to 0-100).
+        seed: Seed of the generator; the same spec always builds the same fleet.
+    """
+    size: int = 1000
+    instances_per_subscription: int = 50
+    sku_mix: Dict[str, float] = field(default_factory=lambda: dict(DEFAULT_SKU_MIX))
+    vnet_ratio: float = 0.3
+    multi_region_ratio: float = 0.2
+    capacity_mean: float = 45.0
+    capacity_stddev: float = 20.0
+    locations: List[str] = field(default_factory=lambda: list(DEFAULT_LOCATIONS))
+    seed: int = 0
+
+@dataclass
+class SyntheticFleet:
+    """A generated fleet: instances grouped by subscription, and metrics by resource ID."""
+    spec: FleetSpec
+    instances_by_subscription: Dict[str, List[Dict[str, Any]]]
+    metrics: Dict[str, Dict[str, float]]
+
+    @property
+    def subscription_ids(self) -> List[str]:
+        return list(self.instances_by_subscription)
+
+    def instances(self) -> Iterator[Dict[str, Any]]:
+        for instances in self.instances_by_subscription.values():
+            yield from instances
+
+    def __len__(self) -> int:
+        return len(self.metrics)
+
+def generate_fleet(spec: FleetSpec) -> SyntheticFleet:
+    """Builds the fleet described by `spec`."""
+    rng = random.Random(spec.seed)
+    skus, weights = list(spec.sku_mix), list(spec.sku_mix.values())
+    instances_by_subscription: Dict[str, List[Dict[str, Any]]] = {}
+    metrics: Dict[str, Dict[str, float]] = {}
+
+    for n in range(spec.size):
+        subscription_id = f"{n // spec.instances_per_subscription:08d}-0000-0000-0000-{spec.seed:012d}"
+        name = f"apim-{n:06d}"
+        sku = rng.choices(skus, weights)[0]
+        vnet = "External" if rng.random() < spec.vnet_ratio else "None"
+        location = rng.choice(spec.locations)
+        additional_locations = []
+        if sku == "Premium" and rng.random() < spec.multi_region_ratio:
+            additional_locations = [{"location": rng.choice([l for l in spec.locations if l != location] or [location])}]
+        instance = {
+            "id": f"/subscriptions/{subscription_id}/resourceGroups/rg-{name}/providers/Microsoft.ApiManagement/service/{name}",
+            "name": name,
+            "location": location,
+            "sku": {"name": sku, "capacity": 1 if sku in ("Developer", "Basic") else rng.randint(1, 4)},
+            "properties": {"virtualNetworkType": vnet, "additionalLocations": additional_locations},
+        }
+        instances_by_subscription.setdefault(subscription_id, []).append(instance)
+
+        capacity = min(100.0, max(0.0, rng.gauss(spec.capacity_mean, spec.capacity_stddev)))
+        metrics[instance["id"].lower()] = {
+            "Capacity": round(capacity, 2),
+            "CpuPercentage": round(min(100.0, capacity * rng.uniform(0.6, 1.1)), 2),
+            "MemoryPercentage": round(min(100.0, capacity * rng.uniform(0.8, 1.3)), 2),
+            "Requests": float(int(capacity * rng.uniform(5e3, 5e4))),
+        }
+
+    return SyntheticFleet(spec, instances_by_subscription, metrics)
+
+class SyntheticAzure:
+    """Answers the `tools/azure.py` placeholder calls from a synthetic fleet."""
+
+    def __init__(self, fleet: SyntheticFleet, latency: float = 0.0):
+        """
+        Args:
+            fleet: The fleet to serve.
+            latency: Seconds each call sleeps before answering.
+        """
+        self.fleet = fleet
+        self.latency = latency
+        self._instances = {i["id"].lower(): i for i in fleet.instances()}
+
+    def _wait(self) -> None:
+        if self.latency:
+            time.sleep(self.latency)
+
+    def get_apim_properties(self, resource_id: str) -> Dict[str, Any]:
+        self._wait()
+        return self._instances[resource_id.lower()]
+
+    def get_apim_metrics(self, resource_id: str, metric_names: List[str], timespan: datetime.timedelta) -> Dict[str, float]:
+        self._wait()
+        metrics = self.fleet.metrics[resource_id.lower()]
+        return {name: metrics[name] for name in metric_names if name in metrics}
+
+    def list_all_apim_instances(self, subscription_id: str) -> List[Dict[str, Any]]:
+        self._wait()
+        return list(self.fleet.instances_by_subscription.get(subscription_id, []))
+
+    @contextlib.contextmanager
+    def patched(self, max_concurrency: Optional[int] = None) -> Iterator["SyntheticAzure"]:
+        """
+        Routes the placeholder tool functions to this stand-in, on a fresh offline
+        client, cache and inventory, and restores them on exit.
+        """
+        azure.configure_client(None, **({"max_concurrency": max_concurrency} if max_concurrency else {}))
+        azure.clear_cache()
+        azure.clear_inventory()
+        try:
+            with patch.object(azure, "get_apim_properties", self.get_apim_properties), \
+                 patch.object(azure, "get_apim_metrics", self.get_apim_metrics), \
+                 patch.object(azure, "list_all_apim_instances", self.list_all_apim_instances):
+                yield self
+        finally:
+            azure.clear_inventory()
+            azure.clear_cache()
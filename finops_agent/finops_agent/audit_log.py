@@ -0,0 +1,214 @@
+import datetime
+import functools
+import json
+import logging
+import os
+import queue
+import re
+import subprocess
+import threading
+import time
+from dataclasses import dataclass, asdict
+from typing import Any, Callable, Dict, List, Optional
+
+# The Git audit log offloads the full detail of every recommendation from the
+# in-memory state to a local Git repository. Nodes only put records on a
+# queue; a background thread writes them to files and commits them in batches,
+# so no node ever waits on disk or on git.
+
+# Records per commit. None commits only when the log is flushed (one commit per run).
+DEFAULT_BATCH_SIZE: Optional[int] = 500
+# With a batch size, a partial batch is committed after this many seconds without new records.
+DEFAULT_FLUSH_INTERVAL_SECONDS = 5.0
+# How long the end of a run waits for the audit log to commit before moving on.
+DEFAULT_FLUSH_TIMEOUT_SECONDS = 60.0
+RECOMMENDATIONS_DIR = "recommendations"
+# Identity used for audit commits, so they do not depend on the user's git config.
+COMMITTER = ["-c", "user.name=FinOps Agent", "-c", "user.email=finops-agent@localhost"]
+
+@dataclass
+class AuditLogStats:
+    records_written: int = 0
+    commits: int = 0
+    errors: int = 0
+    commit_seconds: float = 0.0
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+class _FlushRequest:
+    """Queue marker: commit everything queued before it, then signal."""
+    def __init__(self):
+        self.done = threading.Event()
+
+_STOP = object()
+
+logger = logging.getLogger(__name__)
+
+def _safe_filename(record_id: str) -> str:
+    return re.sub(r"[^A-Za-z0-9._-]", "_", record_id) + ".json"
+
+class GitAuditLog:
+    """
+    Batched, background writer for the Git audit log.
+
+    Each record is written to `recommendations/<id>.json` in the repository, so a
+    recommendation's history is the history of its file. Records are committed
+    once `batch_size` of them are pending, after `flush_interval` seconds of
+    quiet, or when `flush` is called. Without a batch size, they are committed
+    only on `flush` and `close`.
+    """
+
+    def __init__(self, repo_dir: str, batch_size: Optional[int] = DEFAULT_BATCH_SIZE,
+                 flush_interval: float = DEFAULT_FLUSH_INTERVAL_SECONDS):
+        """
+        Args:
+            repo_dir: Directory of the Git repository; created and initialized if needed.
+            batch_size: Records per commit, or None to commit only on `flush`.
+            flush_interval: Seconds of quiet after which a partial batch is committed.
+                Ignored without a batch size.
+        """
+        self.repo_dir = repo_dir
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.stats = AuditLogStats()
+        self.last_error: Optional[str] = None
+        self._queue: "queue.Queue[Any]" = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="finops-audit-log", daemon=True)
+        self._thread.start()
+
+    # --- Producer side (called from nodes) ---
+
+    def record(self, record_id: str, record: Dict[str, Any]) -> None:
+        """Queues a record for writing. Never blocks."""
+        self._queue.put_nowait((record_id, record))
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """
+        Commits every record queued so far.
+
+        Returns:
+            True if the commit finished within `timeout`.
+        """
+        request = _FlushRequest()
+        self._queue.put_nowait(request)
+        return request.done.wait(timeout)
+
+    def close(self) -> None:
+        """Flushes pending records and stops the writer thread."""
+        self._queue.put_nowait(_STOP)
+        self._thread.join()
+
+    # --- Writer side (background thread) ---
+
+    def _git(self, *args: str) -> None:
+        subprocess.run(["git", *COMMITTER, *args], cwd=self.repo_dir, check=True,
+                       stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+
+    def _ensure_repo(self) -> None:
+        os.makedirs(os.path.join(self.repo_dir, RECOMMENDATIONS_DIR), exist_ok=True)
+        if not os.path.isdir(os.path.join(self.repo_dir, ".git")):
+            self._git("init", "-q")
+
+    def _commit(self, batch: List[Any]) -> None:
+        """Writes a batch of records and commits them in one commit."""
+        if not batch:
+            return
+        started = time.perf_counter()
+        try:
+            self._ensure_repo()
+            paths = []
+            for record_id, record in batch:
+                path = os.path.join(RECOMMENDATIONS_DIR, _safe_filename(record_id))
+                with open(os.path.join(self.repo_dir, path), "w") as f:
+                    json.dump(record, f, indent=2, sort_keys=True, default=str)
+                paths.append(path)
+            self._git("add", "--", *sorted(set(paths)))
+            # --allow-empty: re-recording identical content still marks the run.
+            self._git("commit", "-q", "--allow-empty", "-m", f"Audit: {len(batch)} recommendation records")
+            self.stats.records_written += len(batch)
+            self.stats.commits += 1
+        except (OSError, subprocess.CalledProcessError) as e:
+            self.stats.errors += 1
+            stderr = getattr(e, "stderr", None)
+            self.last_error = stderr.decode(errors="replace").strip() if stderr else str(e)
+            logger.warning("Could not commit %d records to %s. Error: %s", len(batch), self.repo_dir, self.last_error)
+        finally:
+            self.stats.commit_seconds += time.perf_counter() - started
+
+    def _handle(self, item: Any, batch: List[Any]) -> List[Any]:
+        """Processes one queue item (None after a quiet interval). Returns the records still pending."""
+        if item is None or item is _STOP or isinstance(item, _FlushRequest):
+            self._commit(batch)
+            return []
+        batch.append(item)
+        if self.batch_size is not None and len(batch) >= self.batch_size:
+            self._commit(batch)
+            return []
+        return batch
+
+    def _run(self) -> None:
+        batch: List[Any] = []
+        # Without a batch size, records wait for a flush however long the run is quiet.
+        timeout = self.flush_interval if self.batch_size is not None else None
+        while True:
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                item = None
+
+            try:
+                batch = self._handle(item, batch)
+            except Exception as e:
+                # The writer thread must outlive any bad record, or every later
+                # flush would wait forever.
+                self.stats.errors += 1
+                self.last_error = str(e)
+                logger.warning("Dropped %d audit records. Error: %s", len(batch), e)
+                batch = []
+
+            if item is _STOP:
+                return
+            if isinstance(item, _FlushRequest):
+                item.done.set()
+
+# --- Process-wide logs, one per repository directory ---
+
+_logs: Dict[str, GitAuditLog] = {}
+_logs_lock = threading.Lock()
+
+def get_audit_log(repo_dir: Optional[str]) -> Optional[GitAuditLog]:
+    """Returns the writer for `repo_dir`, starting it on first use, or None if `repo_dir` is empty."""
+    if not repo_dir:
+        return None
+    with _logs_lock:
+        log = _logs.get(repo_dir)
+        if log is None:
+            log = _logs[repo_dir] = GitAuditLog(repo_dir)
+        return log
+
+def close_audit_logs() -> None:
+    """Flushes and stops every writer started with `get_audit_log`."""
+    with _logs_lock:
+        logs = list(_logs.values())
+        _logs.clear()
+    for log in logs:
+        log.close()
+
+def record_recommendations(repo_dir: Optional[str], node_name: str, recommendations: List[Dict[str, Any]]) -> None:
+    """Queues one audit record per recommendation. A no-op if no audit log is configured."""
+    log = get_audit_log(repo_dir)
+    if log is None:
+        return
+    recorded_at = datetime.datetime.now(datetime.timezone.utc).isoformat()
+    for rec in recommendations:
+        log.record(rec["id"], {"node": node_name, "recorded_at": recorded_at, "recommendation": rec})
+
+def audited(node_name: str, node: Callable[[Dict[str, Any]], Dict[str, Any]]) -> Callable[[Dict[str, Any]], Dict[str, Any]]:
+    """Wraps an analysis node so the recommendations it returns are queued for the audit log."""
+    @functools.wraps(node)
+    def audited_node(state: Dict[str, Any]) -> Dict[str, Any]:
+        update = node(state)
+        record_recommendations(state.get("git_log_dir"), node_name, update.get("recommendations", []))
+        return update
+    return audited_node
@@ -0,0 +1,135 @@
+import json
+import sqlite3
+import threading
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Any, Dict, Iterable, List, Optional
+
+if TYPE_CHECKING:
+    # Imported when a checkpointer is opened, so the analysis nodes load without LangGraph.
+    from langgraph.checkpoint.sqlite import SqliteSaver
+
+# Checkpointing and resume for long analysis runs. Two things are saved in
+# one SQLite file, both keyed by the run ID:
+#   * the graph state after every node, by LangGraph's `SqliteSaver` (the run
+#     ID is the LangGraph thread ID), so a resumed run skips finished nodes;
+#   * inside a node, the results of every finished chunk of resources, so a
+#     resumed node replays them instead of fetching their metrics again.
+
+# Number of resources (or subscriptions) evaluated between two progress saves.
+DEFAULT_CHUNK_SIZE = 500
+
+def run_config(run_id: str) -> Dict[str, Any]:
+    """Returns the LangGraph config that selects the run's checkpoints."""
+    return {"configurable": {"thread_id": run_id}}
+
+@dataclass
+class ChunkResult:
+    """What a node computed for one key (a resource or a subscription) during a run."""
+    metrics: Dict[str, float]
+    recommendations: List[Dict[str, Any]]
+
+class ProgressStore:
+    """
+    SQLite-backed store of per-key node results within runs, safe to share
+    between the graph's parallel nodes.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS node_progress ("
+            " run_id TEXT NOT NULL, node TEXT NOT NULL, key TEXT NOT NULL,"
+            " metrics TEXT NOT NULL, recommendations TEXT NOT NULL,"
+            " PRIMARY KEY (run_id, node, key))"
+        )
+        self._db.commit()
+
+    def completed(self, run_id: str, node: str) -> Dict[str, ChunkResult]:
+        """Returns every result the node saved during the run."""
+        with self._lock:
+            rows = self._db.execute("SELECT key, metrics, recommendations FROM node_progress WHERE run_id = ? AND node = ?",
+                                    (run_id, node)).fetchall()
+        return {key: ChunkResult(json.loads(metrics), json.loads(recs)) for key, metrics, recs in rows}
+
+    def record(self, run_id: str, node: str, results: Dict[str, ChunkResult]) -> None:
+        """Saves one chunk's results in one transaction."""
+        with self._lock, self._db:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO node_progress VALUES (?, ?, ?, ?, ?)",
+                [(run_id, node, key, json.dumps(result.metrics), json.dumps(result.recommendations))
+                 for key, result in results.items()],
+            )
+
+    def discard(self, run_id: str) -> None:
+        """Drops the run's progress, e.g. once its nodes' results are in a graph checkpoint."""
+        with self._lock, self._db:
+            self._db.execute("DELETE FROM node_progress WHERE run_id = ?", (run_id,))
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
+
+class NodeProgress:
+    """The chunk progress of one node within one run."""
+
+    def __init__(self, store: ProgressStore, run_id: str, node: str):
+        self.store = store
+        self.run_id = run_id
+        self.node = node
+        self._completed = store.completed(run_id, node)
+
+    def completed(self, keys: Iterable[str]) -> Dict[str, ChunkResult]:
+        """Returns the saved results of those keys a previous attempt finished."""
+        return {key: self._completed[key] for key in keys if key in self._completed}
+
+    def pending(self, keys: Iterable[str]) -> List[str]:
+        """Returns the keys still to evaluate, in order."""
+        return [key for key in keys if key not in self._completed]
+
+    def record(self, results: Dict[str, ChunkResult]) -> None:
+        self.store.record(self.run_id, self.node, results)
+        self._completed.update(results)
+
+_savers: Dict[str, "SqliteSaver"] = {}
+_progress_stores: Dict[str, ProgressStore] = {}
+_lock = threading.Lock()
+
+def open_checkpointer(path: str) -> "SqliteSaver":
+    """Returns the process-wide LangGraph checkpointer for `path`."""
+    from langgraph.checkpoint.sqlite import SqliteSaver
+
+    with _lock:
+        saver = _savers.get(path)
+        if saver is None:
+            saver = _savers[path] = SqliteSaver(sqlite3.connect(path, check_same_thread=False))
+        return saver
+
+def open_progress_store(path: str) -> ProgressStore:
+    """Returns the process-wide progress store for `path`, so parallel nodes share one connection."""
+    with _lock:
+        store = _progress_stores.get(path)
+        if store is None:
+            store = _progress_stores[path] = ProgressStore(path)
+        return store
+
+def node_progress(state: Dict[str, Any], node: str) -> Optional[NodeProgress]:
+    """Returns the node's progress within the state's run, or None if the run is not checkpointed."""
+    if not state.get("checkpoint_path") or not state.get("run_id"):
+        return None
+    return NodeProgress(open_progress_store(state["checkpoint_path"]), state["run_id"], node)
+
+def chunk_size_from_state(state: Dict[str, Any]) -> int:
+    """Returns the state's checkpoint chunk size, or the default."""
+    return state.get("checkpoint_chunk_size") or DEFAULT_CHUNK_SIZE
+
+def close_checkpoint_stores() -> None:
+    """Closes every checkpointer and progress store opened in this process."""
+    with _lock:
+        for saver in _savers.values():
+            saver.conn.close()
+        for store in _progress_stores.values():
+            store.close()
+        _savers.clear()
+        _progress_stores.clear()
@@ -0,0 +1,181 @@
+import argparse
+import logging
+import os
+import sys
+from typing import Any, Callable, List, Optional
+
+# Command-line entry point: `python -m finops_agent.finops_agent <command>`, from the repository root.
+#
+# Only the standard library is imported at module load. Each command imports
+# what it needs when it runs, so short runs do not pay for LangGraph (or, once
+# live clients are used, the Azure SDK):
+# - `analyze` builds (once per process) and runs the analysis graph, with
+#   `--shard-size` runs it per shard of subscriptions on a process pool, or with
+#   `--stream` exports the subscriptions' recommendations chunk by chunk;
+# - `resource` runs the rightsizing rules on one instance without any graph;
+# - `remediate` runs the remediation graph over the recommendation store;
+# - `serve` keeps all of the above warm and runs analysis jobs sent over a local socket.
+
+LOG_LEVELS = ("DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL")
+
+def _credential_factory(args: argparse.Namespace) -> Optional[Callable[[], Any]]:
+    if not args.default_credential:
+        return None
+    from azure.identity import DefaultAzureCredential
+
+    return DefaultAzureCredential
+
+def _analyze(args: argparse.Namespace) -> int:
+    if args.shard_size:
+        return _analyze_sharded(args)
+    credential_factory = _credential_factory(args)
+    if credential_factory is not None:
+        from .tools import azure
+
+        azure.configure_client(os.environ.get(azure.ARM_ENDPOINT_ENV), credential=credential_factory())
+    if args.stream:
+        return _analyze_stream(args)
+    from . import orchestrator
+
+    initial_state = {
+        "subscription_ids": args.subscription or [],
+        "resources": [],
+        "recommendations": [],
+        "git_log_dir": args.git_log_dir,
+        "export_path": args.export_path,
+        "export_columnar_path": args.columnar_path,
+    }
+    if args.recommendation_store_path:
+        initial_state["recommendation_store_path"] = args.recommendation_store_path
+    # stdout carries the exported recommendations.
+    print("---STARTING FINOPS ANALYSIS WORKFLOW---", file=sys.stderr)
+    orchestrator.run_analysis(initial_state, args.run_id, args.checkpoint_path)
+    print("---FINOPS ANALYSIS WORKFLOW COMPLETE---", file=sys.stderr)
+    return 0
+
+def _analyze_sharded(args: argparse.Namespace) -> int:
+    from . import export, sharding
+
+    # Each worker process builds its own client and credential; the parent
+    # writes the merged recommendations to the audit log and the export.
+    print("---STARTING SHARDED FINOPS ANALYSIS---", file=sys.stderr)
+    recommendations = sharding.run_sharded_analysis(args.subscription, args.shard_size, args.shard_workers,
+                                                    credential_factory=_credential_factory(args),
+                                                    git_log_dir=args.git_log_dir)
+    export.export_recommendations(recommendations, args.export_path, args.columnar_path)
+    print("---SHARDED FINOPS ANALYSIS COMPLETE---", file=sys.stderr)
+    return 0
+
+def _analyze_stream(args: argparse.Namespace) -> int:
+    from . import export, streaming
+
+    if not args.subscription:
+        print("analyze --stream needs at least one --subscription", file=sys.stderr)
+        return 2
+    # No graph state: discovery pages go through the analysis in chunks, and
+    # each recommendation is written as soon as it is produced.
+    export.export_recommendations(streaming.stream_fleet_recommendations(args.subscription),
+                                  args.export_path, args.columnar_path)
+    return 0
+
+def _resource(args: argparse.Namespace) -> int:
+    from . import export
+    from .nodes.analysis.tier_rightsizing import analyze_resources
+
+    # Consolidation needs the other instances of the subscription, so only the
+    # per-instance rightsizing rules apply here.
+    export.export_recommendations(analyze_resources([args.resource_id]), jsonl_path=args.export_path)
+    return 0
+
+def _remediate(args: argparse.Namespace) -> int:
+    from . import orchestrator
+
+    final_state = orchestrator.build_remediation_graph().invoke({
+        "recommendation_store_path": args.recommendation_store_path,
+        "dry_run": args.dry_run,
+    })
+    for outcome, count in sorted(final_state.get("remediation_report", {}).items()):
+        print(f"{outcome}: {count}")
+    return 0 if "failed" not in final_state.get("remediation_report", {}) else 1
+
+def _serve(args: argparse.Namespace) -> int:
+    from . import service
+
+    analysis_service = service.AnalysisService(args.workers, args.recommendation_store_path, git_log_dir=args.git_log_dir)
+    with service.serve(analysis_service, args.host, args.port) as server:
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            analysis_service.close()
+    return 0
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="finops_agent", description="FinOps agent for Azure API Management.")
+    parser.add_argument("--log-level", default="INFO", type=str.upper, choices=LOG_LEVELS,
+                        help="logging level (default: INFO)")
+    parser.add_argument("--structured-logs", action="store_true", help="log JSON lines")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    analyze = commands.add_parser("analyze", help="run the analysis workflow")
+    analyze.add_argument("--subscription", action="append", help="subscription to scan (repeatable); "
+                                                                 "without it, placeholder resources are used")
+    analyze.add_argument("--run-id", help="ID of the run; rerun with the same ID to resume it")
+    analyze.add_argument("--checkpoint-path", help="SQLite file for the run's checkpoints")
+    analyze.add_argument("--recommendation-store-path", help="SQLite file of the recommendation store")
+    analyze.add_argument("--git-log-dir", default="/tmp/finops_git_audit_log", help="directory of the Git audit log")
+    analyze.add_argument("--export-path", default="-",
+                         help="JSONL file to stream the recommendations to ('.gz' to compress; default: stdout)")
+    analyze.add_argument("--columnar-path", help="columnar file to stream the recommendations to ('.gz' to compress)")
+    analyze.add_argument("--stream", action="store_true",
+                         help="analyze and export page by page, in constant memory, without the graph; needs "
+                              "--subscription and skips checkpoints, the audit log and the recommendation store")
+    analyze.add_argument("--shard-size", type=int,
+                         help="analyze the subscriptions in shards of this many, each on a worker process; needs "
+                              "--subscription and skips checkpoints and the recommendation store")
+    analyze.add_argument("--shard-workers", type=int, help="worker processes for --shard-size (default: CPU count)")
+    analyze.add_argument("--default-credential", action="store_true",
+                         help="authenticate Azure calls with azure-identity's DefaultAzureCredential")
+    analyze.set_defaults(run=_analyze)
+
+    resource = commands.add_parser("resource", help="check one APIM instance, without building the graph")
+    resource.add_argument("resource_id", help="resource ID of the instance")
+    resource.add_argument("--export-path", default="-", help="JSONL file to write the recommendations to (default: stdout)")
+    resource.set_defaults(run=_resource)
+
+    remediate = commands.add_parser("remediate", help="apply the approved recommendations")
+    remediate.add_argument("--recommendation-store-path", required=True, help="SQLite file of the recommendation store")
+    remediate.add_argument("--dry-run", action="store_true", help="only report the updates that would be sent")
+    remediate.set_defaults(run=_remediate)
+
+    serve = commands.add_parser("serve", help="run analysis jobs sent as JSON lines over a local socket")
+    serve.add_argument("--host", default="127.0.0.1", help="address to listen on (default: 127.0.0.1)")
+    serve.add_argument("--port", type=int, default=8765, help="port to listen on (default: 8765)")
+    serve.add_argument("--workers", type=int, default=4, help="jobs run at once (default: 4)")
+    serve.add_argument("--recommendation-store-path", help="SQLite file every job's recommendations are upserted into")
+    serve.add_argument("--git-log-dir", default="", help="directory of the Git audit log (default: none)")
+    serve.set_defaults(run=_serve)
+    return parser
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if args.command == "analyze" and bool(args.run_id) != bool(args.checkpoint_path):
+        # A run is only resumable with both; either alone would fail or be ignored.
+        parser.error("--run-id and --checkpoint-path must be given together")
+    if args.command == "analyze" and args.shard_size is not None:
+        if args.shard_size < 1:
+            parser.error("--shard-size must be at least 1")
+        if not args.subscription:
+            parser.error("--shard-size needs at least one --subscription")
+        if args.stream or args.run_id or args.recommendation_store_path:
+            # Shards run as separate graphs, so there is no single run to checkpoint or reconcile.
+            parser.error("--shard-size cannot be combined with --stream, --run-id or --recommendation-store-path")
+    from . import telemetry
+
+    telemetry.configure_logging(getattr(logging, args.log_level), structured=args.structured_logs)
+    return args.run(args)
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,158 @@
+import contextlib
+import gzip
+import io
+import json
+import logging
+import sys
+from typing import Any, BinaryIO, Dict, Iterable, Iterator, List, Optional
+
+# Streaming export of recommendations, for fleets whose results are too large
+# to serialize in one piece. Recommendations are encoded one at a time and
+# written through a fixed-size buffer, so memory stays constant however many
+# are exported. Paths ending in '.gz' are gzip-compressed; '-' is stdout.
+#
+# Two formats are written:
+# - JSONL: one recommendation per line.
+# - Columnar: one JSON object per row group of up to `row_group_size`
+#   recommendations, holding one list per column (see `COLUMNS`). Field names
+#   are written once per group instead of once per row, and similar values sit
+#   next to each other, so the file compresses better and a reader can load
+#   only the columns it needs.
+
+DEFAULT_BUFFER_SIZE = 1 << 16  # Bytes buffered before each write to the file (or compressor).
+DEFAULT_ROW_GROUP_SIZE = 1024
+STDOUT = "-"
+
+# Columns of the columnar format. `estimated_monthly_saving` is copied out of
+# the payload so the recommendations can be ranked without decoding payloads.
+COLUMNS = ("id", "type", "resource_id", "status", "source_node", "estimated_monthly_saving", "details", "payload")
+
+logger = logging.getLogger(__name__)
+
+def _encode(value: Any) -> bytes:
+    return json.dumps(value, separators=(",", ":")).encode("utf-8") + b"\n"
+
+@contextlib.contextmanager
+def open_output(path: str, buffer_size: int = DEFAULT_BUFFER_SIZE) -> Iterator[BinaryIO]:
+    """
+    Opens `path` for writing through a buffer of `buffer_size` bytes,
+    gzip-compressed if it ends in '.gz'. '-' writes to stdout.
+    """
+    if path == STDOUT:
+        # Already buffered; it is flushed but left open.
+        try:
+            yield sys.stdout.buffer
+        finally:
+            sys.stdout.buffer.flush()
+        return
+
+    with open(path, "wb", buffering=buffer_size) as raw:
+        if not path.endswith(".gz"):
+            yield raw
+            return
+        # Writes reach the compressor in blocks of `buffer_size`, not line by line.
+        with gzip.GzipFile(fileobj=raw, mode="wb") as compressed, io.BufferedWriter(compressed, buffer_size) as stream:
+            yield stream
+
+class JsonlWriter:
+    """Writes recommendations one JSON object per line."""
+
+    def __init__(self, stream: BinaryIO):
+        self._stream = stream
+
+    def write(self, recommendation: Dict[str, Any]) -> None:
+        self._stream.write(_encode(recommendation))
+
+    def close(self) -> None:
+        pass
+
+class ColumnarWriter:
+    """Writes recommendations as row groups of columns (see `COLUMNS`)."""
+
+    def __init__(self, stream: BinaryIO, row_group_size: int = DEFAULT_ROW_GROUP_SIZE):
+        if row_group_size < 1:
+            raise ValueError("row_group_size must be at least 1")
+        self._stream = stream
+        self._row_group_size = row_group_size
+        self._columns: Dict[str, List[Any]] = {name: [] for name in COLUMNS}
+        self._rows = 0
+
+    def write(self, recommendation: Dict[str, Any]) -> None:
+        payload = recommendation.get("payload") or {}
+        for name in COLUMNS:
+            if name == "estimated_monthly_saving":
+                self._columns[name].append(payload.get(name))
+            else:
+                self._columns[name].append(recommendation.get(name))
+        self._rows += 1
+        if self._rows == self._row_group_size:
+            self._flush_row_group()
+
+    def _flush_row_group(self) -> None:
+        if self._rows:
+            self._stream.write(_encode({"rows": self._rows, "columns": self._columns}))
+            self._columns = {name: [] for name in COLUMNS}
+            self._rows = 0
+
+    def close(self) -> None:
+        """Writes the last, partial row group."""
+        self._flush_row_group()
+
+def export_recommendations(recommendations: Iterable[Dict[str, Any]], jsonl_path: Optional[str] = None,
+                           columnar_path: Optional[str] = None, buffer_size: int = DEFAULT_BUFFER_SIZE,
+                           row_group_size: int = DEFAULT_ROW_GROUP_SIZE) -> int:
+    """
+    Writes recommendations to JSONL and/or columnar files as they are produced.
+    The iterable is consumed once, so it can be a generator such as
+    `streaming.stream_fleet_recommendations`.
+
+    Args:
+        recommendations: The recommendations to export.
+        jsonl_path: JSONL file to write, or None.
+        columnar_path: Columnar file to write, or None.
+        buffer_size: Size of each output's write buffer, in bytes.
+        row_group_size: Recommendations per row group of the columnar file.
+
+    Returns:
+        The number of recommendations exported.
+    """
+    count = 0
+    with contextlib.ExitStack() as stack:
+        writers: List[Any] = []
+        if jsonl_path:
+            writers.append(JsonlWriter(stack.enter_context(open_output(jsonl_path, buffer_size))))
+        if columnar_path:
+            writers.append(ColumnarWriter(stack.enter_context(open_output(columnar_path, buffer_size)), row_group_size))
+        for recommendation in recommendations:
+            for writer in writers:
+                writer.write(recommendation)
+            count += 1
+        for writer in writers:
+            writer.close()
+    logger.info("Exported %d recommendations.", count)
+    return count
+
+# --- Readers ---
+
+def _open_input(path: str) -> BinaryIO:
+    return gzip.open(path, "rb") if path.endswith(".gz") else open(path, "rb")
+
+def iter_jsonl(path: str) -> Iterator[Dict[str, Any]]:
+    """Yields the recommendations of a JSONL export one at a time."""
+    with _open_input(path) as stream:
+        for line in stream:
+            yield json.loads(line)
+
+def iter_row_groups(path: str, columns: Optional[Iterable[str]] = None) -> Iterator[Dict[str, List[Any]]]:
+    """
+    Yields the row groups of a columnar export, each as a dict of column lists.
+
+    Args:
+        path: The columnar file.
+        columns: Columns to keep. Defaults to all of them.
+    """
+    keep = None if columns is None else set(columns)
+    with _open_input(path) as stream:
+        for line in stream:
+            group = json.loads(line)["columns"]
+            yield group if keep is None else {name: values for name, values in group.items() if name in keep}
@@ -0,0 +1,164 @@
+import datetime
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterable, List, Optional
+
+# Incremental re-analysis. After each run the analysis nodes persist, per
+# resource (or per subscription for consolidation), a fingerprint of the inputs
+# they evaluated and the recommendations they produced. The next run re-evaluates only keys that are new, whose inputs
+# changed, or whose last evaluation is older than the metrics window shift;
+# everything else reuses its previous recommendations without any metrics call.
+
+# Metrics are a trailing window, so even unchanged resources are re-evaluated
+# once the window has moved on by this much.
+DEFAULT_METRICS_WINDOW_SHIFT = datetime.timedelta(hours=24)
+
+def fingerprint(value: Any) -> str:
+    """Returns a stable digest of a JSON-serializable value."""
+    encoded = json.dumps(value, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(encoded.encode()).hexdigest()
+
+@dataclass
+class Snapshot:
+    """What a node saw and produced the last time it evaluated one key."""
+    inputs_fingerprint: str
+    evaluated_at: float
+    recommendations: List[Dict[str, Any]]
+
+@dataclass
+class ReanalysisPlan:
+    """Which keys a node must evaluate and which it can take from their snapshots."""
+    reuse: Dict[str, Snapshot] = field(default_factory=dict)
+    new: List[str] = field(default_factory=list)
+    changed: List[str] = field(default_factory=list)
+    window_moved: List[str] = field(default_factory=list)
+
+    @property
+    def to_evaluate(self) -> List[str]:
+        return self.new + self.changed + self.window_moved
+
+    def reused_recommendations(self) -> List[Dict[str, Any]]:
+        return [rec for snapshot in self.reuse.values() for rec in snapshot.recommendations]
+
+    def report(self, resources_per_key: Optional[Dict[str, int]] = None) -> Dict[str, int]:
+        """
+        Summarizes the plan for `AgentState.reanalysis_report`.
+
+        Args:
+            resources_per_key: Number of resources behind each key, when keys are
+                not resources (e.g. subscriptions). By default each key is one resource.
+        """
+        def resources(keys: Iterable[str]) -> int:
+            return sum(resources_per_key[key] for key in keys) if resources_per_key else len(list(keys))
+
+        return {
+            "new": len(self.new),
+            "changed": len(self.changed),
+            "window_moved": len(self.window_moved),
+            "evaluated_resources": resources(self.to_evaluate),
+            "skipped_resources": resources(self.reuse),
+        }
+
+class SnapshotStore:
+    """
+    SQLite-backed snapshot store, safe to share between the graph's parallel nodes.
+
+    Each node uses its own namespace, so keys only need to be unique per node.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS snapshots ("
+            " namespace TEXT NOT NULL, key TEXT NOT NULL, inputs_fingerprint TEXT NOT NULL,"
+            " evaluated_at REAL NOT NULL, recommendations TEXT NOT NULL,"
+            " PRIMARY KEY (namespace, key))"
+        )
+        self._db.commit()
+
+    def get_many(self, namespace: str, keys: Iterable[str]) -> Dict[str, Snapshot]:
+        """Returns the stored snapshots of the given keys; keys without one are omitted."""
+        keys = list(keys)
+        snapshots: Dict[str, Snapshot] = {}
+        with self._lock:
+            # Stay well below SQLite's limit on bound parameters per statement.
+            for start in range(0, len(keys), 500):
+                batch = keys[start:start + 500]
+                rows = self._db.execute(
+                    f"SELECT key, inputs_fingerprint, evaluated_at, recommendations FROM snapshots"
+                    f" WHERE namespace = ? AND key IN ({','.join('?' * len(batch))})",
+                    [namespace, *batch],
+                )
+                for key, inputs, evaluated_at, recommendations in rows:
+                    snapshots[key] = Snapshot(inputs, evaluated_at, json.loads(recommendations))
+        return snapshots
+
+    def put_many(self, namespace: str, snapshots: Dict[str, Snapshot]) -> None:
+        """Stores snapshots in one transaction, replacing any previous ones."""
+        with self._lock, self._db:
+            # Columns are named, as files written before the metrics digest was dropped still have it.
+            self._db.executemany(
+                "INSERT OR REPLACE INTO snapshots (namespace, key, inputs_fingerprint, evaluated_at, recommendations)"
+                " VALUES (?, ?, ?, ?, ?)",
+                [(namespace, key, s.inputs_fingerprint, s.evaluated_at, json.dumps(s.recommendations))
+                 for key, s in snapshots.items()],
+            )
+
+    def plan(self, namespace: str, fingerprints: Dict[str, str],
+             window_shift: datetime.timedelta = DEFAULT_METRICS_WINDOW_SHIFT, now: Optional[float] = None) -> ReanalysisPlan:
+        """
+        Decides which keys must be re-evaluated.
+
+        Args:
+            namespace: The node's namespace.
+            fingerprints: The current inputs fingerprint of every key.
+            window_shift: Re-evaluate keys last evaluated longer ago than this.
+            now: Current time in seconds since the epoch.
+        """
+        now = time.time() if now is None else now
+        previous = self.get_many(namespace, fingerprints)
+        plan = ReanalysisPlan()
+        for key, current in fingerprints.items():
+            snapshot = previous.get(key)
+            if snapshot is None:
+                plan.new.append(key)
+            elif snapshot.inputs_fingerprint != current:
+                plan.changed.append(key)
+            elif now - snapshot.evaluated_at >= window_shift.total_seconds():
+                plan.window_moved.append(key)
+            else:
+                plan.reuse[key] = snapshot
+        return plan
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
+
+_stores: Dict[str, SnapshotStore] = {}
+_stores_lock = threading.Lock()
+
+def open_snapshot_store(path: str) -> SnapshotStore:
+    """Returns the process-wide store for `path`, so parallel nodes share one connection."""
+    with _stores_lock:
+        store = _stores.get(path)
+        if store is None:
+            store = _stores[path] = SnapshotStore(path)
+        return store
+
+def close_snapshot_stores() -> None:
+    """Closes every store opened with `open_snapshot_store`."""
+    with _stores_lock:
+        for store in _stores.values():
+            store.close()
+        _stores.clear()
+
+def window_shift_from_state(state: Dict[str, Any]) -> datetime.timedelta:
+    """Returns the state's metrics window shift, or the default."""
+    seconds = state.get("metrics_window_shift_seconds")
+    return DEFAULT_METRICS_WINDOW_SHIFT if seconds is None else datetime.timedelta(seconds=seconds)
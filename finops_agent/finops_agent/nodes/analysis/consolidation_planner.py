@@ -0,0 +1,160 @@
+import itertools
+import logging
+import math
+import random
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+# Packs consolidation candidates into the fewest right-sized target instances.
+# A candidate's load is its P95 Capacity times its capacity units, in percent of
+# one unit. Targets keep headroom on every unit and only take candidates from
+# the same region and with the same VNet mode.
+
+# Share of every target unit kept free for peaks, in percent.
+TARGET_HEADROOM_PERCENT = 30.0
+# Load one target unit can take once the headroom is reserved.
+UNIT_LOAD_LIMIT = 100.0 - TARGET_HEADROOM_PERCENT
+# Largest target, in capacity units (the Standard tier's scale limit).
+MAX_TARGET_UNITS = 4
+TARGET_SKU = "Standard"
+
+Candidate = Tuple[Dict[str, Any], float]
+
+logger = logging.getLogger(__name__)
+
+@dataclass
+class TargetGroup:
+    """Candidates packed onto one target instance."""
+    location: str
+    virtual_network_type: str
+    members: List[Candidate] = field(default_factory=list)
+    load: float = 0.0
+
+    @property
+    def units(self) -> int:
+        """Capacity units the target needs to carry the load within its headroom."""
+        return max(1, math.ceil(self.load / UNIT_LOAD_LIMIT))
+
+    @property
+    def projected_capacity(self) -> float:
+        """Projected P95 Capacity of the target, in percent."""
+        return self.load / self.units
+
+class _Node:
+    __slots__ = ("key", "group", "priority", "left", "right")
+
+    def __init__(self, key: Tuple[float, int], group: TargetGroup, priority: float):
+        self.key = key
+        self.group = group
+        self.priority = priority
+        self.left: Optional["_Node"] = None
+        self.right: Optional["_Node"] = None
+
+def _split(node: Optional[_Node], key: Tuple[float, float]) -> Tuple[Optional[_Node], Optional[_Node]]:
+    """Splits a treap into the nodes with keys below `key` and the others."""
+    if node is None:
+        return None, None
+    if node.key < key:
+        node.right, right = _split(node.right, key)
+        return node, right
+    left, node.left = _split(node.left, key)
+    return left, node
+
+def _merge(left: Optional[_Node], right: Optional[_Node]) -> Optional[_Node]:
+    """Joins two treaps, every key of `left` being below every key of `right`."""
+    if left is None:
+        return right
+    if right is None:
+        return left
+    if left.priority > right.priority:
+        left.right = _merge(left.right, right)
+        return left
+    right.left = _merge(left, right.left)
+    return right
+
+class _OpenTargets:
+    """
+    Open targets ordered by free load, in a treap: adding a target and taking
+    the best fit for a load are both O(log n) expected.
+    """
+
+    def __init__(self):
+        self._root: Optional[_Node] = None
+        self._order = itertools.count()
+        # Fixed seed: the shape of the tree never changes the result, only its cost.
+        self._random = random.Random(0)
+
+    def add(self, free: float, group: TargetGroup) -> None:
+        # Among equal free loads, the target added last is taken first.
+        node = _Node((free, -next(self._order)), group, self._random.random())
+        left, right = _split(self._root, node.key)
+        self._root = _merge(_merge(left, node), right)
+
+    def take_best_fit(self, load: float) -> Optional[Tuple[float, TargetGroup]]:
+        """Removes and returns (free load, target) of the target with the least free load of at least `load`."""
+        left, right = _split(self._root, (load, -math.inf))
+        if right is None:
+            self._root = left
+            return None
+        parent, node = None, right
+        while node.left is not None:
+            parent, node = node, node.left
+        if parent is None:
+            right = node.right
+        else:
+            parent.left = node.right
+        self._root = _merge(left, right)
+        return node.key[0], node.group
+
+def candidate_load(instance: Dict[str, Any], p95_capacity: float) -> float:
+    """Returns a candidate's load in percent of one capacity unit."""
+    return p95_capacity * (instance.get("sku", {}).get("capacity") or 1)
+
+def compatibility_key(instance: Dict[str, Any]) -> Tuple[str, str]:
+    """Returns (region, VNet mode); only candidates with equal keys share a target."""
+    location = (instance.get("location") or "").lower()
+    vnet = instance.get("properties", {}).get("virtualNetworkType") or "None"
+    return location, vnet
+
+def pack_candidates(candidates: Iterable[Candidate], max_units: int = MAX_TARGET_UNITS) -> List[TargetGroup]:
+    """
+    Packs candidates onto targets with best-fit decreasing, per compatibility key.
+
+    Candidates are placed largest first, each on the open target with the least
+    free load that still fits it, or on a new target. Open targets are kept in a
+    treap ordered by free load, so packing n candidates is O(n log n).
+    Candidates larger than a whole target are left out.
+
+    Args:
+        candidates: (instance, P95 Capacity) pairs.
+        max_units: Capacity units of the largest target.
+
+    Returns:
+        The target groups, in a deterministic order.
+    """
+    target_load = max_units * UNIT_LOAD_LIMIT
+    by_key: Dict[Tuple[str, str], List[Candidate]] = {}
+    for instance, p95_capacity in candidates:
+        by_key.setdefault(compatibility_key(instance), []).append((instance, p95_capacity))
+
+    groups: List[TargetGroup] = []
+    for key in sorted(by_key):
+        ordered = sorted(by_key[key], key=lambda c: (-candidate_load(*c), c[0]["id"]))
+        open_targets = _OpenTargets()
+        for instance, p95_capacity in ordered:
+            load = candidate_load(instance, p95_capacity)
+            if load > target_load:
+                logger.debug("Leaving out %s: its load of %.2f%% exceeds the largest target's %.2f%%.",
+                             instance["id"], load, target_load)
+                continue
+            best_fit = open_targets.take_best_fit(load)
+            if best_fit is None:
+                group = TargetGroup(*key)
+                groups.append(group)
+                remaining = target_load
+            else:
+                remaining, group = best_fit
+            group.members.append((instance, p95_capacity))
+            group.load += load
+            open_targets.add(remaining - load, group)
+    return groups
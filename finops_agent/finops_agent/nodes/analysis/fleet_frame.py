@@ -0,0 +1,149 @@
+import logging
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+import numpy as np
+
+# Columnar view of a batch of APIM instances, for rules evaluated as boolean
+# masks over the whole batch instead of one resource at a time.
+
+# Integer codes of the SKU column; unknown or missing SKUs are -1.
+SKU_CODES = {"Developer": 0, "Basic": 1, "Standard": 2, "Standard_v2": 3, "Premium": 4, "Consumption": 5}
+UNKNOWN_SKU = -1
+
+logger = logging.getLogger(__name__)
+
+class FleetFrame:
+    """
+    Columns of one batch of instances; row `i` of every column is `resource_ids[i]`.
+
+    Attributes:
+        resource_ids: Resource ID of each row.
+        names: Instance name of each row ('unknown' if missing).
+        sku_names: SKU name of each row, as returned by Azure (may be None).
+        locations: Region of each row, lower-cased ('' if missing).
+        sku: SKU code of each row (see `SKU_CODES`).
+        capacity: Capacity units of each row.
+        vnet: Whether the row's `virtualNetworkType` is anything other than 'None'.
+        region_count: Number of regions of each row (1 + additional locations).
+        metrics: Per metric name, each row's P95 value, NaN where missing.
+    """
+
+    def __init__(self, resource_ids: Sequence[str], properties: Sequence[Dict[str, Any]],
+                 metrics: Sequence[Dict[str, float]], metric_names: Optional[Sequence[str]] = None):
+        """
+        Args:
+            resource_ids: The rows' resource IDs.
+            properties: Each row's APIM resource object.
+            metrics: Each row's metrics dict, as returned by `get_apim_metrics`.
+            metric_names: Metric columns to build. Defaults to every name seen in `metrics`.
+
+        Rows whose values cannot be converted (e.g. a non-numeric capacity) are
+        reported and left out, so `resource_ids` only holds the rows kept.
+        """
+        self.resource_ids = list(resource_ids)
+        size = len(self.resource_ids)
+        self.names: List[str] = []
+        self.sku_names: List[Optional[str]] = []
+        self.locations: List[str] = []
+        self.sku = np.empty(size, dtype=np.int8)
+        self.capacity = np.empty(size, dtype=np.int32)
+        self.vnet = np.empty(size, dtype=bool)
+        self.region_count = np.empty(size, dtype=np.int32)
+        # Rows still valid; a row is dropped as soon as one of its values does not convert.
+        keep = np.ones(size, dtype=bool)
+
+        for row, props in enumerate(properties):
+            try:
+                sku = props.get("sku") or {}
+                resource_properties = props.get("properties") or {}
+                name = props.get("name", "unknown")
+                sku_name = sku.get("name")
+                location = (props.get("location") or "").lower()
+                self.capacity[row] = int(sku.get("capacity") or 1)
+                self.region_count[row] = 1 + len(resource_properties.get("additionalLocations") or [])
+            except (AttributeError, TypeError, ValueError) as e:
+                self._drop_row(keep, row, e)
+                name, sku_name, location = "unknown", None, ""
+            else:
+                self.sku[row] = SKU_CODES.get(sku_name, UNKNOWN_SKU)
+                self.vnet[row] = resource_properties.get("virtualNetworkType") != "None"
+            self.names.append(name)
+            self.sku_names.append(sku_name)
+            self.locations.append(location)
+
+        if metric_names is None:
+            metric_names = sorted({name for values in metrics for name in values})
+        self.metrics: Dict[str, np.ndarray] = {}
+        for name in metric_names:
+            # None becomes NaN.
+            try:
+                self.metrics[name] = np.array([values.get(name) for values in metrics], dtype=np.float64).reshape(size)
+            except (AttributeError, TypeError, ValueError):
+                # Converted row by row only when the batch has a malformed value.
+                column = self.metrics[name] = np.full(size, np.nan)
+                for row, values in enumerate(metrics):
+                    try:
+                        if values.get(name) is not None:
+                            column[row] = float(values[name])
+                    except (AttributeError, TypeError, ValueError) as e:
+                        self._drop_row(keep, row, e)
+
+        if not keep.all():
+            self._keep_rows(keep)
+
+    def _drop_row(self, keep: np.ndarray, row: int, error: Exception) -> None:
+        if keep[row]:
+            keep[row] = False
+            resource_id = self.resource_ids[row]
+            logger.warning("Could not analyze resource %s. Error: %s", resource_id, error, extra={"resource_id": resource_id})
+
+    def _keep_rows(self, keep: np.ndarray) -> None:
+        """Leaves out every row where `keep` is False."""
+        rows = np.flatnonzero(keep).tolist()
+        self.resource_ids = [self.resource_ids[row] for row in rows]
+        self.names = [self.names[row] for row in rows]
+        self.sku_names = [self.sku_names[row] for row in rows]
+        self.locations = [self.locations[row] for row in rows]
+        self.sku, self.capacity = self.sku[keep], self.capacity[keep]
+        self.vnet, self.region_count = self.vnet[keep], self.region_count[keep]
+        self.metrics = {name: column[keep] for name, column in self.metrics.items()}
+
+    def __len__(self) -> int:
+        return len(self.resource_ids)
+
+    def metric(self, name: str) -> np.ndarray:
+        """Returns the metric's column, all NaN if no row has it."""
+        column = self.metrics.get(name)
+        return column if column is not None else np.full(len(self), np.nan)
+
+@dataclass(frozen=True)
+class Rule:
+    """
+    One entry of a rule table.
+
+    Attributes:
+        name: Identifies the rule in logs.
+        mask: Returns a boolean array, True for every row the rule matches.
+        build: Builds the recommendation for one matching row of the frame.
+    """
+    name: str
+    mask: Callable[[FleetFrame], np.ndarray]
+    build: Callable[[FleetFrame, int], Dict[str, Any]]
+
+def evaluate_rules(frame: FleetFrame, rules: Sequence[Rule]) -> Dict[int, List[Dict[str, Any]]]:
+    """
+    Evaluates every rule over the whole frame, one mask per rule.
+
+    Returns:
+        For every row that matched at least one rule, the recommendations of the
+        rules it matched, in rule order. Rows that matched nothing are absent.
+    """
+    results: Dict[int, List[Dict[str, Any]]] = {}
+    if not len(frame):
+        return results
+    for rule in rules:
+        # NaN compares False, so rows missing a metric never match a threshold.
+        for row in np.flatnonzero(rule.mask(frame)).tolist():
+            results.setdefault(row, []).append(rule.build(frame, row))
+    return results
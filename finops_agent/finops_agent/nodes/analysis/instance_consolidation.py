@@ -1,7 +1,10 @@
-import datetime
-from typing import Dict, Any, List
+import logging
+import time
+from typing import Dict, Any, Iterable, Iterator, List, Tuple
 
-from ...tools import azure
+from ...tools import azure, pricing
+from ... import checkpoint, incremental
+from . import consolidation_planner
 
 # --- Constants for Consolidation Analysis ---
 # We will only consider consolidating Basic and Standard instances.
@@ -9,8 +12,12 @@ from ...tools import azure
 ELIGIBLE_SKUS_FOR_CONSOLIDATION = ["Basic", "Standard"]
 # An instance is considered underutilized if its P95 capacity is below this percentage.
 CAPACITY_THRESHOLD = 30.0
-METRICS_TIMEDELTA = datetime.timedelta(days=90)
-METRIC_NAMES = ["Capacity"]
+METRICS_WINDOW_DAYS = 90
+METRICS_PERCENTILE = 95.0
+SNAPSHOT_NAMESPACE = "instance_consolidation"
+SOURCE_NODE = "InstanceConsolidationAnalysisNode"
+
+logger = logging.getLogger(__name__)
 
 def _calculate_complexity(instance_count: int) -> str:
     """Calculates a simple migration complexity score."""
@@ -21,67 +28,222 @@ def _calculate_complexity(instance_count: int) -> str:
     else:
         return "High"
 
-def instance_consolidation_analysis_node(state: Dict[str, Any]) -> Dict[str, Any]:
+def find_consolidation_candidates(instances: Iterable[Dict[str, Any]]) -> List[Tuple[Dict[str, Any], float]]:
     """
-    Analyzes all APIM instances in a subscription to find consolidation opportunities.
-    """
-    print("---NODE: INSTANCE CONSOLIDATION ANALYSIS (Live Logic)---")
+    Filters a batch of instances down to consolidation candidates.
 
-    current_recommendations: List[Dict[str, Any]] = state.get("recommendations", [])
-    # This node needs a subscription ID to list all instances.
-    # We'll extract it from the first resource ID found by the discovery node.
-    # A more robust solution would pass the subscription ID in the state directly.
-    if not state.get("resources"):
-        print("No resources found, cannot determine subscription ID.")
-        return {"recommendations": current_recommendations}
+    Returns:
+        (instance, P95 Capacity) pairs for every eligible, underutilized instance.
+    """
+    return _find_candidates(instances)[0]
 
-    first_resource_id = state["resources"][0]
-    subscription_id = first_resource_id.split('/')[2]
+def _find_candidates(instances: Iterable[Dict[str, Any]]) -> Tuple[List[Tuple[Dict[str, Any], float]], List[str]]:
+    """`find_consolidation_candidates`, also returning the IDs of eligible instances whose metrics could not be fetched."""
+    # Rule 1: Is the SKU eligible for consolidation?
+    eligible_instances = []
+    for instance in instances:
+        sku_name = instance.get("sku", {}).get("name")
+        if sku_name in ELIGIBLE_SKUS_FOR_CONSOLIDATION:
+            eligible_instances.append(instance)
+        else:
+            logger.debug("Skipping instance %s (SKU: %s) - not eligible.", instance["name"], sku_name)
 
-    print(f"Scanning subscription {subscription_id} for consolidation candidates...")
-    all_instances = azure.list_all_apim_instances(subscription_id)
+    if not eligible_instances:
+        return [], []
 
-    consolidation_candidates = []
-    for instance in all_instances:
-        instance_id = instance["id"]
-        sku_name = instance.get("sku", {}).get("name")
+    # Read the shared metric statistics for all eligible instances in one
+    # concurrent batch; instances the other nodes already ingested are not re-queried.
+    all_statistics = azure.get_metric_statistics_many([i["id"] for i in eligible_instances])
 
-        # Rule 1: Is the SKU eligible for consolidation?
-        if sku_name not in ELIGIBLE_SKUS_FOR_CONSOLIDATION:
-            print(f"  - Skipping instance {instance['name']} (SKU: {sku_name}) - not eligible.")
+    candidates = []
+    failed = []
+    for instance in eligible_instances:
+        statistics = all_statistics[instance["id"]]
+        if isinstance(statistics, Exception):
+            logger.warning("Skipping instance %s - could not fetch metrics. Error: %s", instance["name"], statistics,
+                           extra={"resource_id": instance["id"]})
+            failed.append(instance["id"])
             continue
 
         # Rule 2: Is the instance underutilized?
-        metrics = azure.get_apim_metrics(instance_id, METRIC_NAMES, METRICS_TIMEDELTA)
-        p95_capacity = metrics.get("Capacity")
+        p95_capacity = statistics.get("Capacity", METRICS_WINDOW_DAYS, METRICS_PERCENTILE)
 
         if p95_capacity is not None and p95_capacity < CAPACITY_THRESHOLD:
-            print(f"  - Found candidate: {instance['name']} (P95 Capacity: {p95_capacity}%)")
-            consolidation_candidates.append(instance)
+            logger.debug("Found candidate: %s (P95 Capacity: %s%%)", instance["name"], p95_capacity)
+            candidates.append((instance, p95_capacity))
         else:
-            print(f"  - Skipping instance {instance['name']} (P95 Capacity: {p95_capacity}%) - not underutilized.")
+            logger.debug("Skipping instance %s (P95 Capacity: %s%%) - not underutilized.", instance["name"], p95_capacity)
 
-    # Rule 3: Do we have enough candidates to consolidate?
-    if len(consolidation_candidates) >= 2:
-        print(f"Found {len(consolidation_candidates)} instances to consolidate. Generating recommendation.")
+    return candidates, failed
 
-        candidate_ids = [c["id"] for c in consolidation_candidates]
-        total_capacity_needed = sum(azure.get_apim_metrics(c["id"], METRIC_NAMES, METRICS_TIMEDELTA).get("Capacity", 0) for c in consolidation_candidates)
+def build_consolidation_recommendations(subscription_id: str, candidates: List[Tuple[Dict[str, Any], float]]) -> List[Dict[str, Any]]:
+    """
+    Packs a subscription's candidates onto right-sized targets (see
+    `consolidation_planner`) and builds one recommendation per target that
+    replaces two or more instances.
 
-        rec = {
-            "id": f"REC-CONSOLIDATE-{subscription_id}",
+    Returns:
+        The recommendations, possibly none.
+    """
+    recommendations = []
+    for group in consolidation_planner.pack_candidates(candidates):
+        # Rule 3: Does the target replace at least two instances?
+        if len(group.members) < 2:
+            continue
+
+        candidate_ids = [instance["id"] for instance, _ in group.members]
+        saving = pricing.get_price_index().saving(
+            [(instance.get("sku", {}).get("name"), instance.get("sku", {}).get("capacity") or 1) for instance, _ in group.members],
+            [(consolidation_planner.TARGET_SKU, group.units)], group.location)
+        location = group.location or "any"
+        # Named after its members, so the same target keeps its ID (and review
+        # status) across runs however the other targets are packed.
+        members_digest = incremental.fingerprint(sorted(candidate_id.lower() for candidate_id in candidate_ids))[:16]
+        logger.debug("Packed %d instances in %s onto a %d-unit target.", len(candidate_ids), subscription_id, group.units)
+        recommendations.append({
+            "id": f"REC-CONSOLIDATE-{subscription_id}-{location}-{group.virtual_network_type.lower()}-{members_digest}",
             "type": "INSTANCE_CONSOLIDATE",
             "resource_id": subscription_id, # Recommendation applies to the whole subscription
-            "details": f"Found {len(consolidation_candidates)} underutilized instances that can be consolidated into a single, right-sized instance.",
+            "details": f"Found {len(candidate_ids)} underutilized instances in {location} that fit on one "
+                       f"{consolidation_planner.TARGET_SKU} instance with {group.units} unit(s) at a projected "
+                       f"P95 Capacity of {group.projected_capacity:.2f}%.",
             "status": "pending_approval",
-            "source_node": "InstanceConsolidationAnalysisNode",
+            "source_node": SOURCE_NODE,
             "payload": {
                 "candidate_instances": candidate_ids,
-                "estimated_capacity_for_new_instance": f"{total_capacity_needed:.2f}%",
-                "migration_complexity_score": _calculate_complexity(len(consolidation_candidates))
+                "current_skus": {instance["id"]: instance.get("sku", {}).get("name") for instance, _ in group.members},
+                "target_location": group.location,
+                "virtual_network_type": group.virtual_network_type,
+                "recommended_sku": consolidation_planner.TARGET_SKU,
+                "recommended_units": group.units,
+                "estimated_capacity_for_new_instance": f"{group.projected_capacity:.2f}%",
+                "migration_complexity_score": _calculate_complexity(len(candidate_ids)),
+                "estimated_monthly_saving": saving
             }
-        }
-        return {"recommendations": current_recommendations + [rec]}
+        })
+
+    if not recommendations:
+        logger.debug("Fewer than 2 compatible consolidation candidates found in %s. No recommendation generated.", subscription_id)
+    return recommendations
+
+def _subscriptions_to_scan(state: Dict[str, Any]) -> List[str]:
+    """Returns the state's subscriptions, or those of the discovered resources, in order."""
+    if state.get("subscription_ids"):
+        return list(dict.fromkeys(state["subscription_ids"]))
+    return list(dict.fromkeys(resource_id.split('/')[2] for resource_id in state.get("resources", [])))
+
+def _chunk_subscriptions(subscription_ids: List[str], instances_by_subscription: Dict[str, List[Dict[str, Any]]],
+                         max_instances: int) -> Iterator[List[str]]:
+    """Groups whole subscriptions into chunks of about `max_instances` instances."""
+    chunk: List[str] = []
+    size = 0
+    for subscription_id in subscription_ids:
+        chunk.append(subscription_id)
+        size += len(instances_by_subscription[subscription_id])
+        if size >= max_instances:
+            yield chunk
+            chunk, size = [], 0
+    if chunk:
+        yield chunk
+
+def _iter_subscription_results(state: Dict[str, Any], subscription_ids: List[str],
+                               instances_by_subscription: Dict[str, List[Dict[str, Any]]]) -> Iterator[Tuple[str, Dict[str, float], List[Dict[str, Any]], bool]]:
+    """
+    Finds and packs the consolidation candidates of each subscription.
+
+    Metrics for every subscription's candidates are fetched in one batch. When
+    the run is checkpointed, the subscriptions are instead evaluated in chunks
+    that are saved as they finish, and subscriptions an earlier attempt of the
+    run finished are replayed from the checkpoint.
+
+    Yields:
+        (subscription ID, P95 Capacity of each candidate keyed by instance ID,
+        recommendations, whether every eligible instance's metrics were fetched).
+        Only complete subscriptions are checkpointed, so a resumed run retries the others.
+    """
+    progress = checkpoint.node_progress(state, SNAPSHOT_NAMESPACE)
+    chunks: Iterable[List[str]] = [subscription_ids]
+    if progress is not None:
+        for subscription_id, result in progress.completed(subscription_ids).items():
+            yield subscription_id, result.metrics, result.recommendations, True
+        chunks = _chunk_subscriptions(progress.pending(subscription_ids), instances_by_subscription,
+                                      checkpoint.chunk_size_from_state(state))
+
+    for chunk in chunks:
+        # Each candidate stays with the subscription it was listed under, whatever
+        # the casing of the subscription in its resource ID.
+        subscription_of = {instance["id"]: sid for sid in chunk for instance in instances_by_subscription[sid]}
+        candidates_by_subscription: Dict[str, List[Tuple[Dict[str, Any], float]]] = {sid: [] for sid in chunk}
+        candidates, failed = _find_candidates(instance for sid in chunk for instance in instances_by_subscription[sid])
+        for instance, p95_capacity in candidates:
+            candidates_by_subscription[subscription_of[instance["id"]]].append((instance, p95_capacity))
+        incomplete = {subscription_of[resource_id] for resource_id in failed}
+        results = [(sid, {instance["id"]: p95 for instance, p95 in candidates}, build_consolidation_recommendations(sid, candidates),
+                    sid not in incomplete)
+                   for sid, candidates in candidates_by_subscription.items()]
+        if progress is not None:
+            progress.record({sid: checkpoint.ChunkResult(capacity, recs) for sid, capacity, recs, complete in results if complete})
+        yield from results
+
+def instance_consolidation_analysis_node(state: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Analyzes all APIM instances of each subscription in the state to find
+    consolidation opportunities. Instances are only ever consolidated with
+    instances of the same subscription, region and VNet mode.
+    """
+    logger.info("NODE: INSTANCE CONSOLIDATION ANALYSIS (Live Logic)")
+
+    # Subscriptions come from the state or, failing that, from the resource IDs
+    # found by the discovery node.
+    subscription_ids = _subscriptions_to_scan(state)
+    if not subscription_ids:
+        logger.info("No resources found, cannot determine subscription ID.")
+        return {"recommendations": []}
+
+    logger.info("Scanning %d subscriptions for consolidation candidates...", len(subscription_ids))
+    # Served from the fleet inventory when discovery loaded one.
+    listings = azure.list_all_apim_instances_many(subscription_ids)
+    instances_by_subscription: Dict[str, List[Dict[str, Any]]] = {}
+    for subscription_id in subscription_ids:
+        instances = listings[subscription_id]
+        if isinstance(instances, Exception):
+            logger.warning("Could not list instances in subscription %s. Error: %s", subscription_id, instances,
+                           extra={"subscription_id": subscription_id})
+            continue
+        instances_by_subscription[subscription_id] = instances
+
+    # With a snapshot store, subscriptions whose instances have not changed
+    # reuse their previous recommendations without fetching any metrics.
+    plan = None
+    to_evaluate = list(instances_by_subscription)
+    new_recommendations: List[Dict[str, Any]] = []
+    if state.get("snapshot_path"):
+        store = incremental.open_snapshot_store(state["snapshot_path"])
+        fingerprints = {sid: incremental.fingerprint(sorted(incremental.fingerprint(i) for i in instances))
+                        for sid, instances in instances_by_subscription.items()}
+        plan = store.plan(SNAPSHOT_NAMESPACE, fingerprints, incremental.window_shift_from_state(state))
+        to_evaluate = plan.to_evaluate
+        new_recommendations.extend(plan.reused_recommendations())
+        logger.info("Re-evaluating %d subscriptions; %d unchanged subscriptions skipped.", len(to_evaluate), len(plan.reuse))
+
+    snapshots = {}
+    # Subscriptions whose every instance was evaluated; only their earlier recommendations can be superseded.
+    evaluated = list(plan.reuse) if plan is not None else []
+    evaluated_at = time.time()
+    for subscription_id, _, recs, complete in _iter_subscription_results(state, to_evaluate, instances_by_subscription):
+        new_recommendations.extend(recs)
+        if complete:
+            evaluated.append(subscription_id)
+        if plan is not None and complete and subscription_id in fingerprints:
+            snapshots[subscription_id] = incremental.Snapshot(fingerprints[subscription_id], evaluated_at, recs)
+
+    if plan is None:
+        return {"recommendations": new_recommendations, "evaluated": {SOURCE_NODE: evaluated}}
 
-    print("Fewer than 2 consolidation candidates found. No recommendation generated.")
-    return {"recommendations": current_recommendations}
+    store.put_many(SNAPSHOT_NAMESPACE, snapshots)
+    instance_counts = {sid: len(instances) for sid, instances in instances_by_subscription.items()}
+    return {
+        "recommendations": new_recommendations,
+        "reanalysis_report": {SNAPSHOT_NAMESPACE: plan.report(instance_counts)},
+        "evaluated": {SOURCE_NODE: evaluated},
+    }
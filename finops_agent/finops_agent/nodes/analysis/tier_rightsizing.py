@@ -1,83 +1,233 @@
-import datetime
-from typing import Dict, Any, List
+import logging
+import time
+from typing import Dict, Any, Iterator, List, Optional, Tuple
 
 # Use a relative import to access the sibling 'tools' module.
-from ...tools import azure
+from ...tools import azure, pricing
+from ... import checkpoint, incremental
+from .fleet_frame import FleetFrame, Rule, SKU_CODES, evaluate_rules
 
 # Define constants for the analysis
 UTILIZATION_THRESHOLD = 40.0  # P95 utilization percentage
-METRICS_TIMEDELTA = datetime.timedelta(days=90)
+METRICS_WINDOW_DAYS = 90  # Trailing window of the statistics the rules read
+METRICS_PERCENTILE = 95.0
 METRIC_NAMES = ["Capacity"]  # Focusing on the main capacity metric for now
+SNAPSHOT_NAMESPACE = "tier_rightsizing"
+SOURCE_NODE = "TierRightsizingAnalysisNode"
+
+logger = logging.getLogger(__name__)
+
+def _saving(frame: FleetFrame, row: int, target_sku: Optional[str], target_units: Optional[int] = None) -> Optional[float]:
+    """Monthly saving of moving the row's instance to `target_sku` at `target_units` (default: the same capacity)."""
+    capacity = int(frame.capacity[row])
+    return pricing.get_price_index().saving([(frame.sku_names[row], capacity)], [(target_sku, target_units or capacity)],
+                                            frame.locations[row])
+
+def _tier_change_recommendation(frame: FleetFrame, row: int) -> Dict[str, Any]:
+    # Whole percent, so the payload does not change with every run's metrics.
+    p95_capacity = round(float(frame.metric("Capacity")[row]))
+    resource_id = frame.resource_ids[row]
+    sku_name = frame.sku_names[row]
+    capacity = int(frame.capacity[row])
+    logger.debug("Generated TIER_CHANGE recommendation for %s", resource_id, extra={"resource_id": resource_id})
+    return {
+        "id": f"REC-TR-{frame.names[row]}",
+        "type": "TIER_CHANGE",
+        "resource_id": resource_id,
+        "details": f"Instance has a sustained 95th percentile Capacity of {p95_capacity}%, which is below the {UTILIZATION_THRESHOLD}% threshold. Recommending one capacity unit less in the same tier.",
+        "status": "pending_approval",
+        "source_node": SOURCE_NODE,
+        "payload": {
+            "current_sku": sku_name,
+            "current_units": capacity,
+            "p95_capacity": p95_capacity,
+            "recommended_units": capacity - 1,
+            "recommended_action": "Downgrade SKU to a smaller size (e.g., from P2 to P1).",
+            "estimated_monthly_saving": _saving(frame, row, sku_name, capacity - 1)
+        }
+    }
+
+def _premium_vnet_recommendation(frame: FleetFrame, row: int) -> Dict[str, Any]:
+    resource_id = frame.resource_ids[row]
+    logger.debug("Generated TIER_CHANGE (Premium to Standard_v2) recommendation for %s", resource_id,
+                 extra={"resource_id": resource_id})
+    return {
+        "id": f"REC-PREM-VNET-{frame.names[row]}",
+        "type": "TIER_CHANGE",
+        "resource_id": resource_id,
+        "details": "Instance is on the Premium tier with VNet enabled but is not multi-region. It is a candidate for downgrade to the Standard_v2 tier, which also supports VNet at a lower cost.",
+        "status": "pending_approval",
+        "source_node": SOURCE_NODE,
+        "payload": {
+            "current_sku": frame.sku_names[row],
+            "current_units": int(frame.capacity[row]),
+            "recommended_sku": "Standard_v2",
+            "estimated_monthly_saving": _saving(frame, row, "Standard_v2")
+        }
+    }
+
+# The rightsizing rules, evaluated in order over a whole batch at once. Each
+# rule is a mask over the frame's columns and a builder for matching rows.
+RULES: List[Rule] = [
+    # Rule 1: Sustained utilization below threshold, on more than the smallest size of the tier
+    Rule("underutilized", lambda f: (f.metric("Capacity") < UTILIZATION_THRESHOLD) & (f.capacity > 1),
+         _tier_change_recommendation),
+    # Rule 2: Premium instance with only VNet feature used
+    Rule("premium_vnet_single_region",
+         lambda f: (f.sku == SKU_CODES["Premium"]) & f.vnet & (f.region_count == 1),
+         _premium_vnet_recommendation),
+]
+
+def evaluate_frame(frame: FleetFrame) -> Dict[int, List[Dict[str, Any]]]:
+    """
+    Applies the rightsizing rules to every row of a frame in one pass.
+
+    Returns:
+        The recommendations generated for each row, keyed by row; rows without
+        any are absent.
+    """
+    return evaluate_rules(frame, RULES)
+
+def evaluate_resource(resource_id: str, properties: Dict[str, Any], metrics: Dict[str, float]) -> List[Dict[str, Any]]:
+    """
+    Applies the rightsizing rules to one resource's properties and metrics.
+
+    Returns:
+        The recommendations generated for the resource, possibly none.
+    """
+    return evaluate_frame(FleetFrame([resource_id], [properties], [metrics], METRIC_NAMES)).get(0, [])
+
+def iter_resource_results(resource_ids: List[str], known_properties: Optional[Dict[str, Dict[str, Any]]] = None) -> Iterator[Tuple[str, Dict[str, float], List[Dict[str, Any]]]]:
+    """
+    Fetches data for a batch of resources and applies the rightsizing rules.
+
+    Args:
+        resource_ids: The resources to analyze.
+        known_properties: Properties already at hand (e.g. from a discovery page),
+            keyed by resource ID. Only the remaining resources' properties are fetched.
+
+    Yields:
+        (resource ID, metrics, recommendations) for every resource that could be
+        analyzed. Resources whose data could not be fetched are reported and skipped.
+    """
+    known_properties = known_properties or {}
+
+    # 1. Get data from our tools, concurrently for the whole batch
+    all_properties = dict(known_properties)
+    missing = [rid for rid in resource_ids if rid not in known_properties]
+    if missing:
+        all_properties.update(azure.get_apim_properties_many(missing))
+    # Statistics of every metric and window are ingested once per resource and
+    # shared with the other nodes; this node reads the 90-day P95s.
+    all_statistics = azure.get_metric_statistics_many(resource_ids)
+    all_metrics = {rid: stats if isinstance(stats, Exception) else stats.metrics(METRICS_WINDOW_DAYS, METRICS_PERCENTILE)
+                   for rid, stats in all_statistics.items()}
+
+    # Rows whose data could not be fetched are reported and left out of the frame.
+    analyzed = []
+    for resource_id in resource_ids:
+        logger.debug("Analyzing resource: %s", resource_id, extra={"resource_id": resource_id})
+        # Batch calls return the exception in place of a failed resource's result.
+        error = next((r for r in (all_properties[resource_id], all_metrics[resource_id]) if isinstance(r, Exception)), None)
+        if error is not None:
+            logger.warning("Could not analyze resource %s. Error: %s", resource_id, error, extra={"resource_id": resource_id})
+            continue
+        analyzed.append(resource_id)
+
+    # 2. Apply the rules to the whole batch at once; the frame leaves out (and
+    # reports) rows whose values are malformed.
+    frame = FleetFrame(analyzed, [all_properties[rid] for rid in analyzed], [all_metrics[rid] for rid in analyzed], METRIC_NAMES)
+    matched = evaluate_frame(frame)
+    for row, resource_id in enumerate(frame.resource_ids):
+        yield resource_id, all_metrics[resource_id], matched.get(row, [])
+
+def analyze_resources(resource_ids: List[str], known_properties: Optional[Dict[str, Dict[str, Any]]] = None) -> List[Dict[str, Any]]:
+    """
+    Fetches data for a batch of resources and applies the rightsizing rules.
+    See `iter_resource_results` for the arguments.
+
+    Returns:
+        The recommendations generated for the batch.
+    """
+    return [rec for _, _, recs in iter_resource_results(resource_ids, known_properties) for rec in recs]
+
+def _iter_results_resumable(state: Dict[str, Any], resource_ids: List[str],
+                            known_properties: Optional[Dict[str, Dict[str, Any]]] = None) -> Iterator[Tuple[str, Dict[str, float], List[Dict[str, Any]]]]:
+    """
+    `iter_resource_results`, saved chunk by chunk when the run is checkpointed.
+    Resources an earlier attempt of the run finished are replayed from the
+    checkpoint without fetching their metrics again.
+    """
+    progress = checkpoint.node_progress(state, SNAPSHOT_NAMESPACE)
+    if progress is None:
+        yield from iter_resource_results(resource_ids, known_properties)
+        return
+
+    for resource_id, result in progress.completed(resource_ids).items():
+        yield resource_id, result.metrics, result.recommendations
+    pending = progress.pending(resource_ids)
+    if len(pending) < len(resource_ids):
+        logger.info("Resuming: %d resources already analyzed in this run, %d left.", len(resource_ids) - len(pending), len(pending))
+    chunk_size = checkpoint.chunk_size_from_state(state)
+    for start in range(0, len(pending), chunk_size):
+        chunk = pending[start:start + chunk_size]
+        results = list(iter_resource_results(chunk, known_properties and {rid: known_properties[rid] for rid in chunk}))
+        progress.record({rid: checkpoint.ChunkResult(metrics, recs) for rid, metrics, recs in results})
+        yield from results
+
+def _analyze_incrementally(state: Dict[str, Any], resource_ids: List[str]) -> Dict[str, Any]:
+    """
+    Re-evaluates only resources that are new, changed, or whose metrics window
+    has moved on, and reuses the stored recommendations of all the others.
+    """
+    store = incremental.open_snapshot_store(state["snapshot_path"])
+
+    # Properties are cheap (usually served from the inventory); metrics are not,
+    # so the properties decide which resources need their metrics fetched.
+    all_properties = azure.get_apim_properties_many(resource_ids)
+    fingerprints = {rid: incremental.fingerprint(props) for rid, props in all_properties.items()
+                    if not isinstance(props, Exception)}
+    plan = store.plan(SNAPSHOT_NAMESPACE, fingerprints, incremental.window_shift_from_state(state))
+    logger.info("Re-evaluating %d resources; %d unchanged resources skipped.", len(plan.to_evaluate), len(plan.reuse))
+
+    # Resources whose properties could not be fetched go through the normal path
+    # so their errors are reported.
+    to_evaluate = plan.to_evaluate + [rid for rid in resource_ids if rid not in fingerprints]
+    evaluated_at = time.time()
+    new_recommendations = plan.reused_recommendations()
+    snapshots = {}
+    known_properties = {rid: all_properties[rid] for rid in to_evaluate}
+    for resource_id, _, recommendations in _iter_results_resumable(state, to_evaluate, known_properties):
+        snapshots[resource_id] = incremental.Snapshot(fingerprints[resource_id], evaluated_at, recommendations)
+        new_recommendations.extend(recommendations)
+    store.put_many(SNAPSHOT_NAMESPACE, snapshots)
+
+    return {
+        "recommendations": new_recommendations,
+        "reanalysis_report": {SNAPSHOT_NAMESPACE: plan.report()},
+        # Reused snapshots still stand, as nothing they were based on changed.
+        "evaluated": {SOURCE_NODE: list(plan.reuse) + list(snapshots)},
+    }
 
 def tier_rightsizing_analysis_node(state: Dict[str, Any]) -> Dict[str, Any]:
     """
     Analyzes APIM instances for tier and SKU rightsizing opportunities by
     fetching properties and metrics and applying a set of rules.
     """
-    print("---NODE: TIER RIGHTSIZING ANALYSIS (Live Logic)---")
+    logger.info("NODE: TIER RIGHTSIZING ANALYSIS (Live Logic)")
 
-    current_recommendations: List[Dict[str, Any]] = state.get("recommendations", [])
     resources_to_analyze: List[str] = state.get("resources", [])
 
     if not resources_to_analyze:
-        print("No resources found to analyze.")
-        return {"recommendations": current_recommendations}
-
-    new_recommendations = []
-    for resource_id in resources_to_analyze:
-        print(f"Analyzing resource: {resource_id}")
-
-        try:
-            # 1. Get data from our tools
-            properties = azure.get_apim_properties(resource_id)
-            metrics = azure.get_apim_metrics(resource_id, METRIC_NAMES, METRICS_TIMEDELTA)
-
-            sku_name = properties.get("sku", {}).get("name")
-            p95_capacity = metrics.get("Capacity")
-            instance_name = properties.get("name", "unknown")
-
-            # 2. Implement analysis logic from Work Item 1
-
-            # Rule 1: Sustained utilization below threshold
-            if p95_capacity is not None and p95_capacity < UTILIZATION_THRESHOLD:
-                rec = {
-                    "id": f"REC-TR-{instance_name}",
-                    "type": "TIER_CHANGE",
-                    "resource_id": resource_id,
-                    "details": f"Instance has a sustained 95th percentile Capacity of {p95_capacity}%, which is below the {UTILIZATION_THRESHOLD}% threshold. Recommending a SKU downgrade.",
-                    "status": "pending_approval",
-                    "source_node": "TierRightsizingAnalysisNode",
-                    "payload": {
-                        "current_sku": sku_name,
-                        "p95_capacity": p95_capacity,
-                        "recommended_action": "Downgrade SKU to a smaller size (e.g., from P2 to P1)."
-                    }
-                }
-                new_recommendations.append(rec)
-                print(f"  [+] Generated TIER_CHANGE recommendation for {resource_id}")
-
-            # Rule 2: Premium instance with only VNet feature used
-            is_vnet_enabled = properties.get("properties", {}).get("virtualNetworkType") != "None"
-            is_multi_region = bool(properties.get("properties", {}).get("additionalLocations"))
-
-            if sku_name == "Premium" and is_vnet_enabled and not is_multi_region:
-                rec = {
-                    "id": f"REC-PREM-VNET-{instance_name}",
-                    "type": "TIER_CHANGE",
-                    "resource_id": resource_id,
-                    "details": "Instance is on the Premium tier with VNet enabled but is not multi-region. It is a candidate for downgrade to the Standard_v2 tier, which also supports VNet at a lower cost.",
-                    "status": "pending_approval",
-                    "source_node": "TierRightsizingAnalysisNode",
-                    "payload": {
-                        "current_sku": sku_name,
-                        "recommended_sku": "Standard_v2"
-                    }
-                }
-                new_recommendations.append(rec)
-                print(f"  [+] Generated TIER_CHANGE (Premium to Standard_v2) recommendation for {resource_id}")
-
-        except Exception as e:
-            print(f"Could not analyze resource {resource_id}. Error: {e}")
-
-    # Return the combined list of old and new recommendations
-    return {"recommendations": current_recommendations + new_recommendations}
+        logger.info("No resources found to analyze.")
+        return {"recommendations": []}
+
+    if state.get("snapshot_path"):
+        return _analyze_incrementally(state, resources_to_analyze)
+
+    # Return only the new recommendations; the graph's reducer merges them into the state.
+    evaluated, recommendations = [], []
+    for resource_id, _, recs in _iter_results_resumable(state, resources_to_analyze):
+        evaluated.append(resource_id)
+        recommendations.extend(recs)
+    return {"recommendations": recommendations, "evaluated": {SOURCE_NODE: evaluated}}
@@ -0,0 +1,260 @@
+import asyncio
+import contextlib
+import logging
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Callable, Dict, Iterable, List, Optional, Tuple
+
+from ...tools import azure
+from ... import recommendation_store
+from ...recommendation_store import Recommendation
+
+# Recommendation statuses the remediation workflow reads and writes. Only
+# 'approved' recommendations are applied; each one's final status is saved to
+# the recommendation store as soon as it is known, so a run that stops partway
+# through resumes with the recommendations that are still 'approved'.
+APPROVED = "approved"
+APPLIED = "applied"
+FAILED = "failed"
+STALE = "stale"  # The instance no longer has the SKU the recommendation was made for.
+
+# Outcomes of one recommendation in a run, and the status each one saves.
+OUTCOME_STATUS = {"applied": APPLIED, "already_applied": APPLIED, "stale": STALE, "failed": FAILED, "planned": None}
+
+DEFAULT_MAX_PARALLEL_CHANGES = 16
+# Tag put on the instances a consolidation retires, naming the instance that replaces them.
+CONSOLIDATED_INTO_TAG = "finops-consolidated-into"
+# Tiers that can keep an instance's virtual network, and its additional regions.
+VNET_SKUS = {"Developer", "Premium", "Premium_v2", "Standard_v2"}
+MULTI_REGION_SKUS = {"Premium"}
+
+logger = logging.getLogger(__name__)
+
+@dataclass
+class Change:
+    """One update to one instance."""
+    resource_id: str
+    sku_name: Optional[str] = None
+    capacity: Optional[int] = None  # None keeps the instance's current capacity.
+    tags: Dict[str, str] = field(default_factory=dict)
+    expected_sku: Optional[str] = None  # SKU the instance must still have (or already have the target).
+    expected_capacity: Optional[int] = None  # Capacity the instance must still have (or already have the target).
+
+def plan_changes(rec: Recommendation) -> List[Change]:
+    """
+    Translates a recommendation into instance updates.
+
+    Raises:
+        ValueError: If the recommendation's type cannot be applied automatically.
+    """
+    if rec.type == "TIER_CHANGE":
+        current = rec.payload.get("current_sku")
+        current_units = rec.payload.get("current_units")
+        if rec.payload.get("recommended_units") is not None:
+            # Fewer capacity units in the same tier.
+            return [Change(rec.resource_id, sku_name=current, capacity=rec.payload["recommended_units"],
+                           expected_sku=current, expected_capacity=current_units)]
+        if rec.payload.get("recommended_sku"):
+            return [Change(rec.resource_id, sku_name=rec.payload["recommended_sku"], expected_sku=current,
+                           expected_capacity=current_units)]
+        raise ValueError(f"{rec.id} names neither a target SKU nor a target capacity.")
+    if rec.type == "INSTANCE_CONSOLIDATE":
+        # The first candidate is scaled up to the packed target; the others are
+        # tagged for decommissioning once their APIs have moved, which is left
+        # to their owners.
+        host, *retired = rec.payload["candidate_instances"]
+        host_sku = (rec.payload.get("current_skus") or {}).get(host)
+        return [Change(host, sku_name=rec.payload["recommended_sku"], capacity=rec.payload["recommended_units"],
+                       expected_sku=host_sku)] + \
+               [Change(resource_id, tags={CONSOLIDATED_INTO_TAG: host}) for resource_id in retired]
+    raise ValueError(f"Recommendations of type {rec.type} cannot be applied automatically.")
+
+def check_target_tier(instance: Dict[str, Any], sku_name: str) -> None:
+    """
+    Checks that moving the instance to `sku_name` keeps its virtual network and regions.
+
+    Raises:
+        ValueError: If the target tier supports neither.
+    """
+    properties = instance.get("properties") or {}
+    if properties.get("virtualNetworkType", "None") != "None" and sku_name not in VNET_SKUS:
+        raise ValueError(f"{sku_name} cannot keep the virtual network of {instance.get('id')}.")
+    if properties.get("additionalLocations") and sku_name not in MULTI_REGION_SKUS:
+        raise ValueError(f"{sku_name} cannot keep the additional regions of {instance.get('id')}.")
+
+def resource_group_of(resource_id: str) -> Tuple[str, str]:
+    """Returns (subscription ID, resource group) of a resource ID, lower-cased."""
+    parts = resource_id.lower().split("/")
+    return parts[2], parts[4]
+
+def batch_by_resource_group(recommendations: Iterable[Recommendation]) -> Dict[str, List[Recommendation]]:
+    """
+    Groups recommendations by the subscription and resource group of the first
+    instance they change, as '<subscription>/<resource group>'. Recommendations
+    that cannot be planned are grouped under their own resource ID.
+    """
+    batches: Dict[str, List[Recommendation]] = {}
+    for rec in recommendations:
+        try:
+            key = "/".join(resource_group_of(plan_changes(rec)[0].resource_id))
+        except (ValueError, KeyError, IndexError):
+            key = rec.resource_id
+        batches.setdefault(key, []).append(rec)
+    return batches
+
+class ResourceLocks:
+    """
+    Per-instance locks on the client's event loop. A recommendation holds the
+    locks of every instance it changes, taken in sorted order so that two
+    recommendations sharing instances never deadlock.
+    """
+
+    def __init__(self):
+        self._locks: Dict[str, asyncio.Lock] = {}
+
+    @contextlib.asynccontextmanager
+    async def hold(self, resource_ids: Iterable[str]) -> AsyncIterator[None]:
+        locks = [self._locks.setdefault(key, asyncio.Lock()) for key in sorted({rid.lower() for rid in resource_ids})]
+        held: List[asyncio.Lock] = []
+        try:
+            for lock in locks:
+                await lock.acquire()
+                held.append(lock)
+            yield
+        finally:
+            for lock in reversed(held):
+                lock.release()
+
+def _patch_for(change: Change, current: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Returns the merge patch that brings the instance to the change, or None if it is already there."""
+    patch: Dict[str, Any] = {}
+    sku = current.get("sku", {})
+    capacity = change.capacity if change.capacity is not None else sku.get("capacity", 1)
+    if change.sku_name is not None and (sku.get("name") != change.sku_name or sku.get("capacity") != capacity):
+        patch["sku"] = {"name": change.sku_name, "capacity": capacity}
+    tags = current.get("tags") or {}
+    if any(tags.get(key) != value for key, value in change.tags.items()):
+        patch["tags"] = change.tags
+    return patch or None
+
+async def _apply_one(rec: Recommendation, dry_run: bool, poll_seconds: float, timeout_seconds: float) -> Dict[str, Any]:
+    """Applies one recommendation's changes in order. Runs on the client's loop under the recommendation's locks."""
+    changes = plan_changes(rec)
+    patches: List[Tuple[str, Dict[str, Any]]] = []
+    # Every instance is checked before any is changed, so a recommendation is applied whole or not at all.
+    for change in changes:
+        current = await azure.aread_apim_instance(change.resource_id)
+        if current is None:
+            return {"outcome": "stale", "detail": f"{change.resource_id} no longer exists."}
+        current_sku = current.get("sku", {}).get("name")
+        if change.expected_sku is not None and current_sku not in (change.expected_sku, change.sku_name):
+            return {"outcome": "stale", "detail": f"{change.resource_id} is now {current_sku}, not {change.expected_sku}."}
+        current_capacity = current.get("sku", {}).get("capacity")
+        if change.expected_capacity is not None and current_capacity not in (change.expected_capacity, change.capacity):
+            return {"outcome": "stale",
+                    "detail": f"{change.resource_id} now has {current_capacity} units, not {change.expected_capacity}."}
+        if change.sku_name is not None and change.sku_name != current_sku:
+            check_target_tier(current, change.sku_name)
+        patch = _patch_for(change, current)
+        if patch is not None:
+            patches.append((change.resource_id, patch))
+
+    if not patches:
+        return {"outcome": "already_applied", "detail": "Every instance already has the recommended configuration."}
+    if not dry_run:
+        for resource_id, patch in patches:
+            await azure.aupdate_apim_instance(resource_id, patch, poll_seconds, timeout_seconds)
+    return {
+        "outcome": "planned" if dry_run else "applied",
+        "detail": f"{len(patches)} instance update(s){' would be' if dry_run else ''} applied.",
+        "changes": [{"resource_id": resource_id, "patch": patch} for resource_id, patch in patches],
+    }
+
+def apply_recommendations(batches: Dict[str, List[Recommendation]], dry_run: bool = False,
+                          max_parallel: int = DEFAULT_MAX_PARALLEL_CHANGES,
+                          poll_seconds: float = azure.DEFAULT_UPDATE_POLL_SECONDS,
+                          update_timeout_seconds: float = azure.DEFAULT_UPDATE_TIMEOUT_SECONDS,
+                          on_result: Optional[Callable[[Recommendation, Dict[str, Any]], None]] = None) -> List[Dict[str, Any]]:
+    """
+    Applies batches of recommendations with at most `max_parallel` of them in
+    progress at once, and never two that change the same instance.
+
+    Args:
+        batches: Recommendations grouped by resource group (see `batch_by_resource_group`).
+        dry_run: If True, only read each instance and report the updates that would be sent.
+        max_parallel: Maximum number of recommendations applied at once.
+        poll_seconds: Interval at which a long-running update is polled.
+        update_timeout_seconds: How long an update may stay in progress before
+            its recommendation is marked 'failed'.
+        on_result: Called with each recommendation and its result as soon as it
+            is done, e.g. to save its progress.
+
+    Returns:
+        One result per recommendation, in batch order: its ID, batch, outcome
+        ('applied', 'already_applied', 'planned', 'stale' or 'failed'), a detail
+        message and, unless skipped, the updates sent.
+    """
+    async def apply_all() -> List[Dict[str, Any]]:
+        semaphore = asyncio.Semaphore(max_parallel)
+        locks = ResourceLocks()
+
+        async def apply(batch: str, rec: Recommendation) -> Dict[str, Any]:
+            try:
+                resource_ids = [change.resource_id for change in plan_changes(rec)]
+                # Locks first, so a recommendation waiting for an instance does not hold a slot.
+                async with locks.hold(resource_ids), semaphore:
+                    result = await _apply_one(rec, dry_run, poll_seconds, update_timeout_seconds)
+            except Exception as e:
+                logger.warning("Could not apply %s. Error: %s", rec.id, e, extra={"resource_id": rec.resource_id})
+                result = {"outcome": "failed", "detail": str(e)}
+            result = {"id": rec.id, "batch": batch, **result}
+            if on_result is not None:
+                on_result(rec, result)
+            return result
+
+        return await asyncio.gather(*(apply(batch, rec) for batch, recs in batches.items() for rec in recs))
+
+    return azure.get_client().run(apply_all())
+
+# --- Graph Nodes ---
+
+def plan_remediation_node(state: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Reads the approved recommendations from the recommendation store and
+    groups them by subscription and resource group.
+    """
+    logger.info("NODE: PLAN REMEDIATION")
+    store = recommendation_store.open_recommendation_store(state["recommendation_store_path"])
+    batches = batch_by_resource_group(store.find(status=APPROVED))
+    logger.info("Found %d approved recommendations in %d resource groups.",
+                sum(len(recs) for recs in batches.values()), len(batches))
+    return {"remediation_batches": {batch: [rec.id for rec in recs] for batch, recs in batches.items()}}
+
+def apply_remediation_node(state: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Applies the planned recommendations and saves each one's new status to the
+    store as it finishes. In a dry run nothing is changed or saved.
+    """
+    logger.info("NODE: APPLY REMEDIATION")
+    dry_run = bool(state.get("dry_run"))
+    store = recommendation_store.open_recommendation_store(state["recommendation_store_path"])
+    # Recommendations whose status changed since planning (e.g. by an earlier attempt) are left out.
+    batches = {batch: [rec for rec in map(store.get, ids) if rec is not None and rec.status == APPROVED]
+               for batch, ids in state.get("remediation_batches", {}).items()}
+
+    def save(rec: Recommendation, result: Dict[str, Any]) -> None:
+        status = OUTCOME_STATUS[result["outcome"]]
+        if status is not None and not dry_run:
+            store.set_status(rec.id, status)
+
+    results = apply_recommendations(batches, dry_run=dry_run,
+                                    max_parallel=state.get("max_parallel_changes") or DEFAULT_MAX_PARALLEL_CHANGES,
+                                    poll_seconds=state.get("update_poll_seconds", azure.DEFAULT_UPDATE_POLL_SECONDS),
+                                    update_timeout_seconds=state.get("update_timeout_seconds",
+                                                                     azure.DEFAULT_UPDATE_TIMEOUT_SECONDS),
+                                    on_result=save)
+    report: Dict[str, int] = {}
+    for result in results:
+        report[result["outcome"]] = report.get(result["outcome"], 0) + 1
+    logger.info("Remediation%s: %s.", " (dry run)" if dry_run else "",
+                ", ".join(f"{count} {outcome}" for outcome, count in sorted(report.items())) or "nothing to apply")
+    return {"remediation_results": results, "remediation_report": report}
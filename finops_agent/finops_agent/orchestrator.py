@@ -1,92 +1,333 @@
-from typing import TypedDict, List, Dict, Any
+import heapq
+import logging
+import threading
+from typing import Annotated, Callable, TypedDict, List, Dict, Any, Optional, Tuple
 from langgraph.graph import StateGraph, END
 
 # --- State Definition ---
+def merge_recommendations(existing: Optional[List[Dict[str, Any]]], new: Optional[List[Dict[str, Any]]]) -> List[Dict[str, Any]]:
+    """
+    Reducer for `AgentState.recommendations`.
+
+    Analysis nodes return only the recommendations they generated; this merges
+    them into the accumulated list. A recommendation whose ID is already present
+    replaces the earlier one in place, so re-running a node never duplicates it.
+    """
+    existing = existing or []
+    if not new:
+        return existing
+    merged = {rec["id"]: rec for rec in existing}
+    for rec in new:
+        merged[rec["id"]] = rec
+    return list(merged.values())
+
+def merge_reports(existing: Optional[Dict[str, Any]], new: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """Reducer for per-node report dicts: each node writes under its own key."""
+    return {**(existing or {}), **(new or {})}
+
 class AgentState(TypedDict):
     """
     Represents the state of our FinOps agent's workflow.
     """
+    subscription_ids: List[str]  # Optional. Subscriptions to inventory; without it, placeholder resources are used.
     resources: List[str]  # List of Azure resource IDs to be analyzed.
-    recommendations: List[Dict[str, Any]]  # List of recommendations generated by analysis nodes.
+    recommendations: Annotated[List[Dict[str, Any]], merge_recommendations]  # Merged from every analysis node.
     git_log_dir: str  # Path to the local directory for the Git audit log.
+    snapshot_path: str  # Optional. SQLite file of per-resource snapshots; enables incremental re-analysis.
+    metrics_window_shift_seconds: float  # Optional. Re-evaluate unchanged resources after this long.
+    reanalysis_report: Annotated[Dict[str, Dict[str, int]], merge_reports]  # Per-node counts of evaluated and skipped resources.
+    evaluated: Annotated[Dict[str, List[str]], merge_reports]  # Per source node, the resources (or subscriptions) it evaluated successfully.
+    telemetry_dir: str  # Optional. Directory to write the run's telemetry to (JSON and Prometheus text).
+    telemetry_baseline: Dict[str, Any]  # Telemetry recorded before the run; set by 'discover' when `telemetry_dir` is set.
+    run_id: str  # Optional. ID of a checkpointed run; set by `run_analysis`.
+    checkpoint_path: str  # Optional. SQLite file of the run's checkpoints; enables resume.
+    checkpoint_chunk_size: int  # Optional. Resources analyzed between two in-node checkpoints.
+    recommendation_store_path: str  # Optional. SQLite file of the indexed recommendations kept across runs.
+    top_k: int  # Optional. Number of recommendations ranked by estimated saving at the end of the run.
+    top_recommendations: List[Dict[str, Any]]  # The `top_k` recommendations with the largest estimated monthly saving.
+    export_path: str  # Optional. JSONL file the recommendations are streamed to ('.gz' to compress, '-' for stdout).
+    export_columnar_path: str  # Optional. Columnar file the recommendations are streamed to (see `export`).
+    shared_inventory: bool  # Optional. Merge the discovered inventory into the process's instead of replacing it.
+
+class RemediationState(TypedDict):
+    """
+    Represents the state of the remediation workflow.
+    """
+    recommendation_store_path: str  # SQLite file of the recommendation store; its 'approved' recommendations are applied.
+    dry_run: bool  # Optional. Only report the updates that would be sent.
+    max_parallel_changes: int  # Optional. Recommendations applied at once.
+    update_poll_seconds: float  # Optional. Polling interval of long-running instance updates.
+    update_timeout_seconds: float  # Optional. Time an instance update may take before it counts as failed.
+    remediation_batches: Dict[str, List[str]]  # Approved recommendation IDs by '<subscription>/<resource group>'.
+    remediation_results: List[Dict[str, Any]]  # Outcome of every recommendation applied.
+    remediation_report: Dict[str, int]  # Number of recommendations per outcome.
 
 # --- Node Imports ---
 # Use a relative import to refer to a module within the same package.
 from .nodes.analysis.tier_rightsizing import tier_rightsizing_analysis_node
 from .nodes.analysis.instance_consolidation import instance_consolidation_analysis_node
+from .nodes.execution.remediation import apply_remediation_node, plan_remediation_node
+from .tools import azure
+from . import audit_log
+from . import checkpoint
+from . import export
+from . import recommendation_store
+from . import telemetry
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TOP_K = 10  # Recommendations ranked by estimated saving in 'finalize'.
+
+# Analysis nodes, keyed by graph node name. They are independent of each other:
+# each reads the discovered resources and returns only its own recommendations.
+ANALYSIS_NODES: Dict[str, Callable[[AgentState], Dict[str, Any]]] = {
+    "tier_rightsizing_analysis": tier_rightsizing_analysis_node,
+    "instance_consolidation_analysis": instance_consolidation_analysis_node,
+}
 
 
 # --- Core Workflow Functions ---
 
-def discovery_node(state: AgentState) -> AgentState:
+def discovery_node(state: AgentState) -> Dict[str, Any]:
     """
-    Simulates the discovery of resources in an Azure subscription.
+    Discovers the APIM instances to analyze.
+
+    If the state names subscriptions, one bulk inventory query indexes every APIM
+    instance across them; the analysis nodes then read properties from that
+    index instead of making a call per resource. Otherwise a placeholder list
+    of resources is used.
     """
-    print("---NODE: DISCOVERY---")
-    print("Finding resources to analyze...")
-    # In a real implementation, this would use the Azure SDK to scan a subscription.
-    discovered_resources = [
-        "/subscriptions/xxxxxxxx-xxxx-xxxx-xxxx-xxxxxxxxxxxx/resourceGroups/rg-prod-1/providers/Microsoft.ApiManagement/service/apim-prod-eus",
-        "/subscriptions/xxxxxxxx-xxxx-xxxx-xxxx-xxxxxxxxxxxx/resourceGroups/rg-dev-1/providers/Microsoft.ApiManagement/service/apim-dev-wus"
-    ]
-    state["resources"] = discovered_resources
-    print(f"Found {len(discovered_resources)} resources.")
-    # The initial state should define the 'recommendations' list,
-    # but this ensures it exists for robustness.
-    if "recommendations" not in state:
-        state["recommendations"] = []
-    return state
+    logger.info("NODE: DISCOVERY")
+    # The process-wide registry outlives the run; 'finalize' exports only what
+    # was recorded after this point.
+    baseline = telemetry.export_json() if state.get("telemetry_dir") else None
+    logger.info("Finding resources to analyze...")
+    subscription_ids = state.get("subscription_ids")
+    if subscription_ids:
+        inventory = azure.load_inventory(subscription_ids, merge=bool(state.get("shared_inventory")))
+        discovered_resources = inventory.resource_ids()
+        logger.info("Inventoried %d subscriptions.", len(subscription_ids))
+    else:
+        # Without subscriptions to scan, fall back to placeholder resources and
+        # drop any inventory left over from an earlier run.
+        azure.clear_inventory()
+        discovered_resources = [
+            "/subscriptions/xxxxxxxx-xxxx-xxxx-xxxx-xxxxxxxxxxxx/resourceGroups/rg-prod-1/providers/Microsoft.ApiManagement/service/apim-prod-eus",
+            "/subscriptions/xxxxxxxx-xxxx-xxxx-xxxx-xxxxxxxxxxxx/resourceGroups/rg-dev-1/providers/Microsoft.ApiManagement/service/apim-dev-wus"
+        ]
+    logger.info("Found %d resources.", len(discovered_resources))
+    # Only the changed keys are returned; the 'recommendations' reducer treats a
+    # missing initial list as empty.
+    update: Dict[str, Any] = {"resources": discovered_resources}
+    if baseline is not None:
+        update["telemetry_baseline"] = baseline
+    return update
+
+def _subscription_of(resource_id: str) -> str:
+    """Returns the lower-cased subscription of a resource ID, or the ID itself if it is a bare subscription."""
+    parts = resource_id.split("/")
+    return (parts[2] if len(parts) > 2 and parts[1].lower() == "subscriptions" else resource_id).lower()
 
-def finalize_node(state: AgentState) -> AgentState:
+def _saving_rank(rec: Dict[str, Any]) -> Tuple[bool, float]:
+    """Ranking key by estimated monthly saving; recommendations without an estimate rank below any with one, even a negative one."""
+    saving = rec.get("payload", {}).get("estimated_monthly_saving")
+    return saving is not None, saving or 0.0
+
+def finalize_node(state: AgentState) -> Dict[str, Any]:
     """
     Simulates the final aggregation and review step.
     """
-    print("---NODE: FINALIZE---")
-    print("Aggregating and finalizing all recommendations...")
-    print(f"Total recommendations generated: {len(state['recommendations'])}")
-    # In a real implementation, this might filter recommendations or set a final status.
-    return state
+    logger.info("NODE: FINALIZE")
+    logger.info("Aggregating and finalizing all recommendations...")
+    logger.info("Total recommendations generated: %d", len(state.get("recommendations", [])))
+    for node_name, report in state.get("reanalysis_report", {}).items():
+        logger.info("Incremental re-analysis (%s): %d resources skipped, %d evaluated.",
+                    node_name, report["skipped_resources"], report["evaluated_resources"])
+    # Commit everything the analysis nodes queued for the audit log.
+    log = audit_log.get_audit_log(state.get("git_log_dir"))
+    if log is not None:
+        if not log.flush(audit_log.DEFAULT_FLUSH_TIMEOUT_SECONDS):
+            logger.warning("Audit log did not commit within %.0f seconds; it keeps committing in the background.",
+                           audit_log.DEFAULT_FLUSH_TIMEOUT_SECONDS)
+        logger.info("Audit log: %d records in %d commits to %s.", log.stats.records_written, log.stats.commits, log.repo_dir)
+    if state.get("recommendation_store_path"):
+        # Recommendations seen in earlier runs are updated in place and keep
+        # their review status while their decision is unchanged. Earlier ones
+        # this run no longer produced are superseded, but only where the run
+        # disproved them: their node evaluated the resource (or subscription)
+        # successfully, or the resource is gone from a subscription discovery
+        # listed. A resource whose metrics could not be fetched keeps its own.
+        store = recommendation_store.open_recommendation_store(state["recommendation_store_path"])
+        recommendations = state.get("recommendations", [])
+        changed = store.upsert_many(recommendations, keep_status=True)
+        evaluated = {node: {key.lower() for key in keys} for node, keys in state.get("evaluated", {}).items()}
+        discovered = {resource_id.lower() for resource_id in state.get("resources", [])}
+        listed = {_subscription_of(sid) for sid in state.get("subscription_ids") or []} or \
+                 {_subscription_of(resource_id) for resource_id in discovered}
+
+        def disproved(rec: recommendation_store.Recommendation) -> bool:
+            key = rec.resource_id.lower()
+            if key in evaluated.get(rec.source_node, ()):
+                return True
+            vanished = key != _subscription_of(key) and key not in discovered
+            return vanished and _subscription_of(key) in listed
+
+        superseded = store.supersede_missing((rec["id"] for rec in recommendations), disproved)
+        logger.info("Recommendation store: %d new or updated, %d superseded, %d in total.", changed, superseded, len(store))
+    stats = azure.cache_stats()
+    logger.info("Azure response cache: %d round trips saved, %d misses.", stats["round_trips_saved"], stats["misses"])
+    if state.get("telemetry_dir"):
+        # Covers every node and Azure call of the run up to this point.
+        json_path, prom_path = telemetry.write_exports(state["telemetry_dir"], state.get("telemetry_baseline"))
+        logger.info("Telemetry written to %s and %s.", json_path, prom_path)
+    if state.get("checkpoint_path") and state.get("run_id"):
+        # The analysis nodes' results are in the graph checkpoint by now.
+        checkpoint.open_progress_store(state["checkpoint_path"]).discard(state["run_id"])
+    # A heap keeps the ranking O(n log k).
+    top = heapq.nlargest(state.get("top_k") or DEFAULT_TOP_K, state.get("recommendations", []), key=_saving_rank)
+    for rank, rec in enumerate(top, start=1):
+        logger.info("Top saving #%d: %s saves an estimated %s per month.", rank, rec["id"],
+                    rec.get("payload", {}).get("estimated_monthly_saving"))
+    return {"top_recommendations": top}
+
+def export_node(state: AgentState) -> Dict[str, Any]:
+    """
+    Streams the recommendations to the export files, if any are set.
+
+    Only the writing is bounded here: the recommendations come from the graph
+    state, which holds all of them. For constant memory end to end, export the
+    generator of `streaming.stream_fleet_recommendations` instead (the CLI's
+    `analyze --stream`).
+    """
+    if state.get("export_path") or state.get("export_columnar_path"):
+        logger.info("NODE: EXPORT")
+        export.export_recommendations(state.get("recommendations", []), state.get("export_path"),
+                                      state.get("export_columnar_path"))
+    return {}
 
 # --- Graph Definition ---
 
-def build_graph():
+def build_graph(analysis_nodes: Optional[Dict[str, Callable[[AgentState], Dict[str, Any]]]] = None, parallel: bool = True,
+                checkpointer: Any = None):
     """
     Builds the LangGraph orchestrator.
+
+    Args:
+        analysis_nodes: Analysis nodes keyed by node name. Defaults to `ANALYSIS_NODES`.
+        parallel: If True, every analysis node branches from 'discover' in the same
+            step and they join at 'finalize' (fan-out/fan-in). If False, they run
+            one after the other in the order given.
+        checkpointer: A LangGraph checkpointer (see `checkpoint.open_checkpointer`)
+            that saves the state after every node.
     """
+    if analysis_nodes is None:
+        analysis_nodes = ANALYSIS_NODES
+
     workflow = StateGraph(AgentState)
 
-    # Add nodes to the graph
-    workflow.add_node("discover", discovery_node)
-    workflow.add_node("tier_rightsizing_analysis", tier_rightsizing_analysis_node)
-    workflow.add_node("instance_consolidation_analysis", instance_consolidation_analysis_node)
-    workflow.add_node("finalize", finalize_node)
+    # Add nodes to the graph. Every node is timed (see `telemetry.timed_node`).
+    workflow.add_node("discover", telemetry.timed_node("discover", discovery_node))
+    for name, node in analysis_nodes.items():
+        # Recommendations are queued for the Git audit log as each node returns.
+        workflow.add_node(name, telemetry.timed_node(name, audit_log.audited(name, node)))
+    workflow.add_node("finalize", telemetry.timed_node("finalize", finalize_node))
+    workflow.add_node("export", telemetry.timed_node("export", export_node))
 
-    # Define the workflow edges to run sequentially for now
     workflow.set_entry_point("discover")
-    workflow.add_edge("discover", "tier_rightsizing_analysis")
-    workflow.add_edge("tier_rightsizing_analysis", "instance_consolidation_analysis")
-    workflow.add_edge("instance_consolidation_analysis", "finalize")
-    workflow.add_edge("finalize", END)
+    names = list(analysis_nodes)
+    if not names:
+        workflow.add_edge("discover", "finalize")
+    elif parallel:
+        for name in names:
+            workflow.add_edge("discover", name)
+        # A multi-source edge waits for every branch before running 'finalize'.
+        workflow.add_edge(names, "finalize")
+    else:
+        workflow.add_edge("discover", names[0])
+        for previous, following in zip(names, names[1:]):
+            workflow.add_edge(previous, following)
+        workflow.add_edge(names[-1], "finalize")
+    workflow.add_edge("finalize", "export")
+    workflow.add_edge("export", END)
+
+    return workflow.compile(checkpointer=checkpointer)
+
+# Graphs of the default analysis nodes compiled in this process, by checkpointer (None for none).
+_compiled_graphs: Dict[Any, Any] = {}
+_compiled_graphs_lock = threading.Lock()
+
+def get_graph(checkpointer: Any = None):
+    """
+    Returns the analysis graph of `ANALYSIS_NODES`, compiled once per process
+    (and checkpointer) and reused by every later run.
+    """
+    with _compiled_graphs_lock:
+        graph = _compiled_graphs.get(checkpointer)
+        if graph is None:
+            graph = _compiled_graphs[checkpointer] = build_graph(checkpointer=checkpointer)
+        return graph
 
-    return workflow.compile()
+def build_remediation_graph(checkpointer: Any = None):
+    """
+    Builds the remediation workflow: 'plan' reads the approved recommendations
+    from the store and groups them by resource group, 'apply' applies them.
+
+    Args:
+        checkpointer: A LangGraph checkpointer that saves the state after every node.
+    """
+    workflow = StateGraph(RemediationState)
+    workflow.add_node("plan", telemetry.timed_node("plan_remediation", plan_remediation_node))
+    workflow.add_node("apply", telemetry.timed_node("apply_remediation", apply_remediation_node))
+    workflow.set_entry_point("plan")
+    workflow.add_edge("plan", "apply")
+    workflow.add_edge("apply", END)
+    return workflow.compile(checkpointer=checkpointer)
+
+def run_analysis(initial_state: Dict[str, Any], run_id: Optional[str] = None, checkpoint_path: Optional[str] = None,
+                 analysis_nodes: Optional[Dict[str, Callable[[AgentState], Dict[str, Any]]]] = None) -> Dict[str, Any]:
+    """
+    Runs the analysis workflow, checkpointed if a checkpoint path is given.
+
+    With a checkpoint, the state is saved after every node and the analysis
+    nodes save their progress after every chunk of resources. Calling this
+    again with the ID of a run that stopped partway through resumes it: nodes
+    that finished are not run again, and resources a node had finished are not
+    re-queried. The initial state is ignored on resume. A finished run's final
+    state is returned as is.
+
+    Args:
+        initial_state: The state to start a new run from.
+        run_id: The run to start or resume. Required with `checkpoint_path`.
+        checkpoint_path: SQLite file holding the checkpoints.
+        analysis_nodes: Analysis nodes keyed by node name. Defaults to `ANALYSIS_NODES`.
+
+    Returns:
+        The final state.
+    """
+    def graph(checkpointer: Any = None):
+        return get_graph(checkpointer) if analysis_nodes is None else build_graph(analysis_nodes, checkpointer=checkpointer)
+
+    if not checkpoint_path:
+        return graph().invoke(initial_state)
+    if not run_id:
+        raise ValueError("run_id is required to checkpoint a run")
+
+    app = graph(checkpoint.open_checkpointer(checkpoint_path))
+    config = checkpoint.run_config(run_id)
+    saved = app.get_state(config)
+    if saved.next:
+        logger.info("Resuming run %s at %s.", run_id, ", ".join(saved.next))
+        return app.invoke(None, config)
+    if saved.values:
+        logger.info("Run %s already finished.", run_id)
+        return saved.values
+    return app.invoke({**initial_state, "run_id": run_id, "checkpoint_path": checkpoint_path}, config)
 
 # --- Main Execution Block ---
 
 if __name__ == "__main__":
-    # This allows running the orchestrator directly for testing.
-    app = build_graph()
-
-    # Define the initial state for the workflow.
-    initial_state = {
-        "resources": [],
-        "recommendations": [],
-        "git_log_dir": "/tmp/finops_git_audit_log"
-    }
-
-    print("---STARTING FINOPS ANALYSIS WORKFLOW---")
-    final_state = app.invoke(initial_state)
-    print("---FINOPS ANALYSIS WORKFLOW COMPLETE---")
-
-    print("\n---FINAL STATE---")
-    import json
-    print(json.dumps(final_state, indent=2))
+    # Kept for compatibility; `python -m finops_agent.finops_agent analyze` is the entry point.
+    import sys
+    from .cli import main
+
+    sys.exit(main(["analyze", *sys.argv[1:]]))
@@ -0,0 +1,266 @@
+import json
+import sqlite3
+import threading
+from dataclasses import dataclass, field, replace
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+# Indexed store of recommendations across runs. Records are kept in memory by
+# ID with secondary indexes on the fields the remediation workflow filters by,
+# so finding one recommendation, or all of a resource's or all approved ones,
+# never scans the whole set. With a path, every change is written through to
+# SQLite and the store is reloaded from it on open.
+
+# Fields with a secondary index, usable as `find` criteria.
+INDEXED_FIELDS = ("resource_id", "type", "status", "source_node")
+PENDING_APPROVAL = "pending_approval"
+APPROVED = "approved"
+# An earlier run's recommendation that the latest run no longer produced; it can no longer be approved or applied.
+SUPERSEDED = "superseded"
+# Statuses of recommendations still awaiting review or remediation.
+OPEN_STATUSES = (PENDING_APPROVAL, APPROVED)
+# Payload fields a review decides on: the instance's SKU, the target and the
+# instances it changes. The others (utilization, estimated saving...) move with
+# every run's metrics.
+DECISION_FIELDS = ("current_sku", "current_units", "recommended_sku", "recommended_units", "candidate_instances")
+
+@dataclass(slots=True)
+class Recommendation:
+    """One recommendation, in the shape the analysis nodes emit as a dict."""
+    id: str
+    type: str
+    resource_id: str
+    details: str = ""
+    status: str = PENDING_APPROVAL
+    source_node: str = ""
+    payload: Dict[str, Any] = field(default_factory=dict)
+
+    @classmethod
+    def from_dict(cls, rec: Dict[str, Any]) -> "Recommendation":
+        return cls(rec["id"], rec["type"], rec["resource_id"], rec.get("details", ""),
+                   rec.get("status", PENDING_APPROVAL), rec.get("source_node", ""), rec.get("payload") or {})
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "id": self.id,
+            "type": self.type,
+            "resource_id": self.resource_id,
+            "details": self.details,
+            "status": self.status,
+            "source_node": self.source_node,
+            "payload": self.payload,
+        }
+
+    def decision(self) -> Tuple[Any, ...]:
+        """What a review of this recommendation approved: its type, resource and `DECISION_FIELDS`."""
+        return (self.type, self.resource_id, *(self.payload.get(name) for name in DECISION_FIELDS))
+
+RecommendationLike = Union[Recommendation, Dict[str, Any]]
+
+class RecommendationStore:
+    """
+    Recommendations by ID with secondary indexes on `INDEXED_FIELDS`, safe to
+    share between threads.
+
+    Each index maps a field value to the IDs having it, in insertion order, so
+    lookups cost the size of the result rather than of the store.
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        """
+        Args:
+            path: SQLite file the store persists to, or None to keep it in memory only.
+        """
+        self.path = path
+        self._lock = threading.Lock()
+        self._records: Dict[str, Recommendation] = {}
+        self._indexes: Dict[str, Dict[str, Dict[str, None]]] = {name: {} for name in INDEXED_FIELDS}
+        self._db: Optional[sqlite3.Connection] = None
+        if path is not None:
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute("CREATE TABLE IF NOT EXISTS recommendations (id TEXT PRIMARY KEY, record TEXT NOT NULL)")
+            self._db.commit()
+            for (record,) in self._db.execute("SELECT record FROM recommendations ORDER BY rowid"):
+                self._insert(Recommendation.from_dict(json.loads(record)))
+
+    # --- Index maintenance (callers hold the lock) ---
+
+    def _insert(self, rec: Recommendation) -> None:
+        self._records[rec.id] = rec
+        for name in INDEXED_FIELDS:
+            self._indexes[name].setdefault(getattr(rec, name), {})[rec.id] = None
+
+    def _unindex(self, rec: Recommendation) -> None:
+        for name in INDEXED_FIELDS:
+            ids = self._indexes[name][getattr(rec, name)]
+            del ids[rec.id]
+            if not ids:
+                del self._indexes[name][getattr(rec, name)]
+
+    def _persist(self, changed: Iterable[Recommendation] = (), removed: Iterable[str] = ()) -> None:
+        if self._db is None:
+            return
+        with self._db:
+            self._db.executemany("INSERT OR REPLACE INTO recommendations VALUES (?, ?)",
+                                 [(rec.id, json.dumps(rec.to_dict())) for rec in changed])
+            self._db.executemany("DELETE FROM recommendations WHERE id = ?", [(rec_id,) for rec_id in removed])
+
+    # --- Reads ---
+
+    def __len__(self) -> int:
+        return len(self._records)
+
+    def __contains__(self, recommendation_id: str) -> bool:
+        return recommendation_id in self._records
+
+    def __iter__(self) -> Iterator[Recommendation]:
+        with self._lock:
+            return iter(list(self._records.values()))
+
+    def get(self, recommendation_id: str) -> Optional[Recommendation]:
+        """Returns the recommendation with this ID, or None."""
+        return self._records.get(recommendation_id)
+
+    def find(self, **criteria: str) -> List[Recommendation]:
+        """
+        Returns the recommendations matching every criterion, e.g.
+        `find(status="approved", type="TIER_CHANGE")`, in insertion order.
+
+        Raises:
+            ValueError: If a criterion names a field without an index.
+        """
+        unknown = set(criteria) - set(INDEXED_FIELDS)
+        if unknown:
+            raise ValueError(f"no index on {', '.join(sorted(unknown))}; indexed fields are {', '.join(INDEXED_FIELDS)}")
+        with self._lock:
+            if not criteria:
+                return list(self._records.values())
+            candidates = [self._indexes[name].get(value, {}) for name, value in criteria.items()]
+            smallest = min(candidates, key=len)
+            return [self._records[rec_id] for rec_id in smallest if all(rec_id in ids for ids in candidates)]
+
+    def to_list(self) -> List[Dict[str, Any]]:
+        """Returns every recommendation as a dict, in insertion order."""
+        with self._lock:
+            return [rec.to_dict() for rec in self._records.values()]
+
+    @classmethod
+    def from_list(cls, recommendations: Iterable[RecommendationLike]) -> "RecommendationStore":
+        """Builds an in-memory store from recommendations, e.g. the output of `to_list`."""
+        store = cls()
+        store.upsert_many(recommendations)
+        return store
+
+    # --- Writes ---
+
+    def upsert(self, recommendation: RecommendationLike, keep_status: bool = False) -> bool:
+        """Inserts or replaces one recommendation. See `upsert_many`."""
+        return self.upsert_many([recommendation], keep_status) == 1
+
+    def upsert_many(self, recommendations: Iterable[RecommendationLike], keep_status: bool = False) -> int:
+        """
+        Inserts recommendations, replacing any with the same ID, in one transaction.
+
+        Args:
+            recommendations: `Recommendation`s or dicts in the nodes' shape.
+            keep_status: If True, a recommendation already in the store keeps
+                its status when its decision (see `Recommendation.decision`) is
+                unchanged, so re-running the analysis does not reset one that
+                was approved or rejected in the meantime. One whose decision
+                changed, or that was superseded, goes back to pending approval:
+                the earlier review was of something else.
+
+        Returns:
+            The number of recommendations that were new or differed from the stored ones.
+        """
+        changed: Dict[str, Recommendation] = {}
+        with self._lock:
+            for rec in recommendations:
+                if isinstance(rec, dict):
+                    rec = Recommendation.from_dict(rec)
+                previous = self._records.get(rec.id)
+                if previous is not None:
+                    if keep_status:
+                        unchanged = rec.decision() == previous.decision()
+                        rec.status = previous.status if unchanged and previous.status != SUPERSEDED else PENDING_APPROVAL
+                    if rec == previous:
+                        continue
+                    self._unindex(previous)
+                self._insert(rec)
+                changed[rec.id] = rec
+            self._persist(changed=changed.values())
+        return len(changed)
+
+    def supersede_missing(self, produced_ids: Iterable[str], in_scope: Callable[[Recommendation], bool]) -> int:
+        """
+        Marks open recommendations (see `OPEN_STATUSES`) that a run covered but
+        no longer produced as superseded, so an approval given to an earlier
+        run's result cannot be applied.
+
+        Args:
+            produced_ids: IDs of every recommendation the run produced.
+            in_scope: True for the recommendations the run covered, e.g. those
+                of the resources it evaluated successfully.
+
+        Returns:
+            The number of recommendations superseded.
+        """
+        produced = set(produced_ids)
+        with self._lock:
+            stale = [self._records[rec_id] for status in OPEN_STATUSES for rec_id in self._indexes["status"].get(status, {})
+                     if rec_id not in produced and in_scope(self._records[rec_id])]
+            superseded = [replace(previous, status=SUPERSEDED) for previous in stale]
+            for previous, rec in zip(stale, superseded):
+                self._unindex(previous)
+                self._insert(rec)
+            self._persist(changed=superseded)
+        return len(superseded)
+
+    def set_status(self, recommendation_id: str, status: str) -> Recommendation:
+        """
+        Moves a recommendation to a new status (e.g. 'approved') and returns it.
+
+        Raises:
+            KeyError: If there is no recommendation with this ID.
+        """
+        with self._lock:
+            previous = self._records[recommendation_id]
+            updated = Recommendation(previous.id, previous.type, previous.resource_id, previous.details,
+                                     status, previous.source_node, previous.payload)
+            self._unindex(previous)
+            self._insert(updated)
+            self._persist(changed=[updated])
+        return updated
+
+    def remove(self, recommendation_id: str) -> bool:
+        """Removes a recommendation. Returns False if there was none with this ID."""
+        with self._lock:
+            previous = self._records.pop(recommendation_id, None)
+            if previous is None:
+                return False
+            self._unindex(previous)
+            self._persist(removed=[recommendation_id])
+        return True
+
+    def close(self) -> None:
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+_stores: Dict[str, RecommendationStore] = {}
+_stores_lock = threading.Lock()
+
+def open_recommendation_store(path: str) -> RecommendationStore:
+    """Returns the process-wide store for `path`, so every caller shares one copy."""
+    with _stores_lock:
+        store = _stores.get(path)
+        if store is None:
+            store = _stores[path] = RecommendationStore(path)
+        return store
+
+def close_recommendation_stores() -> None:
+    """Closes every store opened with `open_recommendation_store`."""
+    with _stores_lock:
+        for store in _stores.values():
+            store.close()
+        _stores.clear()
@@ -0,0 +1,288 @@
+import asyncio
+import itertools
+import json
+import logging
+import socket
+import socketserver
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from . import orchestrator, telemetry
+from .tools import azure, pricing
+
+# Long-running service mode. One process keeps the compiled analysis graph, the
+# pooled Azure client (and its credential) and the properties/metrics caches
+# warm, and runs analysis jobs on a pool of worker threads. Jobs are submitted
+# in-process with `AnalysisService.submit`, or as JSON lines over a local TCP
+# socket (see `serve` and `request`).
+#
+# Every job gets its own graph state and result, and a job that fails does not
+# affect the others. Discovery merges each job's subscriptions into the shared
+# inventory rather than replacing it, so concurrent jobs keep reading from it;
+# a subscription is dropped from it again once no running job covers it.
+# Each job reports its queue wait (submitted to started) and service latency
+# (started to finished); both are also recorded in `telemetry`.
+
+DEFAULT_WORKERS = 4
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+# Finished jobs kept for status requests; older ones are forgotten.
+DEFAULT_MAX_FINISHED_JOBS = 1000
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+logger = logging.getLogger(__name__)
+
+@dataclass
+class Job:
+    """One analysis job and, once it has finished, its result."""
+    id: str
+    subscription_ids: List[str]
+    top_k: Optional[int] = None
+    status: str = QUEUED
+    submitted_at: float = field(default_factory=time.monotonic)
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    recommendations: List[Dict[str, Any]] = field(default_factory=list)
+    top_recommendations: List[Dict[str, Any]] = field(default_factory=list)
+    error: Optional[str] = None
+    _finished: threading.Event = field(default_factory=threading.Event, repr=False)
+
+    @property
+    def queue_wait_seconds(self) -> Optional[float]:
+        """Time from submission until a worker started the job, or None while it is queued."""
+        return None if self.started_at is None else self.started_at - self.submitted_at
+
+    @property
+    def service_seconds(self) -> Optional[float]:
+        """Time the worker spent on the job, or None until it has finished."""
+        return None if self.finished_at is None or self.started_at is None else self.finished_at - self.started_at
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """Blocks until the job has finished. Returns False on timeout."""
+        return self._finished.wait(timeout)
+
+    def to_dict(self, include_recommendations: bool = True) -> Dict[str, Any]:
+        result: Dict[str, Any] = {
+            "job_id": self.id,
+            "subscription_ids": self.subscription_ids,
+            "status": self.status,
+            "queue_wait_seconds": self.queue_wait_seconds,
+            "service_seconds": self.service_seconds,
+            "error": self.error,
+        }
+        if include_recommendations:
+            result["recommendations"] = self.recommendations
+            result["top_recommendations"] = self.top_recommendations
+        return result
+
+class AnalysisService:
+    """Runs analysis jobs on a warm worker pool. Use as a context manager, or call `start` and `close`."""
+
+    def __init__(self, max_workers: int = DEFAULT_WORKERS, recommendation_store_path: Optional[str] = None,
+                 max_finished_jobs: int = DEFAULT_MAX_FINISHED_JOBS, git_log_dir: str = ""):
+        """
+        Args:
+            max_workers: Jobs run at once; the others wait in the queue.
+            recommendation_store_path: Recommendation store every job's results are upserted into, or None.
+            max_finished_jobs: Finished jobs kept for status requests.
+            git_log_dir: Git audit log every job's recommendations are written to, or '' for none.
+        """
+        if max_workers < 1:
+            raise ValueError("max_workers must be at least 1")
+        self.max_workers = max_workers
+        self.recommendation_store_path = recommendation_store_path
+        self.max_finished_jobs = max_finished_jobs
+        self.git_log_dir = git_log_dir
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._jobs: "OrderedDict[str, Job]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+        # Running jobs per subscription in the shared inventory.
+        self._inventory_users: Dict[str, int] = {}
+
+    def start(self) -> "AnalysisService":
+        """Warms up the shared state and starts the worker pool."""
+        if self._executor is None:
+            orchestrator.get_graph()
+            # Starts the client's loop and opens its pooled HTTP connection.
+            azure.get_client().run(asyncio.sleep(0))
+            pricing.get_price_index()
+            self._executor = ThreadPoolExecutor(self.max_workers, thread_name_prefix="finops-job")
+            logger.info("Analysis service started with %d workers.", self.max_workers)
+        return self
+
+    def close(self, wait: bool = True) -> None:
+        """Stops accepting jobs. With `wait`, returns once the queued and running jobs have finished."""
+        executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=wait)
+
+    def __enter__(self) -> "AnalysisService":
+        return self.start()
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def submit(self, subscription_ids: List[str], top_k: Optional[int] = None) -> Job:
+        """
+        Queues an analysis of the given subscriptions.
+
+        Raises:
+            ValueError: If no subscription is given.
+            RuntimeError: If the service is not running.
+        """
+        if not subscription_ids:
+            raise ValueError("A job needs at least one subscription.")
+        executor = self._executor
+        if executor is None:
+            raise RuntimeError("The service is not running.")
+        job = Job(f"job-{next(self._ids)}", list(subscription_ids), top_k)
+        with self._lock:
+            self._jobs[job.id] = job
+        executor.submit(self._run, job)
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        """Returns a job, or None if it is unknown or was forgotten."""
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def stats(self) -> Dict[str, int]:
+        """Returns the number of jobs per status, and the number of workers."""
+        with self._lock:
+            counts = {status: 0 for status in (QUEUED, RUNNING, DONE, FAILED)}
+            for job in self._jobs.values():
+                counts[job.status] += 1
+        return {**counts, "workers": self.max_workers}
+
+    def _run(self, job: Job) -> None:
+        job.started_at = time.monotonic()
+        job.status = RUNNING
+        initial_state: Dict[str, Any] = {
+            "subscription_ids": job.subscription_ids,
+            "resources": [],
+            "recommendations": [],
+            "git_log_dir": self.git_log_dir,
+            "shared_inventory": True,
+        }
+        if job.top_k:
+            initial_state["top_k"] = job.top_k
+        if self.recommendation_store_path:
+            initial_state["recommendation_store_path"] = self.recommendation_store_path
+        subscription_ids = {subscription_id.lower() for subscription_id in job.subscription_ids}
+        with self._lock:
+            for subscription_id in subscription_ids:
+                self._inventory_users[subscription_id] = self._inventory_users.get(subscription_id, 0) + 1
+        try:
+            final_state = orchestrator.get_graph().invoke(initial_state)
+            job.recommendations = final_state.get("recommendations", [])
+            job.top_recommendations = final_state.get("top_recommendations", [])
+            job.status = DONE
+        except Exception as e:
+            logger.warning("Job %s failed. Error: %s", job.id, e, extra={"job_id": job.id})
+            job.error = str(e)
+            job.status = FAILED
+        finally:
+            self._release_inventory(subscription_ids)
+        job.finished_at = time.monotonic()
+        telemetry.record_service_job(job.status, job.queue_wait_seconds, job.service_seconds)
+        logger.info("Job %s %s: waited %.3fs, ran %.3fs, %d recommendations.", job.id, job.status,
+                    job.queue_wait_seconds, job.service_seconds, len(job.recommendations), extra={"job_id": job.id})
+        self._forget_finished()
+        job._finished.set()
+
+    def _release_inventory(self, subscription_ids: Set[str]) -> None:
+        """Drops the job's subscriptions that no other running job covers from the shared inventory."""
+        with self._lock:
+            unused = []
+            for subscription_id in subscription_ids:
+                self._inventory_users[subscription_id] -= 1
+                if not self._inventory_users[subscription_id]:
+                    del self._inventory_users[subscription_id]
+                    unused.append(subscription_id)
+            # Under the lock, so a job starting on the same subscriptions counts itself first.
+            if unused:
+                azure.release_inventory(unused)
+
+    def _forget_finished(self) -> None:
+        with self._lock:
+            finished = [job_id for job_id, job in self._jobs.items() if job.status in (DONE, FAILED)]
+            for job_id in finished[:max(0, len(finished) - self.max_finished_jobs)]:
+                del self._jobs[job_id]
+
+    def handle_request(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Handles one request of the socket API:
+        - {"op": "submit", "subscription_ids": [...], "top_k": k, "wait": true, "timeout": s}
+          queues a job and, with `wait`, answers once it has finished;
+        - {"op": "status", "job_id": id, "recommendations": false} answers with a job's status;
+        - {"op": "stats"} answers with the number of jobs per status.
+
+        Raises:
+            ValueError: If the request is malformed or names an unknown job.
+        """
+        op = request.get("op")
+        if op == "submit":
+            job = self.submit(request.get("subscription_ids") or [], request.get("top_k"))
+            if request.get("wait"):
+                job.wait(request.get("timeout"))
+            return job.to_dict(include_recommendations=job.status in (DONE, FAILED))
+        if op == "status":
+            job = self.get(str(request.get("job_id")))
+            if job is None:
+                raise ValueError(f"Unknown job {request.get('job_id')}.")
+            return job.to_dict(include_recommendations=bool(request.get("recommendations", True)))
+        if op == "stats":
+            return self.stats()
+        raise ValueError(f"Unknown op {op!r}.")
+
+# --- Socket API ---
+
+class _RequestHandler(socketserver.StreamRequestHandler):
+    """Answers each JSON line of a connection with one JSON line."""
+
+    def handle(self) -> None:
+        for line in self.rfile:
+            if not line.strip():
+                continue
+            try:
+                response = self.server.service.handle_request(json.loads(line))
+            except Exception as e:
+                response = {"error": str(e)}
+            self.wfile.write(json.dumps(response).encode("utf-8") + b"\n")
+            self.wfile.flush()
+
+class ServiceServer(socketserver.ThreadingTCPServer):
+    """Serves an `AnalysisService` over TCP; each connection has its own thread."""
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, service: AnalysisService, address: Tuple[str, int]):
+        super().__init__(address, _RequestHandler)
+        self.service = service
+
+def serve(service: AnalysisService, host: str = DEFAULT_HOST, port: int = DEFAULT_PORT) -> ServiceServer:
+    """
+    Starts the service and returns a server bound to (host, port); call its
+    `serve_forever` (port 0 picks a free port, see `server_address`).
+    """
+    service.start()
+    server = ServiceServer(service, (host, port))
+    logger.info("Analysis service listening on %s:%d.", *server.server_address[:2])
+    return server
+
+def request(payload: Dict[str, Any], host: str = DEFAULT_HOST, port: int = DEFAULT_PORT,
+            timeout: Optional[float] = None) -> Dict[str, Any]:
+    """Sends one request to a running service and returns its response."""
+    with socket.create_connection((host, port), timeout=timeout) as connection:
+        connection.sendall(json.dumps(payload).encode("utf-8") + b"\n")
+        with connection.makefile("rb") as responses:
+            return json.loads(responses.readline())
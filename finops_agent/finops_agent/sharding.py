@@ -0,0 +1,111 @@
+import logging
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+from . import audit_log
+from .orchestrator import get_graph
+from .tools import azure
+
+# A tenant-wide run splits its subscriptions into shards and runs the analysis
+# graph for each shard in a separate process, so it scales with the number of
+# cores. Each worker process has its own Azure client, cache and inventory;
+# the client is configured from the endpoint and credential factory the parent
+# passes, since a credential object cannot be sent to another process. The
+# workers do not write the Git audit log: several processes committing to one
+# repository would collide, so the parent records the merged results.
+
+logger = logging.getLogger(__name__)
+
+# Subscriptions per shard when the caller does not choose. Small enough to
+# balance work across workers, large enough to keep the batch calls full.
+DEFAULT_SHARD_SIZE = 25
+
+def shard_subscriptions(subscription_ids: Iterable[str], shard_size: int = DEFAULT_SHARD_SIZE) -> List[List[str]]:
+    """
+    Splits subscriptions into shards of at most `shard_size`.
+
+    Subscriptions are de-duplicated (case-insensitively) and sorted first, so the
+    same input always produces the same shards.
+    """
+    if shard_size < 1:
+        raise ValueError("shard_size must be at least 1")
+    unique = sorted({sid.lower(): sid for sid in subscription_ids}.values(), key=str.lower)
+    return [unique[start:start + shard_size] for start in range(0, len(unique), shard_size)]
+
+def _configure_worker(arm_endpoint: Optional[str], credential_factory: Optional[Callable[[], Any]]) -> None:
+    """Sets up a worker process's Azure client. Runs once in each worker process."""
+    azure.configure_client(arm_endpoint, credential=credential_factory() if credential_factory is not None else None)
+
+def analyze_shard(subscription_ids: List[str]) -> List[Dict[str, Any]]:
+    """
+    Runs the analysis graph over one shard of subscriptions. Runs in a worker process.
+
+    Returns:
+        The shard's recommendations.
+    """
+    # Compiled once per worker process and reused for every shard it runs.
+    final_state = get_graph().invoke({
+        "subscription_ids": subscription_ids,
+        "resources": [],
+        "recommendations": [],
+        # The parent writes the audit log once the shards are merged.
+        "git_log_dir": "",
+    })
+    return final_state["recommendations"]
+
+def run_sharded_analysis(subscription_ids: Iterable[str], shard_size: int = DEFAULT_SHARD_SIZE,
+                         max_workers: Optional[int] = None, arm_endpoint: Optional[str] = None,
+                         credential_factory: Optional[Callable[[], Any]] = None,
+                         git_log_dir: str = "") -> List[Dict[str, Any]]:
+    """
+    Analyzes many subscriptions on a process pool and merges the results.
+
+    Args:
+        subscription_ids: The subscriptions to analyze.
+        shard_size: Maximum number of subscriptions per shard.
+        max_workers: Number of worker processes. Defaults to the number of CPUs,
+            capped at the number of shards.
+        arm_endpoint: ARM endpoint the workers call. Defaults to `FINOPS_ARM_ENDPOINT`.
+        credential_factory: Picklable callable (e.g. `azure.identity.DefaultAzureCredential`)
+            each worker calls once to create its credential. None sends no Authorization header.
+        git_log_dir: Git audit log the merged recommendations are written to, or '' for none.
+
+    Returns:
+        The recommendations of every shard, merged by ID and sorted by ID, so the
+        result does not depend on which worker finished first.
+    """
+    shards = shard_subscriptions(subscription_ids, shard_size)
+    if not shards:
+        return []
+    workers = min(max_workers or os.cpu_count() or 1, len(shards))
+    if arm_endpoint is None:
+        arm_endpoint = os.environ.get(azure.ARM_ENDPOINT_ENV)
+
+    # 'spawn' rather than 'fork': the parent may already be running the Azure
+    # client's event loop thread, which a forked child would inherit half-copied.
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"),
+                             initializer=_configure_worker, initargs=(arm_endpoint, credential_factory)) as pool:
+        shard_results = list(pool.map(analyze_shard, shards))
+
+    # One pass over every shard's results; a later shard wins on duplicate IDs,
+    # as `merge_recommendations` would.
+    merged = {rec["id"]: rec for recommendations in shard_results for rec in recommendations}
+    recommendations = sorted(merged.values(), key=lambda rec: rec["id"])
+    _record_audit_log(git_log_dir, recommendations)
+    return recommendations
+
+def _record_audit_log(git_log_dir: str, recommendations: List[Dict[str, Any]]) -> None:
+    """Writes the merged recommendations to the Git audit log, under the node that produced each."""
+    log = audit_log.get_audit_log(git_log_dir)
+    if log is None:
+        return
+    by_node: Dict[str, List[Dict[str, Any]]] = {}
+    for rec in recommendations:
+        by_node.setdefault(rec.get("source_node", ""), []).append(rec)
+    for node_name, recs in by_node.items():
+        audit_log.record_recommendations(git_log_dir, node_name, recs)
+    if not log.flush(audit_log.DEFAULT_FLUSH_TIMEOUT_SECONDS):
+        logger.warning("Audit log did not commit within %.0f seconds; it keeps committing in the background.",
+                       audit_log.DEFAULT_FLUSH_TIMEOUT_SECONDS)
@@ -0,0 +1,67 @@
+from itertools import chain, islice
+from typing import Any, Dict, Iterable, Iterator, List, Tuple, TypeVar
+
+from .nodes.analysis.tier_rightsizing import analyze_resources
+from .nodes.analysis.instance_consolidation import find_consolidation_candidates, build_consolidation_recommendations
+from .tools import azure
+from .tools.resource_graph import MAX_PAGE_SIZE
+
+T = TypeVar("T")
+
+# Streaming analysis for fleets too large to hold in `AgentState`. Instead of
+# discovering the whole fleet and handing it to the graph, discovery yields
+# pages of instances and the analysis runs on fixed-size chunks as they arrive,
+# emitting each chunk's recommendations before the next chunk is read. Peak
+# memory is bounded by the chunk and page sizes, not the fleet size.
+
+DEFAULT_CHUNK_SIZE = 500
+
+def chunked(items: Iterable[T], size: int) -> Iterator[List[T]]:
+    """Splits an iterable into lists of at most `size` items without materializing it."""
+    if size < 1:
+        raise ValueError("size must be at least 1")
+    iterator = iter(items)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+def stream_recommendations(pages: Iterable[List[Dict[str, Any]]], chunk_size: int = DEFAULT_CHUNK_SIZE) -> Iterator[Dict[str, Any]]:
+    """
+    Runs the analysis over pages of instances and yields recommendations as they are produced.
+
+    Tier rightsizing recommendations are yielded per chunk. Consolidation needs
+    every candidate of a subscription, so only the candidates (a small fraction
+    of the fleet) are kept, and consolidation recommendations are yielded once
+    the stream is exhausted.
+
+    Args:
+        pages: Pages of APIM resource objects, e.g. from `azure.iter_apim_instance_pages`.
+        chunk_size: Number of instances analyzed together.
+    """
+    candidates_by_subscription: Dict[str, List[Tuple[Dict[str, Any], float]]] = {}
+
+    for chunk in chunked(chain.from_iterable(pages), chunk_size):
+        # The pages already carry each instance's properties; only metrics are fetched.
+        known_properties = {instance["id"]: instance for instance in chunk}
+        yield from analyze_resources(list(known_properties), known_properties=known_properties)
+
+        for instance, p95_capacity in find_consolidation_candidates(chunk):
+            subscription_id = instance["id"].split('/')[2]
+            candidates_by_subscription.setdefault(subscription_id, []).append((instance, p95_capacity))
+
+    for subscription_id, candidates in candidates_by_subscription.items():
+        yield from build_consolidation_recommendations(subscription_id, candidates)
+
+def stream_fleet_recommendations(subscription_ids: Iterable[str], chunk_size: int = DEFAULT_CHUNK_SIZE,
+                                 page_size: int = MAX_PAGE_SIZE) -> Iterator[Dict[str, Any]]:
+    """
+    Discovers the subscriptions' APIM instances page by page and streams their recommendations.
+
+    Args:
+        subscription_ids: The subscriptions to scan.
+        chunk_size: Number of instances analyzed together.
+        page_size: Instances per discovery page.
+    """
+    return stream_recommendations(azure.iter_apim_instance_pages(subscription_ids, page_size), chunk_size)
@@ -0,0 +1,332 @@
+import asyncio
+import bisect
+import functools
+import json
+import logging
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+# Run-level instrumentation: call counters, error counters and latency
+# histograms for every graph node and Azure tool function, exportable as JSON
+# or in the Prometheus text format. Recording is a dict update and a bisect
+# under a lock, cheap enough to leave on for every call.
+
+# Upper bounds, in seconds, of the latency histogram buckets.
+LATENCY_BUCKETS: Tuple[float, ...] = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+Labels = Tuple[Tuple[str, str], ...]
+
+class Histogram:
+    """Cumulative-bucket histogram in the Prometheus style."""
+
+    def __init__(self, buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # The last slot is +Inf.
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def cumulative(self) -> List[Tuple[str, int]]:
+        """Returns (upper bound, cumulative count) pairs, ending with '+Inf'."""
+        bounds = [repr(b) for b in self.buckets] + ["+Inf"]
+        total, pairs = 0, []
+        for bound, count in zip(bounds, self.counts):
+            total += count
+            pairs.append((bound, total))
+        return pairs
+
+class MetricsRegistry:
+    """Thread-safe store of counters and histograms, keyed by metric name and labels."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters: Dict[str, Dict[Labels, float]] = {}
+        self._histograms: Dict[str, Dict[Labels, Histogram]] = {}
+        self._help: Dict[str, str] = {}
+
+    def describe(self, name: str, help_text: str) -> None:
+        self._help[name] = help_text
+
+    def inc(self, name: str, labels: Labels = (), value: float = 1.0) -> None:
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[labels] = series.get(labels, 0.0) + value
+
+    def observe(self, name: str, value: float, labels: Labels = ()) -> None:
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            histogram = series.get(labels)
+            if histogram is None:
+                histogram = series[labels] = Histogram()
+            histogram.observe(value)
+
+    def counter_value(self, name: str, labels: Labels = ()) -> float:
+        with self._lock:
+            return self._counters.get(name, {}).get(labels, 0.0)
+
+    def histogram(self, name: str, labels: Labels = ()) -> Optional[Histogram]:
+        with self._lock:
+            return self._histograms.get(name, {}).get(labels)
+
+    def reset(self) -> None:
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+    def since(self, baseline: Dict[str, Any]) -> "MetricsRegistry":
+        """
+        Returns a new registry holding only what was recorded after `baseline`,
+        an earlier `to_dict` export of this registry. Series unchanged since
+        then are left out.
+        """
+        old_counters = {(name, tuple(series["labels"].items())): series["value"]
+                        for name, entries in baseline.get("counters", {}).items() for series in entries}
+        old_histograms = {(name, tuple(series["labels"].items())): series
+                          for name, entries in baseline.get("histograms", {}).items() for series in entries}
+        delta = MetricsRegistry()
+        delta._help = dict(self._help)
+        with self._lock:
+            for name, series in self._counters.items():
+                for labels, value in series.items():
+                    value -= old_counters.get((name, labels), 0.0)
+                    if value:
+                        delta._counters.setdefault(name, {})[labels] = value
+            for name, series in self._histograms.items():
+                for labels, histogram in series.items():
+                    old = old_histograms.get((name, labels))
+                    if old is not None and old["count"] == histogram.count:
+                        continue
+                    difference = Histogram(histogram.buckets)
+                    difference.counts = list(histogram.counts)
+                    if old is not None:
+                        # The export holds cumulative counts; undo that to subtract per bucket.
+                        previous = 0
+                        for i, cumulative in enumerate(old["buckets"].values()):
+                            difference.counts[i] -= cumulative - previous
+                            previous = cumulative
+                        difference.count = histogram.count - old["count"]
+                        difference.sum = histogram.sum - old["sum"]
+                    else:
+                        difference.count, difference.sum = histogram.count, histogram.sum
+                    delta._histograms.setdefault(name, {})[labels] = difference
+        return delta
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Exports every series as plain data, ready for `json.dumps`."""
+        with self._lock:
+            return {
+                "counters": {
+                    name: [{"labels": dict(labels), "value": value} for labels, value in sorted(series.items())]
+                    for name, series in sorted(self._counters.items())
+                },
+                "histograms": {
+                    name: [{"labels": dict(labels), "count": h.count, "sum": h.sum,
+                            "buckets": dict(h.cumulative())} for labels, h in sorted(series.items())]
+                    for name, series in sorted(self._histograms.items())
+                },
+            }
+
+    def to_prometheus(self) -> str:
+        """Exports every series in the Prometheus text exposition format."""
+        def fmt(labels: Labels, extra: Labels = ()) -> str:
+            pairs = list(labels) + list(extra)
+            if not pairs:
+                return ""
+            return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+        lines: List[str] = []
+        with self._lock:
+            for name, series in sorted(self._counters.items()):
+                if name in self._help:
+                    lines.append(f"# HELP {name} {self._help[name]}")
+                lines.append(f"# TYPE {name} counter")
+                for labels, value in sorted(series.items()):
+                    lines.append(f"{name}{fmt(labels)} {value:g}")
+            for name, series in sorted(self._histograms.items()):
+                if name in self._help:
+                    lines.append(f"# HELP {name} {self._help[name]}")
+                lines.append(f"# TYPE {name} histogram")
+                for labels, h in sorted(series.items()):
+                    for bound, count in h.cumulative():
+                        lines.append(f"{name}_bucket{fmt(labels, (('le', bound),))} {count}")
+                    lines.append(f"{name}_sum{fmt(labels)} {h.sum:.6f}")
+                    lines.append(f"{name}_count{fmt(labels)} {h.count}")
+        return "\n".join(lines) + "\n"
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+REGISTRY = MetricsRegistry()
+
+NODE_RUNS = "finops_node_runs_total"
+NODE_ERRORS = "finops_node_errors_total"
+NODE_DURATION = "finops_node_duration_seconds"
+AZURE_CALLS = "finops_azure_calls_total"
+AZURE_ERRORS = "finops_azure_call_errors_total"
+AZURE_DURATION = "finops_azure_call_duration_seconds"
+HTTP_REQUESTS = "finops_azure_http_requests_total"
+HTTP_DURATION = "finops_azure_http_request_duration_seconds"
+HTTP_THROTTLED = "finops_azure_http_throttled_total"
+HTTP_COALESCED = "finops_azure_http_coalesced_total"
+SERVICE_JOBS = "finops_service_jobs_total"
+SERVICE_QUEUE_WAIT = "finops_service_job_queue_wait_seconds"
+SERVICE_DURATION = "finops_service_job_duration_seconds"
+
+REGISTRY.describe(NODE_RUNS, "Graph node invocations.")
+REGISTRY.describe(NODE_ERRORS, "Graph node invocations that raised.")
+REGISTRY.describe(NODE_DURATION, "Wall time of graph node invocations.")
+REGISTRY.describe(AZURE_CALLS, "Calls to Azure tool functions.")
+REGISTRY.describe(AZURE_ERRORS, "Calls to Azure tool functions that raised.")
+REGISTRY.describe(AZURE_DURATION, "Wall time of Azure tool function calls.")
+REGISTRY.describe(HTTP_REQUESTS, "HTTP requests sent to Azure, by method and status.")
+REGISTRY.describe(HTTP_DURATION, "Wall time of HTTP requests sent to Azure.")
+REGISTRY.describe(HTTP_THROTTLED, "Throttled (429/503) responses from Azure, by service.")
+REGISTRY.describe(HTTP_COALESCED, "Requests that joined an identical request already in flight.")
+REGISTRY.describe(SERVICE_JOBS, "Analysis jobs finished by the service, by status.")
+REGISTRY.describe(SERVICE_QUEUE_WAIT, "Time analysis jobs waited for a service worker.")
+REGISTRY.describe(SERVICE_DURATION, "Time service workers spent running analysis jobs.")
+
+def timed_node(name: str, node: Callable[[Dict[str, Any]], Dict[str, Any]]) -> Callable[[Dict[str, Any]], Dict[str, Any]]:
+    """Wraps a graph node so each invocation's wall time and errors are recorded."""
+    labels = (("node", name),)
+
+    @functools.wraps(node)
+    def timed(state: Dict[str, Any]) -> Dict[str, Any]:
+        start = time.perf_counter()
+        try:
+            return node(state)
+        except Exception:
+            REGISTRY.inc(NODE_ERRORS, labels)
+            raise
+        finally:
+            REGISTRY.inc(NODE_RUNS, labels)
+            REGISTRY.observe(NODE_DURATION, time.perf_counter() - start, labels)
+    return timed
+
+def instrument_tool(func: Callable) -> Callable:
+    """
+    Decorates an Azure tool function (plain or async) so its calls, errors and
+    latency are recorded under the function's name.
+    """
+    labels = (("function", func.__name__),)
+
+    if asyncio.iscoroutinefunction(func):
+        @functools.wraps(func)
+        async def async_wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return await func(*args, **kwargs)
+            except Exception:
+                REGISTRY.inc(AZURE_ERRORS, labels)
+                raise
+            finally:
+                REGISTRY.inc(AZURE_CALLS, labels)
+                REGISTRY.observe(AZURE_DURATION, time.perf_counter() - start, labels)
+        return async_wrapper
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        except Exception:
+            REGISTRY.inc(AZURE_ERRORS, labels)
+            raise
+        finally:
+            REGISTRY.inc(AZURE_CALLS, labels)
+            REGISTRY.observe(AZURE_DURATION, time.perf_counter() - start, labels)
+    return wrapper
+
+def record_http_request(method: str, status: str, seconds: float) -> None:
+    """Records one HTTP request sent to Azure."""
+    REGISTRY.inc(HTTP_REQUESTS, (("method", method), ("status", status)))
+    REGISTRY.observe(HTTP_DURATION, seconds, (("method", method),))
+
+def record_throttled_request(service: str) -> None:
+    """Records one throttled response from an Azure service."""
+    REGISTRY.inc(HTTP_THROTTLED, (("service", service),))
+
+def record_coalesced_request() -> None:
+    """Records one request served by an identical request already in flight."""
+    REGISTRY.inc(HTTP_COALESCED)
+
+def record_service_job(status: str, queue_wait_seconds: float, service_seconds: float) -> None:
+    """Records one analysis job finished by the service."""
+    REGISTRY.inc(SERVICE_JOBS, (("status", status),))
+    REGISTRY.observe(SERVICE_QUEUE_WAIT, queue_wait_seconds)
+    REGISTRY.observe(SERVICE_DURATION, service_seconds)
+
+def export_json() -> Dict[str, Any]:
+    return REGISTRY.to_dict()
+
+def export_prometheus() -> str:
+    return REGISTRY.to_prometheus()
+
+def write_exports(directory: str, baseline: Optional[Dict[str, Any]] = None) -> Tuple[str, str]:
+    """
+    Writes the run's telemetry to `telemetry.json` and `metrics.prom` in `directory`.
+
+    Args:
+        directory: Directory to write the files to; created if needed.
+        baseline: `export_json()` taken when the run started. Only what was
+            recorded since then is written, not the whole process's history.
+            Runs of the same process that overlap still see each other's calls.
+
+    Returns:
+        The paths of the two files.
+    """
+    registry = REGISTRY if baseline is None else REGISTRY.since(baseline)
+    os.makedirs(directory, exist_ok=True)
+    json_path = os.path.join(directory, "telemetry.json")
+    prom_path = os.path.join(directory, "metrics.prom")
+    with open(json_path, "w") as f:
+        json.dump(registry.to_dict(), f, indent=2)
+    with open(prom_path, "w") as f:
+        f.write(registry.to_prometheus())
+    return json_path, prom_path
+
+# --- Structured Logging ---
+
+# Attributes every LogRecord has; anything else was passed through `extra=`.
+_STANDARD_RECORD_ATTRS = frozenset(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+class JsonFormatter(logging.Formatter):
+    """Formats each record as one JSON object, including the fields passed via `extra=`."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": round(record.created, 3),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _STANDARD_RECORD_ATTRS:
+                entry[key] = value
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+def configure_logging(level: int = logging.INFO, structured: bool = False) -> None:
+    """
+    Routes the agent's logs to stderr.
+
+    Per-resource messages are logged at DEBUG; at the default INFO level they
+    are discarded before any formatting happens.
+
+    Args:
+        level: Minimum level for the 'finops_agent' loggers.
+        structured: Emit JSON lines instead of plain text.
+    """
+    handler = logging.StreamHandler()
+    handler.setFormatter(JsonFormatter() if structured else logging.Formatter("%(levelname)s %(name)s: %(message)s"))
+    logger = logging.getLogger(__name__.rsplit(".", 1)[0])
+    logger.handlers[:] = [handler]
+    logger.setLevel(level)
+    logger.propagate = False
@@ -0,0 +1,200 @@
+import asyncio
+import concurrent.futures
+import threading
+import time
+from typing import Any, Awaitable, Dict, Optional, TypeVar
+
+from .. import telemetry
+from .scheduler import DEFAULT_MAX_RETRIES, RateLimit, RequestScheduler
+
+T = TypeVar("T")
+
+# Upper bound on requests in flight through one client. Batch calls may use a
+# lower limit of their own, but never a higher one.
+DEFAULT_MAX_CONCURRENCY = 16
+DEFAULT_TIMEOUT_SECONDS = 30.0
+# Scope requested from the credential for Azure Resource Manager and Azure Monitor.
+ARM_SCOPE = "https://management.azure.com/.default"
+# Refresh the bearer token this many seconds before it expires.
+TOKEN_REFRESH_MARGIN_SECONDS = 300
+
+class ArmClient:
+    """
+    Shared async HTTP client for Azure Resource Manager and Azure Monitor calls.
+
+    The client owns one event loop on a daemon thread and one pooled
+    `httpx.AsyncClient` bound to that loop. Synchronous callers (graph nodes,
+    which LangGraph runs in worker threads) and async callers both submit their
+    coroutines to it, so every Azure call in the process shares one connection
+    pool and one concurrency limit. Every HTTP request goes through the client's
+    `RequestScheduler`, which paces it per throttling endpoint, retries it while
+    Azure throttles it, and coalesces identical GETs in flight.
+
+    If `base_url` is None the client runs in offline mode: it still provides the
+    event loop and the concurrency limit, but cannot issue HTTP requests and the
+    tool functions fall back to their placeholder data.
+    """
+
+    def __init__(self, base_url: Optional[str] = None, max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+                 credential: Any = None, timeout: float = DEFAULT_TIMEOUT_SECONDS,
+                 rate_limits: Optional[Dict[str, RateLimit]] = None, max_retries: int = DEFAULT_MAX_RETRIES):
+        """
+        Args:
+            base_url: Root URL of the ARM endpoint (e.g. 'https://management.azure.com').
+            max_concurrency: Maximum number of requests in flight at once.
+            credential: An `azure.identity` credential used to obtain bearer tokens.
+                If None, requests are sent without an Authorization header.
+            timeout: Per-request timeout in seconds.
+            rate_limits: Client-side token buckets by service; see `scheduler.DEFAULT_RATE_LIMITS`.
+            max_retries: How often a throttled request is retried.
+        """
+        if max_concurrency < 1:
+            raise ValueError("max_concurrency must be at least 1")
+        self.base_url = base_url.rstrip("/") if base_url else None
+        self.max_concurrency = max_concurrency
+        self.credential = credential
+        self.timeout = timeout
+        self.scheduler = RequestScheduler(max_concurrency, rate_limits, max_retries)
+
+        self._lock = threading.Lock()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._http = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._token: Optional[str] = None
+        self._token_expires_on = 0.0
+
+    @property
+    def is_offline(self) -> bool:
+        """True if no endpoint is configured and tool functions use placeholder data."""
+        return self.base_url is None
+
+    def _ensure_started(self) -> asyncio.AbstractEventLoop:
+        """Starts the client's event loop thread on first use."""
+        with self._lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                thread = threading.Thread(target=loop.run_forever, name="finops-arm-client", daemon=True)
+                thread.start()
+                asyncio.run_coroutine_threadsafe(self._open(), loop).result()
+                self._loop, self._thread = loop, thread
+        return self._loop
+
+    async def _open(self) -> None:
+        """Creates the loop-bound resources. Runs on the client's loop."""
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        if self.base_url is not None:
+            # Imported here so the offline mode does not need httpx at all.
+            import httpx
+            self._http = httpx.AsyncClient(
+                base_url=self.base_url,
+                timeout=self.timeout,
+                limits=httpx.Limits(max_connections=self.max_concurrency,
+                                    max_keepalive_connections=self.max_concurrency),
+            )
+
+    def run(self, coro: Awaitable[T]) -> T:
+        """
+        Runs a coroutine on the client's loop and blocks until it completes.
+
+        Must not be called from the client's own loop.
+        """
+        loop = self._ensure_started()
+        return asyncio.run_coroutine_threadsafe(coro, loop).result()
+
+    def start(self, coro: Awaitable[T]) -> "concurrent.futures.Future[T]":
+        """Schedules a coroutine on the client's loop without waiting for it."""
+        return asyncio.run_coroutine_threadsafe(coro, self._ensure_started())
+
+    async def submit(self, coro: Awaitable[T]) -> T:
+        """Awaits a coroutine on the client's loop from any other running loop."""
+        loop = self._ensure_started()
+        if asyncio.get_running_loop() is loop:
+            return await coro
+        return await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(coro, loop))
+
+    async def run_blocking(self, func, *args) -> Any:
+        """
+        Runs a blocking function in the loop's executor, under the client's
+        concurrency limit. Used for the offline placeholder implementations.
+        """
+        async with self._semaphore:
+            return await asyncio.get_running_loop().run_in_executor(None, func, *args)
+
+    async def _auth_headers(self) -> Dict[str, str]:
+        """Returns the Authorization header, refreshing the token when it is about to expire."""
+        if self.credential is None:
+            return {}
+        if self._token is None or time.time() >= self._token_expires_on - TOKEN_REFRESH_MARGIN_SECONDS:
+            # azure-identity credentials are synchronous; keep them off the loop.
+            access_token = await asyncio.get_running_loop().run_in_executor(None, self.credential.get_token, ARM_SCOPE)
+            self._token, self._token_expires_on = access_token.token, float(access_token.expires_on)
+        return {"Authorization": f"Bearer {self._token}"}
+
+    async def request_json(self, method: str, url: str, params: Optional[Dict[str, Any]] = None,
+                           body: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """
+        Issues a request and returns the decoded JSON body. Runs on the client's loop.
+
+        Throttled requests are retried (see `RequestScheduler.send`), and a GET
+        identical to one already in flight shares its result.
+
+        Args:
+            method: HTTP method, e.g. 'GET' or 'POST'.
+            url: A path relative to `base_url`, or an absolute URL (e.g. an ARM `nextLink`).
+            params: Query string parameters.
+            body: JSON request body.
+
+        Raises:
+            RuntimeError: If the client is offline.
+            httpx.HTTPStatusError: If the response status is 4xx or 5xx, including
+                a request still throttled after its retries.
+        """
+        if self._http is None:
+            raise RuntimeError("ArmClient has no base_url configured; it cannot issue HTTP requests.")
+        key = (url, tuple(sorted((params or {}).items()))) if method == "GET" else None
+        return await self.scheduler.coalesce(key, lambda: self._send_json(method, url, params, body))
+
+    async def _send_json(self, method: str, url: str, params: Optional[Dict[str, Any]],
+                         body: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+        async def send():
+            async with self._semaphore:
+                headers = await self._auth_headers()
+                started = time.perf_counter()
+                status = "error"
+                try:
+                    response = await self._http.request(method, url, params=params, json=body, headers=headers)
+                    status = str(response.status_code)
+                finally:
+                    telemetry.record_http_request(method, status, time.perf_counter() - started)
+            return response
+
+        response = await self.scheduler.send(url, send)
+        response.raise_for_status()
+        # Accepted long-running operations (202) may come without a body.
+        return response.json() if response.content else {}
+
+    async def get_json(self, url: str, params: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """Issues a GET request. See `request_json`."""
+        return await self.request_json("GET", url, params)
+
+    async def post_json(self, url: str, body: Dict[str, Any], params: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """Issues a POST request with a JSON body. See `request_json`."""
+        return await self.request_json("POST", url, params, body)
+
+    async def patch_json(self, url: str, body: Dict[str, Any], params: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """Issues a PATCH request with a JSON body. See `request_json`."""
+        return await self.request_json("PATCH", url, params, body)
+
+    def close(self) -> None:
+        """Closes the connection pool and stops the event loop thread."""
+        with self._lock:
+            loop, thread, self._loop, self._thread = self._loop, self._thread, None, None
+        if loop is None:
+            return
+        if self._http is not None:
+            asyncio.run_coroutine_threadsafe(self._http.aclose(), loop).result()
+            self._http = None
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join()
+        loop.close()
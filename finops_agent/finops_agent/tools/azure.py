@@ -1,11 +1,59 @@
+import asyncio
+import atexit
+import concurrent.futures
 import datetime
-from typing import Dict, Any, List
+import logging
+import math
+import os
+import threading
+import time
+from typing import Dict, Any, Awaitable, Callable, Iterable, Iterator, List, Optional, TypeVar
+
+from .. import telemetry
+from .arm_client import ArmClient, DEFAULT_MAX_CONCURRENCY
+from .cache import TTLCache, DEFAULT_MAX_ENTRIES, DEFAULT_TTL_SECONDS
+from .scheduler import DEFAULT_MAX_RETRIES, RateLimit
+from .resource_graph import InventoryIndex, MAX_PAGE_SIZE, query_inventory, query_inventory_pages
+from .sketch import SECONDS_PER_DAY, SketchStore, daily_sketches, day_of
+from .timeseries import INGESTED_METRICS, INGEST_TIMESPAN, WINDOW_DAYS, MetricStatistics, Series, parse_timestamp, series_from_points
+
+T = TypeVar("T")
+
+logger = logging.getLogger(__name__)
 
 # Note: The actual implementation of these functions will require authentication
 # to Azure. This is often handled by `azure.identity.DefaultAzureCredential`.
 # For now, these functions are placeholders that define the interface
 # and return mock data, allowing the analysis node to be developed independently.
+#
+# Every tool function is wrapped with `telemetry.instrument_tool`, which counts
+# its calls and errors and records its latency.
+#
+# The async and batch variants further down go through a shared `ArmClient`.
+# When an ARM endpoint is configured (see `configure_client`) they call the
+# REST APIs; otherwise they run these placeholders on the client's executor.
 
+# Environment variable holding the ARM endpoint, e.g. 'https://management.azure.com'.
+ARM_ENDPOINT_ENV = "FINOPS_ARM_ENDPOINT"
+# Environment variable holding the path of the on-disk cache tier (SQLite file).
+CACHE_PATH_ENV = "FINOPS_CACHE_PATH"
+# Environment variable holding the path of the daily metric sketch store (SQLite file).
+SKETCH_PATH_ENV = "FINOPS_SKETCH_PATH"
+APIM_API_VERSION = "2022-08-01"
+MONITOR_API_VERSION = "2018-01-01"
+# Granularity of the Azure Monitor datapoints used to compute percentiles.
+METRICS_INTERVAL = "PT1H"
+METRICS_PERCENTILE = 95.0
+# Per-hour aggregation read for each ingested metric; 'maximum' unless listed.
+SERIES_AGGREGATIONS = {"Requests": "total"}
+# Provisioning states of an instance whose update is still running. An APIM
+# SKU change is a long-running operation; updates are polled until it ends.
+UPDATING_STATES = frozenset({"Updating", "Activating", "Creating"})
+DEFAULT_UPDATE_POLL_SECONDS = 30.0
+# An update still in progress after this long is given up on (a SKU change normally takes under an hour).
+DEFAULT_UPDATE_TIMEOUT_SECONDS = 2 * 3600.0
+
+@telemetry.instrument_tool
 def get_apim_properties(resource_id: str) -> Dict[str, Any]:
     """
     Fetches the properties of an Azure API Management instance.
@@ -18,7 +66,7 @@ def get_apim_properties(resource_id: str) -> Dict[str, Any]:
     Returns:
         A dictionary containing key properties like SKU name, VNet status, etc.
     """
-    print(f"---AZURE TOOL (MOCK): Fetching properties for {resource_id}---")
+    logger.debug("AZURE TOOL (MOCK): Fetching properties for %s", resource_id)
 
     # This mock data simulates different types of APIM instances.
     if "apim-prod-eus" in resource_id:
@@ -52,6 +100,7 @@ def get_apim_properties(resource_id: str) -> Dict[str, Any]:
             }
         }
 
+@telemetry.instrument_tool
 def get_apim_metrics(resource_id: str, metric_names: List[str], timespan: datetime.timedelta) -> Dict[str, float]:
     """
     Fetches the 95th percentile metrics for an APIM instance over a specified timespan.
@@ -66,7 +115,7 @@ def get_apim_metrics(resource_id: str, metric_names: List[str], timespan: dateti
     Returns:
         A dictionary mapping metric names to their P95 values.
     """
-    print(f"---AZURE TOOL (MOCK): Fetching {metric_names} for {resource_id} over past {timespan}---")
+    logger.debug("AZURE TOOL (MOCK): Fetching %s for %s over past %s", metric_names, resource_id, timespan)
 
     # This mock data simulates low utilization for the production instance.
     if "apim-prod-eus" in resource_id:
@@ -85,6 +134,33 @@ def get_apim_metrics(resource_id: str, metric_names: List[str], timespan: dateti
             "Requests": 5000000.0
         }
 
+@telemetry.instrument_tool
+def get_apim_metric_series(resource_id: str, metric_names: List[str], timespan: datetime.timedelta) -> Dict[str, List[Dict[str, Any]]]:
+    """
+    Fetches the raw hourly datapoints of an APIM instance's metrics over a specified timespan.
+
+    In a real implementation, this would use the azure-mgmt-monitor client.
+
+    Args:
+        resource_id: The full resource ID of the APIM instance.
+        metric_names: A list of metric names to fetch.
+        timespan: The duration over which to fetch the metrics.
+
+    Returns:
+        A dictionary mapping metric names to their datapoints, each a dict with
+        'timeStamp' (ISO 8601, or None for now) and 'value'.
+    """
+    logger.debug("AZURE TOOL (MOCK): Fetching series of %s for %s over past %s", metric_names, resource_id, timespan)
+
+    # The mock has no history: each metric is a single current datapoint at
+    # the value `get_apim_metrics` reports. The undecorated function is called
+    # so the fetch is counted once, as this function's; a patched
+    # `get_apim_metrics` has no `__wrapped__` and is called as is.
+    get_metrics = getattr(get_apim_metrics, "__wrapped__", get_apim_metrics)
+    return {name: [{"timeStamp": None, "value": value}]
+            for name, value in get_metrics(resource_id, metric_names, timespan).items()}
+
+@telemetry.instrument_tool
 def list_all_apim_instances(subscription_id: str) -> List[Dict[str, Any]]:
     """
     Lists all APIM instances in a given subscription.
@@ -99,7 +175,7 @@ def list_all_apim_instances(subscription_id: str) -> List[Dict[str, Any]]:
         A list of dictionaries, where each dictionary is the full resource object
         of an APIM instance.
     """
-    print(f"---AZURE TOOL (MOCK): Listing all APIM instances in subscription {subscription_id}---")
+    logger.debug("AZURE TOOL (MOCK): Listing all APIM instances in subscription %s", subscription_id)
 
     # This mock data simulates a scenario with instance sprawl, where multiple
     # underutilized instances exist that could be candidates for consolidation.
@@ -141,3 +217,606 @@ def list_all_apim_instances(subscription_id: str) -> List[Dict[str, Any]]:
             }
         }
     ]
+
+@telemetry.instrument_tool
+def update_apim_instance(resource_id: str, patch: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Applies a partial update (e.g. a new SKU or tags) to an APIM instance.
+
+    In a real implementation, this would use the azure-mgmt-apimanagement client.
+
+    Args:
+        resource_id: The full resource ID of the APIM instance.
+        patch: A JSON merge patch of the resource object, e.g. {"sku": {"name": "Standard"}}.
+
+    Returns:
+        The instance's resource object after the update.
+    """
+    logger.debug("AZURE TOOL (MOCK): Updating %s with %s", resource_id, patch)
+    return merge_patch(get_apim_properties(resource_id), patch)
+
+def merge_patch(target: Dict[str, Any], patch: Dict[str, Any]) -> Dict[str, Any]:
+    """Returns `target` with a JSON merge patch (RFC 7386) applied; `target` is not modified."""
+    merged = dict(target)
+    for key, value in patch.items():
+        if value is None:
+            merged.pop(key, None)
+        elif isinstance(value, dict) and isinstance(merged.get(key), dict):
+            merged[key] = merge_patch(merged[key], value)
+        else:
+            merged[key] = value
+    return merged
+
+
+# --- Shared Client ---
+
+_client: Optional[ArmClient] = None
+_client_lock = threading.Lock()
+
+def configure_client(base_url: Optional[str] = None, max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+                     credential: Any = None, rate_limits: Optional[Dict[str, RateLimit]] = None,
+                     max_retries: int = DEFAULT_MAX_RETRIES) -> ArmClient:
+    """
+    Replaces the shared client used by the async and batch tool functions.
+
+    Args:
+        base_url: ARM endpoint to call. None selects the offline placeholder data.
+        max_concurrency: Maximum number of Azure calls in flight across the process.
+        credential: An `azure.identity` credential for bearer tokens.
+        rate_limits: Client-side token buckets by service ('arm', 'monitor',
+            'resource_graph'); see `scheduler.DEFAULT_RATE_LIMITS`.
+        max_retries: How often a throttled request is retried before the call fails.
+
+    Returns:
+        The new shared client.
+    """
+    global _client
+    new_client = ArmClient(base_url, max_concurrency=max_concurrency, credential=credential,
+                           rate_limits=rate_limits, max_retries=max_retries)
+    with _client_lock:
+        old_client, _client = _client, new_client
+    if old_client is not None:
+        old_client.close()
+    return new_client
+
+def get_client() -> ArmClient:
+    """Returns the shared client, creating it from `FINOPS_ARM_ENDPOINT` on first use."""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = ArmClient(os.environ.get(ARM_ENDPOINT_ENV))
+        return _client
+
+# --- Fleet Inventory ---
+# A bulk Resource Graph query indexes every APIM instance of the queried
+# subscriptions. While an inventory is loaded, properties and subscription
+# listings for indexed resources are answered from it with no Azure call.
+
+_inventory: Optional[InventoryIndex] = None
+_inventory_lock = threading.Lock()
+
+@telemetry.instrument_tool
+def load_inventory(subscription_ids: Iterable[str], page_size: int = MAX_PAGE_SIZE, merge: bool = False) -> InventoryIndex:
+    """
+    Indexes every APIM instance across the given subscriptions and makes the
+    index the active inventory.
+
+    Online this is one paged Resource Graph query; offline it is built from the
+    placeholder `list_all_apim_instances`.
+
+    Args:
+        subscription_ids: The subscriptions to inventory.
+        page_size: Rows per Resource Graph page.
+        merge: If True, the subscriptions replace their own entries in the
+            active inventory and other subscriptions' entries are kept, so
+            concurrent runs over different subscriptions (see `service`) all
+            keep reading from it. Merged entries stay until
+            `release_inventory` drops them.
+
+    Returns:
+        The index of the given subscriptions only.
+    """
+    global _inventory
+    subscription_ids = list(subscription_ids)
+    client = get_client()
+    if client.is_offline:
+        index = InventoryIndex(instance for sid in subscription_ids for instance in list_all_apim_instances(sid))
+        index.mark_subscriptions(subscription_ids)
+    else:
+        index = client.run(query_inventory(client, subscription_ids, page_size))
+    with _inventory_lock:
+        # Swapped whole, so lookups on the client's loop never see a half-merged index.
+        _inventory = _inventory.merged(index) if merge and _inventory is not None else index
+    return index
+
+def iter_apim_instance_pages(subscription_ids: Iterable[str], page_size: int = MAX_PAGE_SIZE) -> Iterator[List[Dict[str, Any]]]:
+    """
+    Yields the APIM instances of the given subscriptions one page at a time,
+    without building an inventory of the whole fleet.
+
+    Online, the next Resource Graph page is fetched while the caller works on
+    the current one, so at most two pages are held in memory.
+
+    Args:
+        subscription_ids: The subscriptions to scan.
+        page_size: Instances per page.
+    """
+    subscription_ids = list(subscription_ids)
+    client = get_client()
+    if client.is_offline:
+        for subscription_id in subscription_ids:
+            instances = list_all_apim_instances(subscription_id)
+            for start in range(0, len(instances), page_size):
+                yield instances[start:start + page_size]
+        return
+
+    pages = query_inventory_pages(client, subscription_ids, page_size)
+    next_page = client.start(pages.__anext__())
+    try:
+        while True:
+            try:
+                page = next_page.result()
+            except StopAsyncIteration:
+                return
+            next_page = client.start(pages.__anext__())
+            yield page
+    finally:
+        # Let an in-flight prefetch settle before closing the generator under it.
+        concurrent.futures.wait([next_page])
+        client.run(pages.aclose())
+
+def get_inventory() -> Optional[InventoryIndex]:
+    """Returns the active inventory, or None if none has been loaded."""
+    return _inventory
+
+def release_inventory(subscription_ids: Iterable[str]) -> None:
+    """Drops the given subscriptions from the active inventory; their lookups go back to point reads."""
+    global _inventory
+    with _inventory_lock:
+        if _inventory is not None:
+            remaining = _inventory.without(subscription_ids)
+            _inventory = remaining if remaining.subscription_ids else None
+
+def clear_inventory() -> None:
+    """Drops the active inventory so lookups go back to point reads."""
+    global _inventory
+    with _inventory_lock:
+        _inventory = None
+
+# --- Response Cache ---
+# Properties and metrics fetched through the async and batch calls are cached
+# so overlapping nodes, and repeated runs when the on-disk tier is enabled,
+# skip the Azure round trip.
+
+_cache: Optional[TTLCache] = None
+_cache_lock = threading.Lock()
+
+def configure_cache(max_entries: int = DEFAULT_MAX_ENTRIES, ttl: float = DEFAULT_TTL_SECONDS,
+                    disk_path: Optional[str] = None) -> TTLCache:
+    """
+    Replaces the shared response cache.
+
+    Args:
+        max_entries: Maximum number of entries kept in memory (LRU eviction).
+        ttl: Lifetime of an entry in seconds.
+        disk_path: SQLite file for the on-disk tier, or None for memory only.
+
+    Returns:
+        The new cache.
+    """
+    global _cache
+    new_cache = TTLCache(max_entries=max_entries, ttl=ttl, disk_path=disk_path)
+    with _cache_lock:
+        old_cache, _cache = _cache, new_cache
+    if old_cache is not None:
+        old_cache.close()
+    return new_cache
+
+def get_cache() -> TTLCache:
+    """Returns the shared cache, creating it on first use (on disk if `FINOPS_CACHE_PATH` is set)."""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = TTLCache(disk_path=os.environ.get(CACHE_PATH_ENV))
+        return _cache
+
+@atexit.register
+def _close_cache() -> None:
+    # Commits the on-disk tier's pending writes before the process exits.
+    if _cache is not None:
+        _cache.close()
+
+def clear_cache() -> None:
+    """Drops every cached response and resets the hit/miss counters."""
+    get_cache().clear()
+
+def cache_stats() -> Dict[str, int]:
+    """Returns the cache's hit/miss counters, including the number of Azure round trips saved."""
+    return get_cache().stats.to_dict()
+
+# --- Metric Sketches ---
+# Ingested datapoints are kept as one quantile sketch per resource, metric and
+# day. Each ingestion fetches only the days since the resource's previous one
+# and merges the stored sketches into the trailing-window statistics.
+
+_sketch_store: Optional[SketchStore] = None
+_sketch_store_lock = threading.Lock()
+
+def configure_sketch_store(path: Optional[str] = None) -> SketchStore:
+    """
+    Replaces the shared sketch store.
+
+    Args:
+        path: SQLite file for the sketches, or None to keep them in memory.
+
+    Returns:
+        The new store.
+    """
+    global _sketch_store
+    new_store = SketchStore(path)
+    with _sketch_store_lock:
+        old_store, _sketch_store = _sketch_store, new_store
+    if old_store is not None:
+        old_store.close()
+    return new_store
+
+def get_sketch_store() -> SketchStore:
+    """Returns the shared sketch store, creating it on first use (on disk if `FINOPS_SKETCH_PATH` is set)."""
+    global _sketch_store
+    with _sketch_store_lock:
+        if _sketch_store is None:
+            _sketch_store = SketchStore(os.environ.get(SKETCH_PATH_ENV))
+        return _sketch_store
+
+def _properties_cache_key(resource_id: str) -> str:
+    return f"properties:{resource_id.lower()}"
+
+def _statistics_cache_key(resource_id: str) -> str:
+    return f"statistics:{resource_id.lower()}:{int(INGEST_TIMESPAN.total_seconds())}"
+
+def _metrics_cache_key(resource_id: str, metric_names: List[str], timespan: datetime.timedelta) -> str:
+    return f"metrics:{resource_id.lower()}:{','.join(sorted(metric_names))}:{int(timespan.total_seconds())}"
+
+# --- Helpers ---
+
+def _percentile(values: List[float], percentile: float) -> Optional[float]:
+    """Returns the percentile of `values` using linear interpolation, or None if empty."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = (len(ordered) - 1) * percentile / 100.0
+    lower, upper = math.floor(rank), math.ceil(rank)
+    if lower == upper:
+        return ordered[lower]
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (rank - lower)
+
+def _iso_timespan(timespan: datetime.timedelta) -> str:
+    """Formats a trailing timespan ending now as an ISO 8601 interval for Azure Monitor."""
+    end = datetime.datetime.now(datetime.timezone.utc).replace(microsecond=0)
+    start = end - timespan
+    return f"{start.isoformat()}/{end.isoformat()}"
+
+async def _gather_bounded(func: Callable[[str], Awaitable[T]], keys: Iterable[str],
+                          max_concurrency: Optional[int]) -> Dict[str, Any]:
+    """
+    Runs `func(key)` for every key with at most `max_concurrency` in flight.
+
+    Returns a dict mapping each key to its result, or to the exception it raised,
+    so one failing resource does not fail the whole batch.
+    """
+    keys = list(dict.fromkeys(keys))
+    semaphore = asyncio.Semaphore(max_concurrency or DEFAULT_MAX_CONCURRENCY)
+
+    async def bounded(key: str) -> Any:
+        async with semaphore:
+            return await func(key)
+
+    results = await asyncio.gather(*(bounded(key) for key in keys), return_exceptions=True)
+    return dict(zip(keys, results))
+
+# --- Async Single-Resource Calls ---
+# These coroutines run on the shared client's loop; the public async functions
+# below hop onto it with `ArmClient.submit`.
+
+@telemetry.instrument_tool
+async def _fetch_properties(client: ArmClient, resource_id: str) -> Dict[str, Any]:
+    inventory = _inventory
+    if inventory is not None and resource_id in inventory:
+        return inventory.get(resource_id)
+    cache = get_cache()
+    key = _properties_cache_key(resource_id)
+    properties = cache.get(key)
+    if properties is None:
+        if client.is_offline:
+            properties = await client.run_blocking(get_apim_properties, resource_id)
+        else:
+            properties = await client.get_json(resource_id, {"api-version": APIM_API_VERSION})
+        cache.set(key, properties)
+    return properties
+
+@telemetry.instrument_tool
+async def _fetch_metrics(client: ArmClient, resource_id: str, metric_names: List[str],
+                         timespan: datetime.timedelta) -> Dict[str, float]:
+    cache = get_cache()
+    key = _metrics_cache_key(resource_id, metric_names, timespan)
+    metrics = cache.get(key)
+    if metrics is None:
+        if client.is_offline:
+            metrics = await client.run_blocking(get_apim_metrics, resource_id, metric_names, timespan)
+        else:
+            metrics = await _query_metrics(client, resource_id, metric_names, timespan)
+        cache.set(key, metrics)
+    return metrics
+
+async def _query_metric_series(client: ArmClient, resource_id: str, metric_names: List[str],
+                              timespan: datetime.timedelta) -> Dict[str, Series]:
+    """Queries Azure Monitor for the hourly datapoints of each metric, in one request."""
+    body = await client.get_json(f"{resource_id}/providers/Microsoft.Insights/metrics", {
+        "api-version": MONITOR_API_VERSION,
+        "metricnames": ",".join(metric_names),
+        "timespan": _iso_timespan(timespan),
+        "interval": METRICS_INTERVAL,
+        "aggregation": "Maximum,Total",
+    })
+    series = {}
+    for metric in body.get("value", []):
+        name = metric["name"]["value"]
+        aggregation = SERIES_AGGREGATIONS.get(name, "maximum")
+        series[name] = series_from_points(
+            (parse_timestamp(point.get("timeStamp")), point.get(aggregation, point.get("maximum")))
+            for ts in metric.get("timeseries", []) for point in ts.get("data", []))
+    return series
+
+async def _query_metrics(client: ArmClient, resource_id: str, metric_names: List[str],
+                         timespan: datetime.timedelta) -> Dict[str, float]:
+    """Queries Azure Monitor and reduces each metric's datapoints to its P95."""
+    metrics = {}
+    for name, (_, values) in (await _query_metric_series(client, resource_id, metric_names, timespan)).items():
+        value = _percentile(values.tolist(), METRICS_PERCENTILE)
+        if value is not None:
+            metrics[name] = value
+    return metrics
+
+# Ingestions in flight on the client's loop, keyed like the cache, so nodes
+# asking for the same resource at once share one query.
+_statistics_in_flight: Dict[str, "asyncio.Future[MetricStatistics]"] = {}
+
+async def _ingest_statistics(client: ArmClient, resource_id: str, key: str) -> MetricStatistics:
+    store = get_sketch_store()
+    now = time.time()
+    today = day_of(now)
+    first_day = today - max(WINDOW_DAYS) + 1
+    # Days before the previous ingestion's day were complete when sketched; that
+    # day and the ones after it are fetched again.
+    ingested_at = store.ingested_at(resource_id)
+    from_day = first_day if ingested_at is None else min(max(first_day, day_of(ingested_at)), today)
+    timespan = datetime.timedelta(seconds=now - from_day * SECONDS_PER_DAY)
+
+    metric_names = list(INGESTED_METRICS)
+    if client.is_offline:
+        raw = await client.run_blocking(get_apim_metric_series, resource_id, metric_names, timespan)
+        series = {name: series_from_points(((parse_timestamp(p.get("timeStamp")), p.get("value")) for p in points), now)
+                  for name, points in raw.items()}
+    else:
+        series = await _query_metric_series(client, resource_id, metric_names, timespan)
+
+    sketches = {name: daily_sketches(timestamps, values, store.relative_accuracy, from_day)
+                for name, (timestamps, values) in series.items()}
+    store.replace(resource_id, from_day, sketches, now, retain_from_day=first_day)
+    # Only the days before the fetched ones need to be read back.
+    if from_day > first_day:
+        for name, days in store.load(resource_id, first_day, from_day - 1).items():
+            sketches.setdefault(name, {}).update(days)
+    statistics = MetricStatistics.from_sketches(sketches, today)
+    get_cache().set(key, statistics.to_list())
+    return statistics
+
+@telemetry.instrument_tool
+async def _fetch_statistics(client: ArmClient, resource_id: str) -> MetricStatistics:
+    key = _statistics_cache_key(resource_id)
+    cached = get_cache().get(key)
+    if cached is not None:
+        return MetricStatistics.from_list(cached)
+    task = _statistics_in_flight.get(key)
+    if task is None:
+        task = _statistics_in_flight[key] = asyncio.ensure_future(_ingest_statistics(client, resource_id, key))
+        task.add_done_callback(lambda _: _statistics_in_flight.pop(key, None))
+    return await asyncio.shield(task)
+
+@telemetry.instrument_tool
+async def _fetch_instances(client: ArmClient, subscription_id: str) -> List[Dict[str, Any]]:
+    inventory = _inventory
+    if inventory is not None and inventory.covers_subscription(subscription_id):
+        return inventory.instances_in(subscription_id)
+    if client.is_offline:
+        return await client.run_blocking(list_all_apim_instances, subscription_id)
+    instances: List[Dict[str, Any]] = []
+    url: Optional[str] = f"/subscriptions/{subscription_id}/providers/Microsoft.ApiManagement/service"
+    params: Optional[Dict[str, Any]] = {"api-version": APIM_API_VERSION}
+    while url:
+        page = await client.get_json(url, params)
+        instances.extend(page.get("value", []))
+        # The nextLink already carries the api-version and continuation token.
+        url, params = page.get("nextLink"), None
+    return instances
+
+@telemetry.instrument_tool
+async def _read_instance(client: ArmClient, resource_id: str) -> Optional[Dict[str, Any]]:
+    if client.is_offline:
+        return await client.run_blocking(get_apim_properties, resource_id)
+    try:
+        return await client.get_json(resource_id, {"api-version": APIM_API_VERSION})
+    except Exception as e:
+        # An httpx.HTTPStatusError; httpx itself is only imported by online clients.
+        if getattr(getattr(e, "response", None), "status_code", None) == 404:
+            return None
+        raise
+
+@telemetry.instrument_tool
+async def _update_instance(client: ArmClient, resource_id: str, patch: Dict[str, Any], poll_seconds: float,
+                           timeout_seconds: float) -> Dict[str, Any]:
+    if client.is_offline:
+        updated = await client.run_blocking(update_apim_instance, resource_id, patch)
+    else:
+        updated = await client.patch_json(resource_id, patch, {"api-version": APIM_API_VERSION})
+        deadline = time.monotonic() + timeout_seconds
+        # An accepted update may answer with no body; its state is read back until it ends.
+        while not updated or updated.get("properties", {}).get("provisioningState") in UPDATING_STATES:
+            if time.monotonic() >= deadline:
+                raise TimeoutError(f"Update of {resource_id} did not finish within {timeout_seconds:g} seconds")
+            await asyncio.sleep(poll_seconds)
+            updated = await client.get_json(resource_id, {"api-version": APIM_API_VERSION})
+        if updated.get("properties", {}).get("provisioningState") == "Failed":
+            raise RuntimeError(f"Update of {resource_id} failed")
+    # Later reads in this process see the updated instance.
+    get_cache().set(_properties_cache_key(resource_id), updated)
+    _refresh_inventory(resource_id, updated)
+    return updated
+
+def _refresh_inventory(resource_id: str, updated: Dict[str, Any]) -> None:
+    """Swaps in an inventory holding the updated instance, if the active one indexes it."""
+    global _inventory
+    with _inventory_lock:
+        inventory = _inventory
+        if inventory is not None and resource_id in inventory:
+            # Readers may be iterating the active index, so it is never changed in place.
+            _inventory = inventory.updated([{**inventory.get(resource_id), **updated}])
+
+@telemetry.instrument_tool
+async def aget_apim_properties(resource_id: str) -> Dict[str, Any]:
+    """Async version of `get_apim_properties`."""
+    client = get_client()
+    return await client.submit(_fetch_properties(client, resource_id))
+
+@telemetry.instrument_tool
+async def aget_apim_metrics(resource_id: str, metric_names: List[str], timespan: datetime.timedelta) -> Dict[str, float]:
+    """Async version of `get_apim_metrics`."""
+    client = get_client()
+    return await client.submit(_fetch_metrics(client, resource_id, metric_names, timespan))
+
+@telemetry.instrument_tool
+async def aget_metric_statistics(resource_id: str) -> MetricStatistics:
+    """
+    Returns the P50/P95/P99 of every ingested metric over every window for one
+    instance. The raw series is pulled at most once per cache lifetime, and
+    only for the days not yet held in the sketch store.
+    """
+    client = get_client()
+    return await client.submit(_fetch_statistics(client, resource_id))
+
+@telemetry.instrument_tool
+async def alist_all_apim_instances(subscription_id: str) -> List[Dict[str, Any]]:
+    """Async version of `list_all_apim_instances`. Follows `nextLink` paging."""
+    client = get_client()
+    return await client.submit(_fetch_instances(client, subscription_id))
+
+@telemetry.instrument_tool
+async def aread_apim_instance(resource_id: str) -> Optional[Dict[str, Any]]:
+    """
+    Reads an instance's current resource object from Azure, bypassing the
+    inventory and the cache. Used before changing an instance.
+
+    Returns:
+        The resource object, or None if the instance no longer exists.
+    """
+    client = get_client()
+    return await client.submit(_read_instance(client, resource_id))
+
+@telemetry.instrument_tool
+async def aupdate_apim_instance(resource_id: str, patch: Dict[str, Any],
+                                poll_seconds: float = DEFAULT_UPDATE_POLL_SECONDS,
+                                timeout_seconds: float = DEFAULT_UPDATE_TIMEOUT_SECONDS) -> Dict[str, Any]:
+    """
+    Async version of `update_apim_instance`. Online, the update is sent as an
+    ARM PATCH and the instance is polled every `poll_seconds` until its
+    provisioning state leaves `UPDATING_STATES`.
+
+    Raises:
+        RuntimeError: If the update ends in the 'Failed' provisioning state.
+        TimeoutError: If the update is still in progress after `timeout_seconds`.
+    """
+    client = get_client()
+    return await client.submit(_update_instance(client, resource_id, patch, poll_seconds, timeout_seconds))
+
+# --- Batch Calls ---
+
+@telemetry.instrument_tool
+async def aget_apim_properties_many(resource_ids: Iterable[str], max_concurrency: Optional[int] = None) -> Dict[str, Any]:
+    """
+    Fetches the properties of many APIM instances concurrently.
+
+    Args:
+        resource_ids: The resource IDs to fetch. Duplicates are fetched once.
+        max_concurrency: Maximum number of calls in flight for this batch. The
+            shared client's own limit still applies.
+
+    Returns:
+        A dict mapping each resource ID to its properties, or to the exception
+        raised while fetching them.
+    """
+    client = get_client()
+    return await client.submit(_gather_bounded(lambda rid: _fetch_properties(client, rid), resource_ids, max_concurrency))
+
+@telemetry.instrument_tool
+async def aget_apim_metrics_many(resource_ids: Iterable[str], metric_names: List[str], timespan: datetime.timedelta,
+                                 max_concurrency: Optional[int] = None) -> Dict[str, Any]:
+    """
+    Fetches P95 metrics for many APIM instances concurrently.
+
+    Returns:
+        A dict mapping each resource ID to its metrics dict (as returned by
+        `get_apim_metrics`), or to the exception raised while fetching them.
+    """
+    client = get_client()
+    return await client.submit(_gather_bounded(lambda rid: _fetch_metrics(client, rid, metric_names, timespan),
+                                               resource_ids, max_concurrency))
+
+@telemetry.instrument_tool
+async def aget_metric_statistics_many(resource_ids: Iterable[str], max_concurrency: Optional[int] = None) -> Dict[str, Any]:
+    """
+    Ingests the metric series of many APIM instances concurrently.
+
+    Returns:
+        A dict mapping each resource ID to its `MetricStatistics`, or to the
+        exception raised while ingesting them.
+    """
+    client = get_client()
+    return await client.submit(_gather_bounded(lambda rid: _fetch_statistics(client, rid), resource_ids, max_concurrency))
+
+@telemetry.instrument_tool
+async def alist_all_apim_instances_many(subscription_ids: Iterable[str], max_concurrency: Optional[int] = None) -> Dict[str, Any]:
+    """
+    Lists the APIM instances of many subscriptions concurrently.
+
+    Returns:
+        A dict mapping each subscription ID to its list of instances, or to the
+        exception raised while listing them.
+    """
+    client = get_client()
+    return await client.submit(_gather_bounded(lambda sid: _fetch_instances(client, sid), subscription_ids, max_concurrency))
+
+@telemetry.instrument_tool
+def get_apim_properties_many(resource_ids: Iterable[str], max_concurrency: Optional[int] = None) -> Dict[str, Any]:
+    """Blocking version of `aget_apim_properties_many`, for use from graph nodes."""
+    client = get_client()
+    return client.run(_gather_bounded(lambda rid: _fetch_properties(client, rid), resource_ids, max_concurrency))
+
+@telemetry.instrument_tool
+def get_apim_metrics_many(resource_ids: Iterable[str], metric_names: List[str], timespan: datetime.timedelta,
+                          max_concurrency: Optional[int] = None) -> Dict[str, Any]:
+    """Blocking version of `aget_apim_metrics_many`, for use from graph nodes."""
+    client = get_client()
+    return client.run(_gather_bounded(lambda rid: _fetch_metrics(client, rid, metric_names, timespan),
+                                      resource_ids, max_concurrency))
+
+@telemetry.instrument_tool
+def get_metric_statistics_many(resource_ids: Iterable[str], max_concurrency: Optional[int] = None) -> Dict[str, Any]:
+    """Blocking version of `aget_metric_statistics_many`, for use from graph nodes."""
+    client = get_client()
+    return client.run(_gather_bounded(lambda rid: _fetch_statistics(client, rid), resource_ids, max_concurrency))
+
+@telemetry.instrument_tool
+def list_all_apim_instances_many(subscription_ids: Iterable[str], max_concurrency: Optional[int] = None) -> Dict[str, Any]:
+    """Blocking version of `alist_all_apim_instances_many`, for use from graph nodes."""
+    client = get_client()
+    return client.run(_gather_bounded(lambda sid: _fetch_instances(client, sid), subscription_ids, max_concurrency))
@@ -0,0 +1,198 @@
+import json
+import logging
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, asdict
+from typing import Any, Callable, Dict, Optional, Tuple
+
+DEFAULT_MAX_ENTRIES = 4096
+# Metrics over a 90-day window barely move within an hour, so one hour is the default lifetime.
+DEFAULT_TTL_SECONDS = 3600.0
+# Writes to the on-disk tier are committed in the background, once this many
+# are pending or this many seconds after the last commit.
+DEFAULT_DISK_BATCH_SIZE = 256
+DEFAULT_DISK_FLUSH_INTERVAL_SECONDS = 1.0
+
+logger = logging.getLogger(__name__)
+
+@dataclass
+class CacheStats:
+    """Counters for one cache. Every hit is an Azure round trip that was not made."""
+    hits: int = 0
+    disk_hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+    expirations: int = 0
+
+    @property
+    def round_trips_saved(self) -> int:
+        return self.hits + self.disk_hits
+
+    def to_dict(self) -> Dict[str, int]:
+        stats = asdict(self)
+        stats["round_trips_saved"] = self.round_trips_saved
+        return stats
+
+class TTLCache:
+    """
+    Thread-safe in-memory cache with per-entry TTL and LRU eviction, backed by an
+    optional SQLite file so entries survive between runs.
+
+    Values must be JSON-serializable if the on-disk tier is used. `set` never
+    touches the disk: a background thread commits pending writes in batches,
+    so callers on an event loop are not held up by a disk flush per entry.
+    """
+
+    def __init__(self, max_entries: int = DEFAULT_MAX_ENTRIES, ttl: float = DEFAULT_TTL_SECONDS,
+                 disk_path: Optional[str] = None, clock: Callable[[], float] = time.time,
+                 disk_batch_size: int = DEFAULT_DISK_BATCH_SIZE,
+                 disk_flush_interval: float = DEFAULT_DISK_FLUSH_INTERVAL_SECONDS):
+        """
+        Args:
+            max_entries: Maximum number of entries kept in memory before the least
+                recently used one is evicted.
+            ttl: Lifetime of an entry in seconds.
+            disk_path: Path of a SQLite file for the on-disk tier. None keeps the
+                cache in memory only.
+            clock: Returns the current time in seconds. Wall-clock time is used so
+                that expiry times stored on disk stay valid across processes.
+            disk_batch_size: Pending disk writes that trigger a commit.
+            disk_flush_interval: Seconds after which pending disk writes are
+                committed however few there are.
+        """
+        if max_entries < 1:
+            raise ValueError("max_entries must be at least 1")
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.disk_path = disk_path
+        self.stats = CacheStats()
+        self._clock = clock
+        self._entries: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+        self.disk_batch_size = disk_batch_size
+        self.disk_flush_interval = disk_flush_interval
+        self._lock = threading.Lock()
+        # Encoded values not yet committed to disk, by key. Guarded by `_lock`;
+        # the connection itself by `_db_lock`, taken after `_lock` if both are.
+        self._pending: Dict[str, Tuple[str, float]] = {}
+        self._db_lock = threading.Lock()
+        self._db: Optional[sqlite3.Connection] = None
+        self._wake = threading.Event()
+        self._stopped = threading.Event()
+        self._writer: Optional[threading.Thread] = None
+        if disk_path:
+            self._db = sqlite3.connect(disk_path, check_same_thread=False)
+            self._db.execute("CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)")
+            self._db.commit()
+            self._writer = threading.Thread(target=self._write_behind, name="finops-cache-writer", daemon=True)
+            self._writer.start()
+
+    def get(self, key: str) -> Optional[Any]:
+        """Returns the cached value for `key`, or None on a miss."""
+        now = self._clock()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, value = entry
+                if expires_at > now:
+                    self._entries.move_to_end(key)
+                    self.stats.hits += 1
+                    return value
+                del self._entries[key]
+                self.stats.expirations += 1
+
+            if self._db is not None:
+                row = self._pending.get(key)
+                if row is None:
+                    with self._db_lock:
+                        row = self._db.execute("SELECT value, expires_at FROM cache WHERE key = ?", (key,)).fetchone()
+                if row is not None and row[1] > now:
+                    value = json.loads(row[0])
+                    self._store_in_memory(key, value, row[1])
+                    self.stats.disk_hits += 1
+                    return value
+
+            self.stats.misses += 1
+            return None
+
+    def set(self, key: str, value: Any) -> None:
+        """Stores `value` under `key` in memory and, if configured, queues it for the disk."""
+        expires_at = self._clock() + self.ttl
+        encoded = json.dumps(value) if self._db is not None else None
+        with self._lock:
+            self._store_in_memory(key, value, expires_at)
+            if encoded is not None:
+                self._pending[key] = (encoded, expires_at)
+                if len(self._pending) >= self.disk_batch_size:
+                    self._wake.set()
+
+    def flush(self) -> int:
+        """Commits the pending disk writes in one transaction. Returns the number written."""
+        with self._lock:
+            batch, self._pending = self._pending, {}
+        if not batch:
+            return 0
+        with self._db_lock:
+            if self._db is None:
+                return 0
+            with self._db:
+                self._db.executemany("INSERT OR REPLACE INTO cache (key, value, expires_at) VALUES (?, ?, ?)",
+                                     [(key, value, expires_at) for key, (value, expires_at) in batch.items()])
+        return len(batch)
+
+    def _write_behind(self) -> None:
+        """Writer thread: commits pending writes whenever a batch is full or the interval has passed."""
+        while not self._stopped.is_set():
+            self._wake.wait(self.disk_flush_interval)
+            self._wake.clear()
+            try:
+                self.flush()
+            except sqlite3.Error as e:
+                logger.warning("Could not write the response cache to %s. Error: %s", self.disk_path, e)
+
+    def _store_in_memory(self, key: str, value: Any, expires_at: float) -> None:
+        """Inserts an entry as most recently used, evicting the oldest if full. Caller holds the lock."""
+        self._entries[key] = (expires_at, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.stats.evictions += 1
+
+    def clear(self) -> None:
+        """Drops every entry, in memory and on disk, and resets the stats."""
+        with self._lock:
+            self._entries.clear()
+            self._pending.clear()
+            self.stats = CacheStats()
+            with self._db_lock:
+                if self._db is not None:
+                    self._db.execute("DELETE FROM cache")
+                    self._db.commit()
+
+    def purge_expired(self) -> int:
+        """Removes expired entries from the on-disk tier. Returns the number removed."""
+        if self._db is None:
+            return 0
+        self.flush()
+        with self._db_lock:
+            removed = self._db.execute("DELETE FROM cache WHERE expires_at <= ?", (self._clock(),)).rowcount
+            self._db.commit()
+        return removed
+
+    def close(self) -> None:
+        """Commits the pending disk writes and closes the on-disk tier."""
+        if self._writer is not None:
+            self._stopped.set()
+            self._wake.set()
+            self._writer.join()
+            self._writer = None
+        if self._db is not None:
+            self.flush()
+        with self._db_lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+    def __len__(self) -> int:
+        return len(self._entries)
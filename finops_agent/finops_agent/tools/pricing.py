@@ -0,0 +1,193 @@
+import logging
+import os
+import threading
+from typing import Dict, Iterable, Iterator, Optional, Tuple
+
+import numpy as np
+
+# Local catalog of APIM list prices, per SKU, region and capacity unit, so that
+# savings are estimated without any pricing call during a run.
+#
+# The catalog is compiled offline from the Azure Retail Prices API (see
+# `refresh_catalog`) into a .npy file of (key, monthly price) rows sorted by
+# key. Opening it memory-maps the file; a lookup is a binary search, memoized
+# per (SKU, region). Regions the catalog lacks fall back to `ANY_REGION` rows.
+
+# Environment variable holding the path of the compiled catalog (.npy).
+PRICES_PATH_ENV = "FINOPS_PRICES_PATH"
+RETAIL_PRICES_URL = "https://prices.azure.com/api/retail/prices"
+RETAIL_PRICES_FILTER = "serviceName eq 'API Management' and priceType eq 'Consumption'"
+HOURS_PER_MONTH = 730
+ANY_REGION = "*"
+
+# Pay-as-you-go monthly price of one unit in USD in US regions, used where the
+# catalog has no region-specific price.
+DEFAULT_MONTHLY_PRICES = {
+    "Developer": 48.04,
+    "Basic": 147.17,
+    "Standard": 686.72,
+    "Premium": 2795.17,
+    "Basic_v2": 150.01,
+    "Standard_v2": 700.0,
+    "Premium_v2": 2801.0,
+}
+
+CATALOG_DTYPE = np.dtype([("key", "U64"), ("monthly_price", "f8")])
+
+logger = logging.getLogger(__name__)
+
+def _key(sku: str, region: str) -> str:
+    return f"{region.lower().replace(' ', '')}|{sku.lower()}"
+
+class PriceIndex:
+    """Monthly price per capacity unit by SKU and region, on a sorted (key, price) array."""
+
+    def __init__(self, entries: np.ndarray):
+        """
+        Args:
+            entries: A `CATALOG_DTYPE` array sorted by key, possibly memory-mapped.
+        """
+        self._entries = entries
+        self._keys = entries["key"]
+        self._memo: Dict[Tuple[str, str], Optional[float]] = {}
+
+    @classmethod
+    def from_prices(cls, prices: Dict[Tuple[str, str], float]) -> "PriceIndex":
+        """Builds an index from monthly unit prices keyed by (SKU, region); region `ANY_REGION` is the fallback."""
+        entries = np.array(sorted((_key(sku, region), price) for (sku, region), price in prices.items()), dtype=CATALOG_DTYPE)
+        return cls(entries)
+
+    @classmethod
+    def default(cls) -> "PriceIndex":
+        """Returns an index of `DEFAULT_MONTHLY_PRICES` for every region."""
+        return cls.from_prices({(sku, ANY_REGION): price for sku, price in DEFAULT_MONTHLY_PRICES.items()})
+
+    @classmethod
+    def open(cls, path: str) -> "PriceIndex":
+        """Memory-maps a catalog written by `save`."""
+        return cls(np.load(path, mmap_mode="r"))
+
+    def save(self, path: str) -> None:
+        np.save(path, np.asarray(self._entries))
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _find(self, key: str) -> Optional[float]:
+        row = int(np.searchsorted(self._keys, key))
+        if row < len(self._keys) and self._keys[row] == key:
+            return float(self._entries["monthly_price"][row])
+        return None
+
+    def monthly_price(self, sku: Optional[str], region: Optional[str] = None) -> Optional[float]:
+        """Returns the monthly price of one unit of the SKU in the region, or None if it is not in the catalog."""
+        if not sku:
+            return None
+        memo_key = (sku, region or "")
+        if memo_key not in self._memo:
+            price = self._find(_key(sku, region)) if region else None
+            self._memo[memo_key] = price if price is not None else self._find(_key(sku, ANY_REGION))
+        return self._memo[memo_key]
+
+    def monthly_cost(self, instances: Iterable[Tuple[Optional[str], int]], region: Optional[str] = None) -> Optional[float]:
+        """
+        Returns the monthly cost of (SKU, capacity units) instances in a region,
+        or None if any SKU has no price.
+        """
+        total = 0.0
+        for sku, units in instances:
+            price = self.monthly_price(sku, region)
+            if price is None:
+                return None
+            total += price * units
+        return total
+
+    def saving(self, current: Iterable[Tuple[Optional[str], int]], target: Iterable[Tuple[Optional[str], int]],
+               region: Optional[str] = None) -> Optional[float]:
+        """
+        Returns the monthly saving of replacing the `current` instances with the
+        `target` ones, rounded to cents, or None if a price is missing.
+        """
+        before, after = self.monthly_cost(current, region), self.monthly_cost(target, region)
+        if before is None or after is None:
+            return None
+        return round(before - after, 2)
+
+# --- Offline Refresh ---
+
+def iter_retail_prices(url: str = RETAIL_PRICES_URL, currency: str = "USD") -> Iterator[Dict[str, object]]:
+    """Yields every APIM price row of the Azure Retail Prices API, following its paging."""
+    import httpx
+
+    params: Optional[Dict[str, str]] = {"$filter": RETAIL_PRICES_FILTER, "currencyCode": currency}
+    next_url: Optional[str] = url
+    with httpx.Client(timeout=60.0) as client:
+        while next_url:
+            response = client.get(next_url, params=params)
+            response.raise_for_status()
+            page = response.json()
+            yield from page.get("Items", [])
+            # The next page link already carries the filter.
+            next_url, params = page.get("NextPageLink"), None
+
+def monthly_unit_prices(rows: Iterable[Dict[str, object]]) -> Dict[Tuple[str, str], float]:
+    """
+    Reduces retail price rows to monthly unit prices by (SKU, region). Only the
+    hourly '<tier> Unit' meters count; gateways and per-call meters are skipped.
+    """
+    prices: Dict[Tuple[str, str], float] = {}
+    for row in rows:
+        sku_name = str(row.get("skuName") or "")
+        if row.get("unitOfMeasure") != "1 Hour" or row.get("meterName") != f"{sku_name} Unit":
+            continue
+        sku = sku_name.replace(" ", "_")
+        prices[(sku, str(row.get("armRegionName") or ANY_REGION))] = float(row["retailPrice"]) * HOURS_PER_MONTH
+    return prices
+
+def refresh_catalog(path: str, rows: Optional[Iterable[Dict[str, object]]] = None) -> PriceIndex:
+    """
+    Compiles the catalog at `path` from retail price rows (by default, fetched
+    from the Retail Prices API). `DEFAULT_MONTHLY_PRICES` stay as the fallback.
+    """
+    prices = {(sku, ANY_REGION): price for sku, price in DEFAULT_MONTHLY_PRICES.items()}
+    prices.update(monthly_unit_prices(iter_retail_prices() if rows is None else rows))
+    index = PriceIndex.from_prices(prices)
+    index.save(path)
+    logger.info("Wrote %d prices to %s.", len(index), path)
+    return index
+
+# --- Shared Index ---
+
+_index: Optional[PriceIndex] = None
+_index_lock = threading.Lock()
+
+def configure_price_index(path: Optional[str] = None) -> PriceIndex:
+    """
+    Replaces the shared index.
+
+    Args:
+        path: Compiled catalog to open, or None for the default prices.
+    """
+    global _index
+    index = PriceIndex.open(path) if path else PriceIndex.default()
+    with _index_lock:
+        _index = index
+    return index
+
+def get_price_index() -> PriceIndex:
+    """Returns the shared index, opening `FINOPS_PRICES_PATH` (or the default prices) on first use."""
+    global _index
+    with _index_lock:
+        if _index is None:
+            path = os.environ.get(PRICES_PATH_ENV)
+            _index = PriceIndex.open(path) if path else PriceIndex.default()
+        return _index
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Compile the APIM price catalog from the Azure Retail Prices API.")
+    parser.add_argument("path", help="catalog file to write (.npy)")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    refresh_catalog(args.path)
@@ -0,0 +1,145 @@
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+from .arm_client import ArmClient
+
+# Azure Resource Graph answers KQL queries over the ARM resource inventory of
+# many subscriptions at once, so one paged query replaces a list call per
+# subscription and a properties call per instance.
+RESOURCE_GRAPH_PATH = "/providers/Microsoft.ResourceGraph/resources"
+RESOURCE_GRAPH_API_VERSION = "2021-03-01"
+# Resource Graph returns at most 1000 rows per page and accepts at most 1000
+# subscriptions per request.
+MAX_PAGE_SIZE = 1000
+MAX_SUBSCRIPTIONS_PER_QUERY = 1000
+
+# Projects every APIM instance into the same shape as `azure.get_apim_properties`.
+APIM_INVENTORY_QUERY = """
+resources
+| where type =~ 'microsoft.apimanagement/service'
+| project id, name, location, subscriptionId, resourceGroup, sku,
+          properties = pack('virtualNetworkType', tostring(properties.virtualNetworkType),
+                            'additionalLocations', properties.additionalLocations)
+| order by id asc
+""".strip()
+
+class InventoryIndex:
+    """
+    In-memory index of APIM instances built from one inventory query.
+
+    Lookups are case-insensitive on resource ID, as ARM resource IDs are.
+    """
+
+    def __init__(self, instances: Iterable[Dict[str, Any]]):
+        self._by_id: Dict[str, Dict[str, Any]] = {}
+        self._by_subscription: Dict[str, List[str]] = {}
+        for instance in instances:
+            self.add(instance)
+
+    def add(self, instance: Dict[str, Any]) -> None:
+        """Adds or replaces one instance."""
+        key = instance["id"].lower()
+        if key not in self._by_id:
+            subscription_id = (instance.get("subscriptionId") or instance["id"].split("/")[2]).lower()
+            self._by_subscription.setdefault(subscription_id, []).append(key)
+        self._by_id[key] = instance
+
+    def get(self, resource_id: str) -> Optional[Dict[str, Any]]:
+        """Returns the instance's resource object, or None if it is not indexed."""
+        return self._by_id.get(resource_id.lower())
+
+    def covers_subscription(self, subscription_id: str) -> bool:
+        """True if the query that built this index included the subscription."""
+        return subscription_id.lower() in self._by_subscription
+
+    def instances_in(self, subscription_id: str) -> List[Dict[str, Any]]:
+        """Returns every indexed instance of a subscription."""
+        return [self._by_id[key] for key in self._by_subscription.get(subscription_id.lower(), [])]
+
+    def resource_ids(self) -> List[str]:
+        """Returns every indexed resource ID, in query order."""
+        return [instance["id"] for instance in self._by_id.values()]
+
+    @property
+    def subscription_ids(self) -> List[str]:
+        return list(self._by_subscription)
+
+    def mark_subscriptions(self, subscription_ids: Iterable[str]) -> None:
+        """Records queried subscriptions that had no APIM instances, so they count as covered."""
+        for subscription_id in subscription_ids:
+            self._by_subscription.setdefault(subscription_id.lower(), [])
+
+    def merged(self, newer: "InventoryIndex") -> "InventoryIndex":
+        """
+        Returns a new index with this index's subscriptions, except that every
+        subscription `newer` covers is replaced by its contents. Neither index
+        is changed, so readers of either are never disturbed.
+        """
+        index = self.without(newer.subscription_ids)
+        index._by_id.update(newer._by_id)
+        index._by_subscription.update((sid, list(keys)) for sid, keys in newer._by_subscription.items())
+        return index
+
+    def updated(self, instances: Iterable[Dict[str, Any]]) -> "InventoryIndex":
+        """Returns a new index with the given instances added or replaced. This index is not changed."""
+        index = self.without([])
+        for instance in instances:
+            index.add(instance)
+        return index
+
+    def without(self, subscription_ids: Iterable[str]) -> "InventoryIndex":
+        """Returns a new index without the given subscriptions. This index is not changed."""
+        dropped = {subscription_id.lower() for subscription_id in subscription_ids}
+        index = InventoryIndex([])
+        # Copied whole rather than re-added one instance at a time.
+        index._by_id = dict(self._by_id)
+        for sid in dropped:
+            for key in self._by_subscription.get(sid, []):
+                del index._by_id[key]
+        index._by_subscription = {sid: list(keys) for sid, keys in self._by_subscription.items() if sid not in dropped}
+        return index
+
+    def __contains__(self, resource_id: str) -> bool:
+        return resource_id.lower() in self._by_id
+
+    def __len__(self) -> int:
+        return len(self._by_id)
+
+def _chunks(items: List[str], size: int) -> Iterator[List[str]]:
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+async def query_inventory_pages(client: ArmClient, subscription_ids: Iterable[str], page_size: int = MAX_PAGE_SIZE,
+                                query: str = APIM_INVENTORY_QUERY):
+    """
+    Runs an inventory query and yields one page of rows at a time. Runs on the client's loop.
+
+    Args:
+        client: The online ARM client to send the queries through.
+        subscription_ids: Subscriptions to query; split into groups of at most
+            MAX_SUBSCRIPTIONS_PER_QUERY.
+        page_size: Rows per page, at most MAX_PAGE_SIZE.
+        query: The KQL query to run.
+    """
+    page_size = min(page_size, MAX_PAGE_SIZE)
+    for group in _chunks(list(subscription_ids), MAX_SUBSCRIPTIONS_PER_QUERY):
+        skip_token: Optional[str] = None
+        while True:
+            options: Dict[str, Any] = {"$top": page_size, "resultFormat": "objectArray"}
+            if skip_token:
+                options["$skipToken"] = skip_token
+            page = await client.post_json(RESOURCE_GRAPH_PATH, {"subscriptions": group, "query": query, "options": options},
+                                          {"api-version": RESOURCE_GRAPH_API_VERSION})
+            yield page.get("data", [])
+            skip_token = page.get("$skipToken")
+            if not skip_token:
+                break
+
+async def query_inventory(client: ArmClient, subscription_ids: Iterable[str], page_size: int = MAX_PAGE_SIZE) -> InventoryIndex:
+    """Runs the APIM inventory query across subscriptions and indexes every row. Runs on the client's loop."""
+    subscription_ids = list(subscription_ids)
+    index = InventoryIndex([])
+    async for rows in query_inventory_pages(client, subscription_ids, page_size):
+        for row in rows:
+            index.add(row)
+    index.mark_subscriptions(subscription_ids)
+    return index
@@ -0,0 +1,288 @@
+import asyncio
+import datetime
+import email.utils
+import random
+import re
+import time
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, Hashable, Mapping, Optional
+
+from .. import telemetry
+
+# Throttle-aware scheduling of the HTTP requests an `ArmClient` sends.
+#
+# Azure Resource Manager throttles reads per subscription with a token bucket,
+# Azure Monitor and Resource Graph have budgets of their own, and all of them
+# answer 429 (or 503 from an overloaded provider) with a Retry-After header
+# once a budget is spent. Each endpoint (a service, per subscription where the
+# service throttles per subscription) gets:
+#   * a client-side token bucket that keeps a run inside the service's rate;
+#   * an AIMD concurrency limit that starts low and grows by one slot per
+#     success (slow start) until the first throttled response, then by one slot
+#     per limit's worth of successes, halved on every throttled response, so it
+#     settles just below the point where the live service starts throttling;
+#   * a pause until the Retry-After time of the last throttled response, so no
+#     other request is sent into a spent budget.
+# Throttled requests are retried with the Retry-After delay, or exponential
+# backoff with jitter when the response has none. Identical GETs in flight at
+# once are coalesced into one request.
+
+# Statuses that mean "slow down" rather than "failed".
+THROTTLE_STATUSES = frozenset({429, 503})
+DEFAULT_MAX_RETRIES = 5
+BACKOFF_BASE_SECONDS = 0.5
+MAX_BACKOFF_SECONDS = 60.0
+# Concurrency limit every endpoint starts from before slow start grows it.
+DEFAULT_INITIAL_CONCURRENCY = 4
+
+@dataclass(frozen=True)
+class RateLimit:
+    """A token bucket refilled at `rate` requests per second, holding at most `burst` tokens."""
+    rate: float
+    burst: int
+
+# Client-side buckets per service, in line with Azure's documented read budgets
+# (ARM: 250-request bucket refilled at 25/s per subscription; Resource Graph:
+# 15 requests per 5 seconds). The AIMD limit and Retry-After handle whatever
+# the live limits turn out to be.
+DEFAULT_RATE_LIMITS: Dict[str, RateLimit] = {
+    "arm": RateLimit(25.0, 250),
+    "monitor": RateLimit(25.0, 250),
+    "resource_graph": RateLimit(3.0, 15),
+}
+
+_SUBSCRIPTION_RE = re.compile(r"/subscriptions/([^/?]+)", re.IGNORECASE)
+
+def endpoint_of(url: str) -> str:
+    """
+    Returns the throttling endpoint of a request URL: 'resource_graph', or
+    'arm' or 'monitor' followed by ':<subscription ID>' when the URL names one.
+    """
+    lowered = url.lower()
+    if "/providers/microsoft.resourcegraph/" in lowered:
+        return "resource_graph"
+    service = "monitor" if "/providers/microsoft.insights/" in lowered else "arm"
+    match = _SUBSCRIPTION_RE.search(lowered)
+    return f"{service}:{match.group(1)}" if match else service
+
+def retry_after_seconds(headers: Mapping[str, str], now: Optional[float] = None) -> Optional[float]:
+    """
+    Reads the delay a throttled response asks for, from 'retry-after-ms',
+    'x-ms-retry-after-ms' or 'Retry-After' (seconds or an HTTP date).
+
+    Returns:
+        The delay in seconds, or None if the response names none.
+    """
+    for name in ("retry-after-ms", "x-ms-retry-after-ms"):
+        value = headers.get(name)
+        if value:
+            try:
+                return max(0.0, float(value) / 1000.0)
+            except ValueError:
+                pass
+    value = headers.get("retry-after")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=datetime.timezone.utc)
+    return max(0.0, when.timestamp() - (time.time() if now is None else now))
+
+def backoff_seconds(attempt: int) -> float:
+    """Exponential backoff with jitter for the given retry attempt (0-based)."""
+    return min(MAX_BACKOFF_SECONDS, BACKOFF_BASE_SECONDS * 2 ** attempt) * random.uniform(0.5, 1.0)
+
+class TokenBucket:
+    """Token bucket rate limiter. Used from one event loop only."""
+
+    def __init__(self, limit: RateLimit, clock: Callable[[], float] = time.monotonic):
+        if limit.rate <= 0 or limit.burst < 1:
+            raise ValueError("a rate limit needs a positive rate and a burst of at least 1")
+        self.limit = limit
+        self._clock = clock
+        self._tokens = float(limit.burst)
+        self._updated = clock()
+
+    def _refill(self) -> None:
+        now = self._clock()
+        self._tokens = min(float(self.limit.burst), self._tokens + (now - self._updated) * self.limit.rate)
+        self._updated = now
+
+    def try_acquire(self) -> float:
+        """Takes a token if one is available. Returns 0, or the seconds until one will be."""
+        self._refill()
+        if self._tokens >= 1.0:
+            self._tokens -= 1.0
+            return 0.0
+        return (1.0 - self._tokens) / self.limit.rate
+
+    async def acquire(self) -> None:
+        """Waits for a token and takes it."""
+        while True:
+            delay = self.try_acquire()
+            if not delay:
+                return
+            await asyncio.sleep(delay)
+
+class AdaptiveLimit:
+    """
+    AIMD concurrency limit. Used from one event loop only.
+
+    The limit starts in slow start, growing by one slot per successful request
+    (so it about doubles every `limit` requests) until the first throttled
+    request. From then on it grows by one slot for every `limit` successful
+    requests and halves on a throttled one. Requests that were already in flight when the
+    limit was cut do not cut it again: each `acquire` returns the current
+    epoch, and only a throttle from the current epoch counts.
+    """
+
+    def __init__(self, initial: int, maximum: int, minimum: int = 1):
+        self.minimum = minimum
+        self.maximum = maximum
+        self.limit = float(max(minimum, min(initial, maximum)))
+        self.slow_start = True
+        self.in_flight = 0
+        self.epoch = 0
+        self._changed = asyncio.Condition()
+
+    async def acquire(self) -> int:
+        """Waits for a free slot and takes it. Returns the epoch to pass to `on_throttle`."""
+        async with self._changed:
+            await self._changed.wait_for(lambda: self.in_flight < int(self.limit))
+            self.in_flight += 1
+            return self.epoch
+
+    async def release(self) -> None:
+        async with self._changed:
+            self.in_flight -= 1
+            self._changed.notify_all()
+
+    def on_success(self) -> None:
+        step = 1.0 if self.slow_start else 1.0 / self.limit
+        self.limit = min(float(self.maximum), self.limit + step)
+
+    def on_throttle(self, epoch: int) -> None:
+        if epoch == self.epoch:
+            self.slow_start = False
+            self.limit = max(float(self.minimum), self.limit / 2.0)
+            self.epoch += 1
+
+class _Endpoint:
+    """Scheduling state of one throttling endpoint."""
+
+    def __init__(self, name: str, rate_limit: RateLimit, initial_concurrency: int, max_concurrency: int):
+        self.name = name
+        self.bucket = TokenBucket(rate_limit)
+        self.concurrency = AdaptiveLimit(initial_concurrency, max_concurrency)
+        self.paused_until = 0.0
+        self.throttled = 0
+
+    async def wait_until_resumed(self) -> None:
+        while True:
+            delay = self.paused_until - time.monotonic()
+            if delay <= 0:
+                return
+            await asyncio.sleep(delay)
+
+class RequestScheduler:
+    """
+    Schedules the requests of one `ArmClient` per throttling endpoint. Runs on
+    the client's event loop.
+    """
+
+    def __init__(self, max_concurrency: int, rate_limits: Optional[Dict[str, RateLimit]] = None,
+                 max_retries: int = DEFAULT_MAX_RETRIES, initial_concurrency: int = DEFAULT_INITIAL_CONCURRENCY):
+        """
+        Args:
+            max_concurrency: Upper bound of every endpoint's adaptive concurrency limit.
+            rate_limits: Token buckets by service ('arm', 'monitor', 'resource_graph'),
+                overriding `DEFAULT_RATE_LIMITS`.
+            max_retries: How often a throttled request is retried before its
+                throttled response is returned.
+            initial_concurrency: Every endpoint's concurrency limit before slow start grows it.
+        """
+        self.max_concurrency = max_concurrency
+        self.initial_concurrency = initial_concurrency
+        self.rate_limits = {**DEFAULT_RATE_LIMITS, **(rate_limits or {})}
+        self.max_retries = max_retries
+        self._endpoints: Dict[str, _Endpoint] = {}
+        self._in_flight: Dict[Hashable, "asyncio.Future[Any]"] = {}
+
+    def _endpoint(self, name: str) -> _Endpoint:
+        endpoint = self._endpoints.get(name)
+        if endpoint is None:
+            rate_limit = self.rate_limits[name.split(":", 1)[0]]
+            endpoint = self._endpoints[name] = _Endpoint(name, rate_limit, self.initial_concurrency, self.max_concurrency)
+        return endpoint
+
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        """Returns each endpoint's current concurrency limit and throttled response count."""
+        return {name: {"concurrency_limit": e.concurrency.limit, "throttled": e.throttled}
+                for name, e in sorted(self._endpoints.items())}
+
+    async def send(self, url: str, send: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Sends a request to `url` through its endpoint's limits, retrying while
+        it is throttled.
+
+        Args:
+            url: The request URL, which selects the endpoint.
+            send: Sends the request once and returns the response (anything with
+                `status_code` and `headers`).
+
+        Returns:
+            The first response that is not throttled, or the last throttled
+            response once the retries are used up.
+        """
+        endpoint = self._endpoint(endpoint_of(url))
+        service = endpoint.name.split(":", 1)[0]
+        attempt = 0
+        while True:
+            await endpoint.wait_until_resumed()
+            epoch = await endpoint.concurrency.acquire()
+            try:
+                await endpoint.bucket.acquire()
+                response = await send()
+            finally:
+                await endpoint.concurrency.release()
+
+            if response.status_code not in THROTTLE_STATUSES:
+                endpoint.concurrency.on_success()
+                return response
+
+            endpoint.throttled += 1
+            endpoint.concurrency.on_throttle(epoch)
+            telemetry.record_throttled_request(service)
+            if attempt >= self.max_retries:
+                return response
+            delay = retry_after_seconds(response.headers)
+            if delay is None:
+                delay = backoff_seconds(attempt)
+            else:
+                # The service's budget is spent; hold back the endpoint's other requests too.
+                endpoint.paused_until = max(endpoint.paused_until, time.monotonic() + delay)
+            attempt += 1
+            await asyncio.sleep(delay)
+
+    async def coalesce(self, key: Optional[Hashable], request: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Runs `request()`, unless a request with the same key is already in
+        flight, in which case its result is shared. A None key is never coalesced.
+        """
+        if key is None:
+            return await request()
+        future = self._in_flight.get(key)
+        if future is not None:
+            telemetry.record_coalesced_request()
+        else:
+            future = self._in_flight[key] = asyncio.ensure_future(request())
+            future.add_done_callback(lambda _: self._in_flight.pop(key, None))
+        # Shielded so one caller's cancellation does not cancel the others' request.
+        return await asyncio.shield(future)
@@ -0,0 +1,253 @@
+import math
+import sqlite3
+import threading
+from typing import Dict, Iterable, List, Optional, Sequence
+
+import numpy as np
+
+# Mergeable quantile sketches of metric datapoints, one per resource, metric
+# and UTC day. A trailing N-day percentile is read by merging the N daily
+# sketches, so after the first run only the newest day has to be fetched from
+# Azure Monitor, and sketches of different resources, shards or subscriptions
+# merge into fleet-wide percentiles.
+
+# Every quantile read from a sketch is within this relative error of the exact
+# datapoint at that rank.
+DEFAULT_RELATIVE_ACCURACY = 0.01
+# Values at or below this are counted as zero (idle instances report 0%).
+MIN_INDEXED_VALUE = 1e-9
+SECONDS_PER_DAY = 86400
+
+def day_of(timestamp: float) -> int:
+    """Returns the UTC day number (days since the epoch) of a timestamp."""
+    return int(timestamp // SECONDS_PER_DAY)
+
+class QuantileSketch:
+    """
+    Logarithmic-bucket quantile sketch (as in DDSketch).
+
+    Positive values are counted in buckets whose bounds grow by a constant
+    factor, so a quantile is answered within `relative_accuracy` of the true
+    value and two sketches merge exactly by adding their bucket counts. Buckets
+    are held as two sorted arrays; a day of hourly datapoints needs at most a
+    few dozen of them.
+    """
+    __slots__ = ("relative_accuracy", "keys", "counts", "zero_count", "min", "max", "_gamma", "_log_gamma")
+
+    def __init__(self, relative_accuracy: float = DEFAULT_RELATIVE_ACCURACY,
+                 keys: Optional[np.ndarray] = None, counts: Optional[np.ndarray] = None, zero_count: int = 0,
+                 min_value: float = math.inf, max_value: float = -math.inf):
+        if not 0 < relative_accuracy < 1:
+            raise ValueError("relative_accuracy must be between 0 and 1")
+        self.relative_accuracy = relative_accuracy
+        self.keys = np.empty(0, dtype=np.int32) if keys is None else keys
+        self.counts = np.empty(0, dtype=np.int64) if counts is None else counts
+        self.zero_count = zero_count
+        # Quantiles are clamped to the exact extremes, so a constant series reads back exactly.
+        self.min = min_value
+        self.max = max_value
+        self._gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self._gamma)
+
+    @classmethod
+    def from_values(cls, values: np.ndarray, relative_accuracy: float = DEFAULT_RELATIVE_ACCURACY) -> "QuantileSketch":
+        """Builds a sketch of an array of datapoints."""
+        sketch = cls(relative_accuracy)
+        sketch.add(values)
+        return sketch
+
+    def copy(self) -> "QuantileSketch":
+        return QuantileSketch(self.relative_accuracy, self.keys.copy(), self.counts.copy(), self.zero_count,
+                              self.min, self.max)
+
+    @property
+    def count(self) -> int:
+        return int(self.counts.sum()) + self.zero_count
+
+    def add(self, values: np.ndarray) -> None:
+        """Adds datapoints to the sketch."""
+        values = np.asarray(values, dtype=np.float64)
+        if not len(values):
+            return
+        self.min = min(self.min, float(values.min()))
+        self.max = max(self.max, float(values.max()))
+        positive = values[values > MIN_INDEXED_VALUE]
+        self.zero_count += len(values) - len(positive)
+        if len(positive):
+            keys, counts = np.unique(np.ceil(np.log(positive) / self._log_gamma).astype(np.int32), return_counts=True)
+            if len(self.keys):
+                self._add_buckets(keys, counts)
+            else:
+                self.keys, self.counts = keys, counts.astype(np.int64)
+
+    def merge(self, other: "QuantileSketch") -> None:
+        """Adds every datapoint of `other` to this sketch."""
+        if other.relative_accuracy != self.relative_accuracy:
+            raise ValueError("Cannot merge sketches with different relative accuracies")
+        self.zero_count += other.zero_count
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        if not len(self.keys):
+            # Other sketches' buckets are already unique and sorted.
+            self.keys, self.counts = other.keys.copy(), other.counts.copy()
+        elif len(other.keys):
+            self._add_buckets(other.keys, other.counts)
+
+    def _add_buckets(self, keys: np.ndarray, counts: np.ndarray) -> None:
+        merged_keys, inverse = np.unique(np.concatenate([self.keys, keys]), return_inverse=True)
+        self.counts = np.bincount(inverse, weights=np.concatenate([self.counts, counts]),
+                                  minlength=len(merged_keys)).astype(np.int64)
+        self.keys = merged_keys.astype(np.int32)
+
+    def quantiles(self, percentiles: Sequence[float]) -> List[Optional[float]]:
+        """
+        Returns the value at each percentile (0-100), or None for every one if
+        the sketch is empty. Uses the lower rank, as DDSketch does.
+        """
+        total = self.count
+        if not total:
+            return [None] * len(percentiles)
+        if not len(self.keys):
+            return [0.0] * len(percentiles)
+        ranks = [math.floor(p / 100.0 * (total - 1)) for p in percentiles]
+        # Cumulative counts with the zero bucket in front of the positive buckets.
+        cumulative = np.cumsum(self.counts) + self.zero_count
+        last = len(self.keys) - 1
+        values = []
+        for rank, bucket in zip(ranks, np.searchsorted(cumulative, ranks, side="right").tolist()):
+            if rank < self.zero_count:
+                values.append(0.0)
+                continue
+            # Bucket k covers (gamma^(k-1), gamma^k]; its value is the point with
+            # equal relative error to both bounds.
+            value = 2.0 * math.exp(int(self.keys[min(bucket, last)]) * self._log_gamma) / (self._gamma + 1.0)
+            values.append(min(max(value, self.min), self.max))
+        return values
+
+    def quantile(self, percentile: float) -> Optional[float]:
+        return self.quantiles([percentile])[0]
+
+def daily_sketches(timestamps: np.ndarray, values: np.ndarray, relative_accuracy: float = DEFAULT_RELATIVE_ACCURACY,
+                   from_day: Optional[int] = None) -> Dict[int, QuantileSketch]:
+    """
+    Sketches a series per UTC day.
+
+    Args:
+        timestamps: Datapoint times in epoch seconds.
+        values: Datapoint values.
+        relative_accuracy: Accuracy of the sketches.
+        from_day: Datapoints of earlier days are ignored.
+    """
+    days = (np.asarray(timestamps, dtype=np.float64) // SECONDS_PER_DAY).astype(np.int64)
+    if not len(days):
+        return {}
+    first, last = int(days.min()), int(days.max())
+    if first == last:
+        # An incremental fetch usually covers only today.
+        return {} if from_day is not None and first < from_day else {first: QuantileSketch.from_values(values, relative_accuracy)}
+    sketches = {}
+    for day in np.unique(days).tolist():
+        if from_day is None or day >= from_day:
+            sketches[day] = QuantileSketch.from_values(values[days == day], relative_accuracy)
+    return sketches
+
+class SketchStore:
+    """
+    SQLite-backed store of daily sketches, safe to share between threads.
+
+    Besides the sketches it records, per resource, when its datapoints were
+    last ingested, so the next ingestion only fetches from the start of that day.
+    """
+
+    def __init__(self, path: Optional[str] = None, relative_accuracy: float = DEFAULT_RELATIVE_ACCURACY):
+        """
+        Args:
+            path: SQLite file holding the sketches. None keeps them in a
+                private temporary database, which SQLite spills to disk once
+                it outgrows its page cache and deletes on close, so a large
+                fleet does not hold every sketch in memory.
+            relative_accuracy: Accuracy of the sketches built for this store.
+        """
+        self.path = path
+        self.relative_accuracy = relative_accuracy
+        self._lock = threading.Lock()
+        # An empty name is SQLite's private on-disk temporary database.
+        self._db = sqlite3.connect(path or "", check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS sketches ("
+            " resource_id TEXT NOT NULL, metric TEXT NOT NULL, day INTEGER NOT NULL,"
+            " zero_count INTEGER NOT NULL, min REAL NOT NULL, max REAL NOT NULL, keys BLOB NOT NULL, counts BLOB NOT NULL,"
+            " PRIMARY KEY (resource_id, metric, day))"
+        )
+        self._db.execute("CREATE TABLE IF NOT EXISTS ingested (resource_id TEXT PRIMARY KEY, ingested_at REAL NOT NULL)")
+        self._db.commit()
+
+    def ingested_at(self, resource_id: str) -> Optional[float]:
+        """Returns when the resource's datapoints were last ingested, or None if never."""
+        with self._lock:
+            row = self._db.execute("SELECT ingested_at FROM ingested WHERE resource_id = ?",
+                                   (resource_id.lower(),)).fetchone()
+        return None if row is None else row[0]
+
+    def load(self, resource_id: str, first_day: int, last_day: Optional[int] = None) -> Dict[str, Dict[int, QuantileSketch]]:
+        """Returns the resource's sketches from `first_day` on (through `last_day`), as {metric: {day: sketch}}."""
+        query = "SELECT metric, day, zero_count, min, max, keys, counts FROM sketches WHERE resource_id = ? AND day >= ?"
+        params = [resource_id.lower(), first_day]
+        if last_day is not None:
+            query += " AND day <= ?"
+            params.append(last_day)
+        with self._lock:
+            rows = self._db.execute(query, params).fetchall()
+        sketches: Dict[str, Dict[int, QuantileSketch]] = {}
+        for metric, day, zero_count, low, high, keys, counts in rows:
+            sketches.setdefault(metric, {})[day] = QuantileSketch(
+                self.relative_accuracy, np.frombuffer(keys, dtype=np.int32).copy(),
+                np.frombuffer(counts, dtype=np.int64).copy(), zero_count, low, high)
+        return sketches
+
+    def replace(self, resource_id: str, from_day: int, sketches: Dict[str, Dict[int, QuantileSketch]],
+                ingested_at: float, retain_from_day: Optional[int] = None) -> None:
+        """
+        Replaces the resource's sketches from `from_day` on with `sketches`, in
+        one transaction, and records the ingestion time.
+
+        Args:
+            resource_id: The resource the sketches belong to.
+            from_day: First day covered by the new sketches. Stored days from
+                here on are dropped, since a re-fetched day supersedes them.
+            sketches: The new sketches, as {metric: {day: sketch}}.
+            ingested_at: Time the sketched datapoints were fetched.
+            retain_from_day: Sketches older than this day are deleted.
+        """
+        resource_id = resource_id.lower()
+        with self._lock, self._db:
+            self._db.execute("DELETE FROM sketches WHERE resource_id = ? AND day >= ?", (resource_id, from_day))
+            if retain_from_day is not None:
+                self._db.execute("DELETE FROM sketches WHERE resource_id = ? AND day < ?", (resource_id, retain_from_day))
+            self._db.executemany(
+                "INSERT INTO sketches VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                [(resource_id, metric, day, sketch.zero_count, sketch.min, sketch.max, sketch.keys.astype(np.int32).tobytes(),
+                  sketch.counts.astype(np.int64).tobytes())
+                 for metric, days in sketches.items() for day, sketch in days.items()],
+            )
+            self._db.execute("INSERT OR REPLACE INTO ingested VALUES (?, ?)", (resource_id, ingested_at))
+
+    def merged(self, resource_ids: Iterable[str], metric: str, first_day: int, last_day: int) -> QuantileSketch:
+        """
+        Merges one metric's sketches of many resources over a range of days,
+        e.g. for the percentile of a whole subscription or shard.
+        """
+        merged = QuantileSketch(self.relative_accuracy)
+        for resource_id in resource_ids:
+            for sketch in self.load(resource_id, first_day, last_day).get(metric, {}).values():
+                merged.merge(sketch)
+        return merged
+
+    def clear(self) -> None:
+        with self._lock, self._db:
+            self._db.execute("DELETE FROM sketches")
+            self._db.execute("DELETE FROM ingested")
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
@@ -0,0 +1,112 @@
+import datetime
+import time
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .sketch import QuantileSketch
+
+# Raw metric time series are pulled once per resource, sketched per day (see
+# `sketch`) and reduced to the percentiles of every trailing window. Only the
+# reduced statistics (one small array per resource) are kept; the analysis
+# nodes read whichever metric, window and percentile they need from it.
+
+INGESTED_METRICS: Tuple[str, ...] = ("Capacity", "CpuPercentage", "MemoryPercentage", "Requests")
+WINDOW_DAYS: Tuple[int, ...] = (7, 30, 90)
+PERCENTILES: Tuple[float, ...] = (50.0, 95.0, 99.0)
+# Span of raw data pulled per resource: the longest window.
+INGEST_TIMESPAN = datetime.timedelta(days=max(WINDOW_DAYS))
+
+# (timestamps in epoch seconds, values), both 1-D and of equal length.
+Series = Tuple[np.ndarray, np.ndarray]
+
+def series_from_points(points: Iterable[Tuple[Optional[float], Optional[float]]], now: Optional[float] = None) -> Series:
+    """
+    Packs (timestamp, value) datapoints into compact arrays, dropping points
+    without a value. A missing timestamp is taken as `now`.
+    """
+    now = time.time() if now is None else now
+    pairs = [(now if ts is None else ts, value) for ts, value in points if value is not None]
+    if not pairs:
+        return np.empty(0, dtype=np.float64), np.empty(0, dtype=np.float64)
+    timestamps, values = zip(*pairs)
+    return np.asarray(timestamps, dtype=np.float64), np.asarray(values, dtype=np.float64)
+
+def parse_timestamp(value: Optional[str]) -> Optional[float]:
+    """Parses an Azure Monitor ISO 8601 timestamp to epoch seconds."""
+    if not value:
+        return None
+    return datetime.datetime.fromisoformat(value.replace("Z", "+00:00")).timestamp()
+
+class MetricStatistics:
+    """
+    Percentiles of every ingested metric over every window, for one resource.
+
+    Backed by one float64 array of shape (metrics, windows, percentiles), NaN
+    where a metric had no datapoints in a window.
+    """
+    __slots__ = ("values",)
+
+    def __init__(self, values: np.ndarray):
+        self.values = values
+
+    @classmethod
+    def from_sketches(cls, sketches: Dict[str, Dict[int, QuantileSketch]], today: int) -> "MetricStatistics":
+        """
+        Computes the statistics from daily sketches, as returned by
+        `SketchStore.load`. The N-day window is today and the N-1 days before it.
+        """
+        values = np.full((len(INGESTED_METRICS), len(WINDOW_DAYS), len(PERCENTILES)), np.nan, dtype=np.float64)
+        for m, name in enumerate(INGESTED_METRICS):
+            days = sketches.get(name)
+            if not days:
+                continue
+            # The windows are nested, so walking the days newest first, each
+            # window merges only the days the previous one did not cover.
+            newest_first = sorted((day for day in days if day <= today), reverse=True)
+            merged: Optional[QuantileSketch] = None
+            i = 0
+            for w, window_days in enumerate(WINDOW_DAYS):
+                window_start, added = today - window_days + 1, False
+                while i < len(newest_first) and newest_first[i] >= window_start:
+                    sketch = days[newest_first[i]]
+                    if merged is None:
+                        merged = sketch.copy()
+                    else:
+                        merged.merge(sketch)
+                    i, added = i + 1, True
+                if w and not added:
+                    values[m, w] = values[m, w - 1]
+                elif merged is not None and merged.count:
+                    values[m, w] = merged.quantiles(PERCENTILES)
+        return cls(values)
+
+    @classmethod
+    def from_list(cls, flat: Sequence[float]) -> "MetricStatistics":
+        """Rebuilds statistics from `to_list` output."""
+        shape = (len(INGESTED_METRICS), len(WINDOW_DAYS), len(PERCENTILES))
+        return cls(np.asarray(flat, dtype=np.float64).reshape(shape))
+
+    def to_list(self) -> List[float]:
+        """Returns the statistics as a flat, JSON-serializable list."""
+        return self.values.ravel().tolist()
+
+    def get(self, metric: str, window_days: int = 90, percentile: float = 95.0) -> Optional[float]:
+        """Returns one statistic, or None if the metric had no datapoints in the window."""
+        value = self.values[INGESTED_METRICS.index(metric), WINDOW_DAYS.index(window_days), PERCENTILES.index(percentile)]
+        return None if np.isnan(value) else float(value)
+
+    def metrics(self, window_days: int = 90, percentile: float = 95.0) -> Dict[str, float]:
+        """
+        Returns one percentile of every metric over one window, in the shape
+        `get_apim_metrics` returns. Metrics without datapoints are left out.
+        """
+        column = self.values[:, WINDOW_DAYS.index(window_days), PERCENTILES.index(percentile)]
+        return {name: float(value) for name, value in zip(INGESTED_METRICS, column) if not np.isnan(value)}
+
+    def to_dict(self) -> Dict[str, Dict[str, Dict[str, Any]]]:
+        """Returns {metric: {'<days>d': {'p<percentile>': value}}}, for reports."""
+        return {
+            name: {f"{days}d": {f"p{p:g}": self.get(name, days, p) for p in PERCENTILES} for days in WINDOW_DAYS}
+            for name in INGESTED_METRICS
+        }
@@ -0,0 +1,243 @@
+"""
+A local stand-in for the Azure REST endpoints used by `tools/azure.py`.
+
+The server runs on a random localhost port in a background thread. It serves
+APIM properties, Azure Monitor metrics, paged subscription listings and
+Resource Graph inventory queries for a configurable fleet, applies PATCH updates to instances, with a fixed per-request latency, and records how many
+requests were in flight at once. It can also throttle like Azure does, answering
+429 with a Retry-After header.
+"""
+import collections
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Set
+from urllib.parse import parse_qs, urlparse
+
+def make_instance(subscription_id: str, name: str, sku: str = "Basic", capacity: int = 1,
+                  vnet: str = "None", additional_locations: Optional[List[Dict[str, Any]]] = None,
+                  location: str = "eastus") -> Dict[str, Any]:
+    """Builds an APIM resource object in the shape returned by ARM."""
+    return {
+        "id": f"/subscriptions/{subscription_id}/resourceGroups/rg-{name}/providers/Microsoft.ApiManagement/service/{name}",
+        "name": name,
+        "location": location,
+        "sku": {"name": sku, "capacity": capacity},
+        "properties": {
+            "virtualNetworkType": vnet,
+            "additionalLocations": additional_locations or [],
+        },
+    }
+
+AccessToken = collections.namedtuple("AccessToken", ["token", "expires_on"])
+
+class StaticCredential:
+    """Stands in for an azure-identity credential; always returns the same token."""
+    TOKEN = "fake-token"
+
+    def get_token(self, *scopes: str) -> AccessToken:
+        return AccessToken(self.TOKEN, time.time() + 3600)
+
+class _Server(ThreadingHTTPServer):
+    # The default backlog of 5 drops concurrent connects and stalls clients for a second.
+    request_queue_size = 128
+    daemon_threads = True
+
+class FakeAzureServer:
+    """
+    Fake ARM / Azure Monitor endpoint.
+
+    Attributes:
+        instances: Resource objects keyed by lower-cased resource ID.
+        metrics: Per-resource dict of metric name to a list of datapoint values.
+        latency: Seconds to sleep before answering each request.
+        page_size: Number of instances per page of a subscription listing.
+        requests: Paths of every request received, in arrival order.
+        authorizations: Distinct Authorization headers received (None for requests without one).
+        max_in_flight: Highest number of requests handled concurrently.
+        throttle_in_flight: If set, requests arriving while this many are already
+            in flight are answered 429, as a service whose budget is spent would.
+        throttle_next: Number of upcoming requests to answer 429 regardless.
+        retry_after: Seconds sent in the Retry-After header of 429s, or None for no header.
+        throttled: Number of requests answered 429.
+        updating_reads: Number of GETs after a PATCH during which the instance
+            reports the 'Updating' provisioning state, as a long-running SKU change does.
+        fail_updates: Lower-cased resource IDs whose PATCH is answered 500.
+        overlapping_updates: Number of PATCHes that arrived while another PATCH
+            of the same instance was still being handled.
+        max_concurrent_updates: Highest number of PATCHes handled at once, across instances.
+    """
+
+    def __init__(self, instances: List[Dict[str, Any]], metrics: Optional[Dict[str, Dict[str, List[float]]]] = None,
+                 latency: float = 0.0, page_size: int = 100, throttle_in_flight: Optional[int] = None,
+                 retry_after: Optional[float] = None):
+        self.instances = {i["id"].lower(): i for i in instances}
+        self.metrics = metrics or {}
+        self.latency = latency
+        self.page_size = page_size
+        self.requests: List[str] = []
+        self.authorizations: Set[Optional[str]] = set()
+        self.max_in_flight = 0
+        self.throttle_in_flight = throttle_in_flight
+        self.throttle_next = 0
+        self.retry_after = retry_after
+        self.throttled = 0
+        self.updating_reads = 0
+        self.fail_updates: Set[str] = set()
+        self.overlapping_updates = 0
+        self.max_concurrent_updates = 0
+        self._updating: Dict[str, int] = {}
+        self._patching: Set[str] = set()
+        self._updates_in_flight = 0
+        self._in_flight = 0
+        self._lock = threading.Lock()
+        self._server = _Server(("127.0.0.1", 0), self._make_handler())
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def __enter__(self) -> "FakeAzureServer":
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    # --- Request handling ---
+
+    def handle_get(self, path: str, query: Dict[str, List[str]]):
+        """Returns (status, body, headers) for a GET request."""
+        if path.endswith("/providers/microsoft.insights/metrics"):
+            resource_id = path[: -len("/providers/microsoft.insights/metrics")]
+            names = query.get("metricnames", [""])[0].split(",")
+            series = self.metrics.get(resource_id, {})
+            return 200, {"value": [
+                {"name": {"value": name},
+                 "timeseries": [{"data": [{"maximum": v} for v in series.get(name, [])]}]}
+                for name in names
+            ]}, {}
+        if path.endswith("/providers/microsoft.apimanagement/service"):
+            subscription_id = path.split("/")[2]
+            owned = [i for rid, i in sorted(self.instances.items()) if rid.split("/")[2] == subscription_id]
+            skip = int(query.get("$skiptoken", ["0"])[0])
+            body: Dict[str, Any] = {"value": owned[skip: skip + self.page_size]}
+            if skip + self.page_size < len(owned):
+                body["nextLink"] = f"{self.url}{path}?api-version=2022-08-01&$skiptoken={skip + self.page_size}"
+            return 200, body, {}
+        if path in self.instances:
+            with self._lock:
+                remaining = self._updating.get(path, 0)
+                if remaining:
+                    self._updating[path] = remaining - 1
+            state = "Updating" if remaining else "Succeeded"
+            instance = self.instances[path]
+            return 200, dict(instance, properties=dict(instance["properties"], provisioningState=state)), {}
+        return 404, {"error": {"code": "ResourceNotFound"}}, {}
+
+    def handle_patch(self, path: str, query: Dict[str, List[str]], body: Dict[str, Any]):
+        """Returns (status, body, headers) for a PATCH request."""
+        if path not in self.instances:
+            return 404, {"error": {"code": "ResourceNotFound"}}, {}
+        with self._lock:
+            if path in self._patching:
+                self.overlapping_updates += 1
+            self._patching.add(path)
+            self._updates_in_flight += 1
+            self.max_concurrent_updates = max(self.max_concurrent_updates, self._updates_in_flight)
+        try:
+            # Held a little longer than the request latency so overlapping updates are seen.
+            time.sleep(self.latency)
+            if path in self.fail_updates:
+                return 500, {"error": {"code": "InternalServerError"}}, {}
+            instance = self.instances[path]
+            for key, value in body.items():
+                instance[key] = {**instance.get(key, {}), **value} if isinstance(value, dict) else value
+            with self._lock:
+                self._updating[path] = self.updating_reads
+            if self.updating_reads:
+                return 202, {}, {}
+            return 200, instance, {}
+        finally:
+            with self._lock:
+                self._patching.discard(path)
+                self._updates_in_flight -= 1
+
+    def handle_post(self, path: str, query: Dict[str, List[str]], body: Dict[str, Any]):
+        """Returns (status, body, headers) for a POST request."""
+        if path == "/providers/microsoft.resourcegraph/resources":
+            subscriptions = {sid.lower() for sid in body["subscriptions"]}
+            rows = [dict(i, subscriptionId=i["id"].split("/")[2]) for rid, i in sorted(self.instances.items())
+                    if rid.split("/")[2] in subscriptions]
+            options = body.get("options", {})
+            top = options.get("$top", 1000)
+            skip = int(options.get("$skipToken", "0"))
+            page: Dict[str, Any] = {"totalRecords": len(rows), "data": rows[skip: skip + top]}
+            page["count"] = len(page["data"])
+            if skip + top < len(rows):
+                page["$skipToken"] = str(skip + top)
+            return 200, page, {}
+        return 404, {"error": {"code": "NotFound"}}, {}
+
+    def _make_handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def _respond(self, status: int, body: Any, headers: Dict[str, str]) -> None:
+                payload = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                for key, value in headers.items():
+                    self.send_header(key, value)
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def _dispatch(self, method: str) -> None:
+                parsed = urlparse(self.path)
+                with fake._lock:
+                    fake.requests.append(f"{method} {parsed.path}")
+                    fake.authorizations.add(self.headers.get("Authorization"))
+                    throttle = fake.throttle_next > 0 or (
+                        fake.throttle_in_flight is not None and fake._in_flight >= fake.throttle_in_flight)
+                    if throttle:
+                        fake.throttle_next = max(0, fake.throttle_next - 1)
+                        fake.throttled += 1
+                if throttle:
+                    headers = {} if fake.retry_after is None else {"Retry-After": str(fake.retry_after)}
+                    self.rfile.read(int(self.headers.get("Content-Length") or 0))
+                    self._respond(429, {"error": {"code": "TooManyRequests"}}, headers)
+                    return
+                with fake._lock:
+                    fake._in_flight += 1
+                    fake.max_in_flight = max(fake.max_in_flight, fake._in_flight)
+                try:
+                    if fake.latency:
+                        time.sleep(fake.latency)
+                    length = int(self.headers.get("Content-Length") or 0)
+                    body = json.loads(self.rfile.read(length)) if length else None
+                    handler = getattr(fake, f"handle_{method.lower()}")
+                    args = (parsed.path.lower(), parse_qs(parsed.query))
+                    status, response, headers = handler(*args, body) if body is not None else handler(*args)
+                finally:
+                    with fake._lock:
+                        fake._in_flight -= 1
+                self._respond(status, response, headers)
+
+            def do_GET(self) -> None:
+                self._dispatch("GET")
+
+            def do_POST(self) -> None:
+                self._dispatch("POST")
+
+            def do_PATCH(self) -> None:
+                self._dispatch("PATCH")
+
+            def log_message(self, format: str, *args: Any) -> None:
+                pass
+
+        return Handler
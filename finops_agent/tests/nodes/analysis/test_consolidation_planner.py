@@ -0,0 +1,66 @@
+import time
+import unittest
+
+from finops_agent.finops_agent.nodes.analysis import consolidation_planner
+from finops_agent.finops_agent.nodes.analysis.consolidation_planner import UNIT_LOAD_LIMIT, MAX_TARGET_UNITS, pack_candidates
+
+def _candidate(n, p95, location="eastus", vnet="None", units=1):
+    instance = {"id": f"/subscriptions/s/resourceGroups/rg/providers/Microsoft.ApiManagement/service/apim-{n}",
+                "name": f"apim-{n}", "location": location,
+                "sku": {"name": "Basic", "capacity": units}, "properties": {"virtualNetworkType": vnet}}
+    return instance, p95
+
+class TestPackCandidates(unittest.TestCase):
+
+    def test_forty_candidates_fill_the_fewest_targets(self):
+        # 40 instances at 20% need 800% of one unit: 12 units at 70% usable, so 3 four-unit targets.
+        groups = pack_candidates([_candidate(n, 20.0) for n in range(40)])
+
+        self.assertEqual(len(groups), 3)
+        self.assertEqual(sum(len(g.members) for g in groups), 40)
+        for group in groups:
+            self.assertLessEqual(group.units, MAX_TARGET_UNITS)
+            self.assertLessEqual(group.projected_capacity, UNIT_LOAD_LIMIT)
+
+    def test_best_fit_fills_the_tightest_target(self):
+        # Largest first: 200 opens a target (80 free), 150 opens another (130 free);
+        # 70 goes to the tighter first one, leaving 10; 60 then fits only the second.
+        groups = pack_candidates([_candidate(1, 60.0), _candidate(2, 200.0), _candidate(3, 150.0), _candidate(4, 70.0)])
+
+        members = [sorted(i["name"] for i, _ in g.members) for g in groups]
+        self.assertEqual(members, [["apim-2", "apim-4"], ["apim-1", "apim-3"]])
+
+    def test_region_and_vnet_are_never_mixed(self):
+        groups = pack_candidates([
+            _candidate(1, 10.0, location="eastus"), _candidate(2, 10.0, location="westus"),
+            _candidate(3, 10.0, location="eastus", vnet="External"), _candidate(4, 10.0, location="EastUS"),
+        ])
+
+        keys = sorted((g.location, g.virtual_network_type, len(g.members)) for g in groups)
+        self.assertEqual(keys, [("eastus", "External", 1), ("eastus", "None", 2), ("westus", "None", 1)])
+
+    def test_load_counts_capacity_units(self):
+        # Two units at 30% carry 60% of one unit of load.
+        group, = pack_candidates([_candidate(1, 30.0, units=2), _candidate(2, 30.0)])
+        self.assertAlmostEqual(group.load, 90.0)
+        self.assertEqual(group.units, 2)
+
+    def test_oversized_candidates_are_left_out(self):
+        with self.assertLogs(consolidation_planner.logger, "DEBUG") as logs:
+            self.assertEqual(pack_candidates([_candidate(1, 80.0, units=4)]), [])
+        self.assertIn("apim-1", logs.output[0])
+
+    def test_scales_to_thousands_of_candidates(self):
+        candidates = [_candidate(n, 5.0 + n % 25, location=f"region-{n % 4}") for n in range(20000)]
+        start = time.perf_counter()
+        groups = pack_candidates(candidates)
+        elapsed = time.perf_counter() - start
+
+        self.assertEqual(sum(len(g.members) for g in groups), 20000)
+        self.assertLess(elapsed, 2.0)
+        # Best-fit decreasing stays within a few targets of the load-based lower bound.
+        lower_bound = sum(consolidation_planner.candidate_load(*c) for c in candidates) / (MAX_TARGET_UNITS * UNIT_LOAD_LIMIT)
+        self.assertLessEqual(len(groups), lower_bound + 8)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,85 @@
+import time
+import unittest
+
+import numpy as np
+
+from finops_agent.finops_agent.nodes.analysis.fleet_frame import FleetFrame, Rule, SKU_CODES, UNKNOWN_SKU, evaluate_rules
+from finops_agent.finops_agent.nodes.analysis.tier_rightsizing import evaluate_frame, METRIC_NAMES
+
+def _props(name, sku="Basic", vnet="None", additional_locations=None, capacity=1):
+    return {"name": name, "sku": {"name": sku, "capacity": capacity},
+            "properties": {"virtualNetworkType": vnet, "additionalLocations": additional_locations or []}}
+
+class TestFleetFrame(unittest.TestCase):
+
+    def test_columns(self):
+        frame = FleetFrame(["r1", "r2", "r3"],
+                           [_props("a", "Premium", "External", [{"location": "westus"}]), _props("b"), {}],
+                           [{"Capacity": 12.5}, {}, {"Capacity": 90.0}])
+
+        self.assertEqual(frame.names, ["a", "b", "unknown"])
+        self.assertEqual(frame.sku.tolist(), [SKU_CODES["Premium"], SKU_CODES["Basic"], UNKNOWN_SKU])
+        # A missing virtualNetworkType is not 'None', as in the per-resource rules.
+        self.assertEqual(frame.vnet.tolist(), [True, False, True])
+        self.assertEqual(frame.region_count.tolist(), [2, 1, 1])
+        self.assertTrue(np.isnan(frame.metric("Capacity")[1]))
+        self.assertTrue(np.isnan(frame.metric("Requests")).all())
+
+    def test_malformed_rows_are_left_out(self):
+        with self.assertLogs("finops_agent.finops_agent.nodes.analysis.fleet_frame", "WARNING") as logs:
+            frame = FleetFrame(["r1", "r2", "r3", "r4"],
+                               [_props("a"), {"name": "b", "sku": {"name": "Basic", "capacity": "two"}}, _props("c"), _props("d")],
+                               [{"Capacity": 10.0}, {"Capacity": 20.0}, {"Capacity": "n/a"}, {"Capacity": None}])
+
+        self.assertEqual(len(logs.output), 2)
+        self.assertEqual(frame.resource_ids, ["r1", "r4"])
+        self.assertEqual(frame.names, ["a", "d"])
+        self.assertEqual(frame.capacity.tolist(), [1, 1])
+        self.assertEqual(frame.metric("Capacity")[0], 10.0)
+        self.assertTrue(np.isnan(frame.metric("Capacity")[1]))
+
+    def test_rules_apply_in_table_order(self):
+        rules = [Rule("second", lambda f: f.capacity > 0, lambda f, row: {"id": f"second-{row}"}),
+                 Rule("first", lambda f: f.sku == SKU_CODES["Basic"], lambda f, row: {"id": f"first-{row}"})]
+        frame = FleetFrame(["r1", "r2"], [_props("a"), _props("b", "Premium")], [{}, {}])
+
+        self.assertEqual(evaluate_rules(frame, rules), {0: [{"id": "second-0"}, {"id": "first-0"}], 1: [{"id": "second-1"}]})
+
+class TestEvaluateFrame(unittest.TestCase):
+
+    def test_matches_each_rightsizing_rule(self):
+        frame = FleetFrame(
+            ["low", "prem", "multi", "missing", "smallest"],
+            [_props("low", capacity=3), _props("prem", "Premium", "Internal"),
+             _props("multi", "Premium", "External", [{"location": "westus"}]), _props("missing"), _props("smallest")],
+            [{"Capacity": 20.0}, {"Capacity": 80.0}, {"Capacity": 80.0}, {}, {"Capacity": 20.0}],
+            METRIC_NAMES)
+
+        results = evaluate_frame(frame)
+        ids = {row: [rec["id"] for rec in recs] for row, recs in results.items()}
+        # One unit is the smallest size of a tier, so nothing is left to scale down.
+        self.assertEqual(ids, {0: ["REC-TR-low"], 1: ["REC-PREM-VNET-prem"]})
+        payload = results[0][0]["payload"]
+        self.assertEqual((payload["current_sku"], payload["current_units"], payload["recommended_units"]), ("Basic", 3, 2))
+        self.assertNotIn("recommended_sku", payload)
+        self.assertAlmostEqual(payload["estimated_monthly_saving"], 147.17)
+
+    def test_100k_rows_build_and_evaluate_in_under_a_second(self):
+        size = 100_000
+        resource_ids = [f"r{n}" for n in range(size)]
+        properties = [{"name": f"apim-{n}", "location": "eastus", "sku": {"name": "Standard", "capacity": 2},
+                       "properties": {"virtualNetworkType": "None", "additionalLocations": []}} for n in range(size)]
+        # Only one row matches, so few recommendations are built.
+        metrics = [{"Capacity": 80.0} for _ in range(size)]
+        metrics[12345] = {"Capacity": 10.0}
+
+        start = time.perf_counter()
+        results = evaluate_frame(FleetFrame(resource_ids, properties, metrics, METRIC_NAMES))
+        elapsed = time.perf_counter() - start
+
+        self.assertEqual(list(results), [12345])
+        self.assertEqual(results[12345][0]["id"], "REC-TR-apim-12345")
+        self.assertLess(elapsed, 1.0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,10 +1,15 @@
 import unittest
 from unittest.mock import patch
 
-from finops_agent.finops_agent.nodes.analysis.instance_consolidation import instance_consolidation_analysis_node
+from finops_agent.finops_agent.tools import azure
+from finops_agent.finops_agent.nodes.analysis.instance_consolidation import build_consolidation_recommendations, instance_consolidation_analysis_node
 
 class TestInstanceConsolidationAnalysisNode(unittest.TestCase):
 
+    def setUp(self):
+        # Cached responses from other tests would bypass the patched tool functions.
+        azure.clear_cache()
+
     @patch('finops_agent.finops_agent.tools.azure.get_apim_metrics')
     @patch('finops_agent.finops_agent.tools.azure.list_all_apim_instances')
     def test_consolidation_recommendation_success(self, mock_list_instances, mock_get_metrics):
@@ -21,16 +26,15 @@ class TestInstanceConsolidationAnalysisNode(unittest.TestCase):
             {"id": "/sub/rg/apim-4", "name": "apim-4", "sku": {"name": "Basic"}}, # Healthy
         ]
 
-        # Mock the metrics for each instance. Use side_effect for different return values.
-        mock_get_metrics.side_effect = [
-            {"Capacity": 15.0}, # apim-1 is underutilized
-            {"Capacity": 25.0}, # apim-2 is underutilized
-            # No metrics call for apim-3 as it's skipped by SKU
-            {"Capacity": 70.0}, # apim-4 is healthy
-            # Metrics are fetched again when calculating total capacity
-            {"Capacity": 15.0},
-            {"Capacity": 25.0},
-        ]
+        # Mock the metrics for each instance. Metrics are fetched concurrently,
+        # so the side_effect looks them up by resource ID rather than call order.
+        metrics_by_id = {
+            "/sub/rg/apim-1": {"Capacity": 15.0}, # apim-1 is underutilized
+            "/sub/rg/apim-2": {"Capacity": 25.0}, # apim-2 is underutilized
+            # No metrics for apim-3 as it's skipped by SKU
+            "/sub/rg/apim-4": {"Capacity": 70.0}, # apim-4 is healthy
+        }
+        mock_get_metrics.side_effect = lambda resource_id, *args: metrics_by_id[resource_id]
 
         initial_state = {
             "resources": ["/sub/rg/apim-1"], # Needed to get subscription ID
@@ -49,6 +53,8 @@ class TestInstanceConsolidationAnalysisNode(unittest.TestCase):
         self.assertIn("/sub/rg/apim-2", rec["payload"]["candidate_instances"])
         self.assertEqual(rec["payload"]["migration_complexity_score"], "Low")
         self.assertEqual(rec["payload"]["estimated_capacity_for_new_instance"], "40.00%")
+        # Each eligible instance's metrics are fetched exactly once.
+        self.assertEqual(mock_get_metrics.call_count, 3)
 
     @patch('finops_agent.finops_agent.tools.azure.get_apim_metrics')
     @patch('finops_agent.finops_agent.tools.azure.list_all_apim_instances')
@@ -61,10 +67,11 @@ class TestInstanceConsolidationAnalysisNode(unittest.TestCase):
             {"id": "/sub/rg/apim-1", "name": "apim-1", "sku": {"name": "Basic"}},
             {"id": "/sub/rg/apim-2", "name": "apim-2", "sku": {"name": "Standard"}},
         ]
-        mock_get_metrics.side_effect = [
-            {"Capacity": 15.0}, # apim-1 is underutilized
-            {"Capacity": 80.0}, # apim-2 is healthy
-        ]
+        metrics_by_id = {
+            "/sub/rg/apim-1": {"Capacity": 15.0}, # apim-1 is underutilized
+            "/sub/rg/apim-2": {"Capacity": 80.0}, # apim-2 is healthy
+        }
+        mock_get_metrics.side_effect = lambda resource_id, *args: metrics_by_id[resource_id]
         initial_state = {"resources": ["/sub/rg/apim-1"], "recommendations": []}
 
         # --- Act ---
@@ -73,5 +80,65 @@ class TestInstanceConsolidationAnalysisNode(unittest.TestCase):
         # --- Assert ---
         self.assertEqual(len(result_state["recommendations"]), 0)
 
+    @patch('finops_agent.finops_agent.tools.azure.get_apim_metrics')
+    @patch('finops_agent.finops_agent.tools.azure.list_all_apim_instances')
+    def test_candidates_are_packed_into_right_sized_targets(self, mock_list_instances, mock_get_metrics):
+        """
+        Tests that many candidates are split into several right-sized targets,
+        one recommendation each, rather than summed into one oversized target.
+        """
+        # --- Arrange ---
+        instances = [{"id": f"/sub/rg/apim-{n}", "name": f"apim-{n}", "location": "eastus",
+                      "sku": {"name": "Standard", "capacity": 1}, "properties": {"virtualNetworkType": "None"}}
+                     for n in range(40)]
+        # One instance in another region has no compatible partner.
+        instances.append({"id": "/sub/rg/apim-west", "name": "apim-west", "location": "westus",
+                          "sku": {"name": "Basic", "capacity": 1}, "properties": {"virtualNetworkType": "None"}})
+        mock_list_instances.return_value = instances
+        mock_get_metrics.side_effect = lambda resource_id, *args: {"Capacity": 20.0}
+        initial_state = {"resources": ["/sub/rg/apim-1"], "recommendations": []}
+
+        # --- Act ---
+        result_state = instance_consolidation_analysis_node(initial_state)
+
+        # --- Assert ---
+        recs = result_state["recommendations"]
+        self.assertEqual(len(recs), 3)
+        self.assertEqual(len({rec["id"] for rec in recs}), 3)
+        self.assertEqual(sum(len(rec["payload"]["candidate_instances"]) for rec in recs), 40)
+        for rec in recs:
+            self.assertEqual(rec["payload"]["target_location"], "eastus")
+            self.assertLessEqual(rec["payload"]["recommended_units"], 4)
+            self.assertLessEqual(float(rec["payload"]["estimated_capacity_for_new_instance"].rstrip("%")), 70.0)
+
+    @patch('finops_agent.finops_agent.tools.azure.get_apim_metrics', return_value={"Capacity": 10.0})
+    @patch('finops_agent.finops_agent.tools.azure.list_all_apim_instances')
+    def test_candidates_keep_the_subscription_they_were_listed_under(self, mock_list_instances, mock_get_metrics):
+        # ARM returns the subscription lower-cased in resource IDs.
+        mock_list_instances.return_value = [
+            {"id": f"/subscriptions/sub-a/resourceGroups/rg/providers/Microsoft.ApiManagement/service/apim-{n}",
+             "name": f"apim-{n}", "sku": {"name": "Basic"}} for n in range(2)]
+
+        result_state = instance_consolidation_analysis_node({"subscription_ids": ["SUB-A"], "resources": [], "recommendations": []})
+
+        self.assertEqual([rec["resource_id"] for rec in result_state["recommendations"]], ["SUB-A"])
+        self.assertTrue(result_state["recommendations"][0]["id"].startswith("REC-CONSOLIDATE-SUB-A-"))
+
+    def test_recommendation_ids_depend_only_on_their_members(self):
+        """Tests that a target keeps its ID when the targets packed before it change."""
+        def candidate(n, p95):
+            return ({"id": f"/sub/rg/apim-{n}", "name": f"apim-{n}", "location": "eastus",
+                     "sku": {"name": "Basic", "capacity": 1}, "properties": {"virtualNetworkType": "None"}}, p95)
+
+        # 200% and 70% share the first target, 150% and 60% the second.
+        both = build_consolidation_recommendations("sub", [candidate(1, 200.0), candidate(2, 150.0), candidate(3, 70.0), candidate(4, 60.0)])
+        second_only = build_consolidation_recommendations("sub", [candidate(4, 60.0), candidate(2, 150.0)])
+
+        self.assertEqual(len(both), 2)
+        self.assertEqual(second_only[0]["payload"]["candidate_instances"], ["/sub/rg/apim-2", "/sub/rg/apim-4"])
+        self.assertIn(second_only[0]["id"], {rec["id"] for rec in both})
+        self.assertNotEqual(both[0]["id"], both[1]["id"])
+        self.assertEqual(second_only[0]["payload"]["current_skus"], {"/sub/rg/apim-2": "Basic", "/sub/rg/apim-4": "Basic"})
+
 if __name__ == '__main__':
     unittest.main()
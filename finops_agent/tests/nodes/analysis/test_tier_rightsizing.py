@@ -2,10 +2,15 @@ import unittest
 from unittest.mock import patch, MagicMock
 
 # The function we want to test
+from finops_agent.finops_agent.tools import azure
 from finops_agent.finops_agent.nodes.analysis.tier_rightsizing import tier_rightsizing_analysis_node
 
 class TestTierRightsizingAnalysisNode(unittest.TestCase):
 
+    def setUp(self):
+        # Cached responses from other tests would bypass the patched tool functions.
+        azure.clear_cache()
+
     # Use patch to replace the real azure tool functions with mocks during the tests
     @patch('finops_agent.finops_agent.tools.azure.get_apim_metrics')
     @patch('finops_agent.finops_agent.tools.azure.get_apim_properties')
@@ -17,7 +22,7 @@ class TestTierRightsizingAnalysisNode(unittest.TestCase):
         # Configure the mock return values for our Azure tool functions
         mock_get_properties.return_value = {
             "name": "apim-test-prod",
-            "sku": {"name": "Premium", "capacity": 1},
+            "sku": {"name": "Premium", "capacity": 2},
             "properties": {
                 "virtualNetworkType": "External", # VNet is enabled
                 "additionalLocations": [] # Multi-region is disabled
@@ -44,12 +49,17 @@ class TestTierRightsizingAnalysisNode(unittest.TestCase):
         # Check the details of the first recommendation (underutilization)
         rec1 = result_state["recommendations"][0]
         self.assertEqual(rec1["type"], "TIER_CHANGE")
-        self.assertIn("sustained 95th percentile Capacity of 20.0%", rec1["details"])
+        self.assertIn("sustained 95th percentile Capacity of 20%", rec1["details"])
+        # Two Premium units to one, at the built-in list prices; the tier and its VNet are kept.
+        self.assertNotIn("recommended_sku", rec1["payload"])
+        self.assertEqual((rec1["payload"]["current_units"], rec1["payload"]["recommended_units"]), (2, 1))
+        self.assertEqual(rec1["payload"]["estimated_monthly_saving"], 2795.17)
 
         # Check the details of the second recommendation (Premium to Standard_v2)
         rec2 = result_state["recommendations"][1]
         self.assertEqual(rec2["type"], "TIER_CHANGE")
         self.assertEqual(rec2["payload"]["recommended_sku"], "Standard_v2")
+        self.assertEqual(rec2["payload"]["estimated_monthly_saving"], 4190.34)
 
     @patch('finops_agent.finops_agent.tools.azure.get_apim_metrics')
     @patch('finops_agent.finops_agent.tools.azure.get_apim_properties')
@@ -74,6 +84,59 @@ class TestTierRightsizingAnalysisNode(unittest.TestCase):
         # --- Assert ---
         self.assertEqual(len(result_state["recommendations"]), 0)
 
+    @patch('finops_agent.finops_agent.tools.azure.get_apim_metrics')
+    @patch('finops_agent.finops_agent.tools.azure.get_apim_properties')
+    def test_failed_resource_does_not_stop_batch(self, mock_get_properties, mock_get_metrics):
+        """
+        Tests that a resource whose properties cannot be fetched is skipped while
+        the rest of the batch is still analyzed.
+        """
+        # --- Arrange ---
+        def get_properties(resource_id):
+            if resource_id.endswith("apim-broken"):
+                raise RuntimeError("throttled")
+            return {
+                "name": "apim-low",
+                "sku": {"name": "Standard", "capacity": 2},
+                "properties": {"virtualNetworkType": "None", "additionalLocations": []}
+            }
+        mock_get_properties.side_effect = get_properties
+        mock_get_metrics.return_value = {"Capacity": 10.0}
+        initial_state = {"resources": ["/sub/rg/apim-broken", "/sub/rg/apim-low"], "recommendations": []}
+
+        # --- Act ---
+        result_state = tier_rightsizing_analysis_node(initial_state)
+
+        # --- Assert ---
+        self.assertEqual(len(result_state["recommendations"]), 1)
+        self.assertEqual(result_state["recommendations"][0]["resource_id"], "/sub/rg/apim-low")
+
+    @patch('finops_agent.finops_agent.tools.azure.get_apim_metrics')
+    @patch('finops_agent.finops_agent.tools.azure.get_apim_properties')
+    def test_malformed_resource_does_not_stop_batch(self, mock_get_properties, mock_get_metrics):
+        """
+        Tests that a resource whose properties cannot be converted is skipped
+        while the rest of the batch is still analyzed.
+        """
+        # --- Arrange ---
+        def get_properties(resource_id):
+            name = resource_id.split("/")[-1]
+            return {
+                "name": name,
+                "sku": {"name": "Standard", "capacity": "two" if name == "apim-malformed" else 2},
+                "properties": {"virtualNetworkType": "None", "additionalLocations": []}
+            }
+        mock_get_properties.side_effect = get_properties
+        mock_get_metrics.return_value = {"Capacity": 10.0}
+        initial_state = {"resources": ["/sub/rg/apim-malformed", "/sub/rg/apim-low"], "recommendations": []}
+
+        # --- Act ---
+        with self.assertLogs("finops_agent.finops_agent.nodes.analysis.fleet_frame", "WARNING"):
+            result_state = tier_rightsizing_analysis_node(initial_state)
+
+        # --- Assert ---
+        self.assertEqual([rec["resource_id"] for rec in result_state["recommendations"]], ["/sub/rg/apim-low"])
+
     def test_no_resources(self):
         """
         Tests that the node runs correctly when there are no resources to analyze.
@@ -0,0 +1,186 @@
+import os
+import tempfile
+import unittest
+
+from finops_agent.finops_agent import recommendation_store
+from finops_agent.finops_agent.nodes.execution.remediation import (
+    CONSOLIDATED_INTO_TAG, batch_by_resource_group, check_target_tier, plan_changes)
+from finops_agent.finops_agent.orchestrator import build_remediation_graph
+from finops_agent.finops_agent.recommendation_store import Recommendation
+from finops_agent.finops_agent.tools import azure
+from finops_agent.tests.fake_azure import FakeAzureServer, make_instance
+
+SUBSCRIPTION_ID = "sub-1"
+
+def _tier_change(instance, recommended_sku=None, rec_id=None):
+    """Recommends `recommended_sku`, or without it one capacity unit less."""
+    payload = {"current_sku": instance["sku"]["name"], "current_units": instance["sku"]["capacity"]}
+    if recommended_sku:
+        payload["recommended_sku"] = recommended_sku
+    else:
+        payload["recommended_units"] = instance["sku"]["capacity"] - 1
+    return {"id": rec_id or f"REC-TR-{instance['name']}", "type": "TIER_CHANGE", "resource_id": instance["id"],
+            "details": "", "status": "approved", "source_node": "TierRightsizingAnalysisNode", "payload": payload}
+
+class TestPlanChanges(unittest.TestCase):
+
+    def test_tier_change_targets(self):
+        premium = make_instance(SUBSCRIPTION_ID, "a", sku="Premium", capacity=2)
+        fewer_units = plan_changes(Recommendation.from_dict(_tier_change(premium)))[0]
+        self.assertEqual((fewer_units.sku_name, fewer_units.capacity, fewer_units.expected_capacity), ("Premium", 1, 2))
+        explicit = plan_changes(Recommendation.from_dict(_tier_change(premium, "Standard_v2")))[0]
+        self.assertEqual((explicit.sku_name, explicit.capacity, explicit.expected_sku), ("Standard_v2", None, "Premium"))
+        # Older recommendations without a target are not given one.
+        with self.assertRaises(ValueError):
+            plan_changes(Recommendation("REC-OLD", "TIER_CHANGE", premium["id"], payload={"current_sku": "Premium"}))
+
+    def test_target_tier_must_keep_vnet_and_regions(self):
+        check_target_tier(make_instance(SUBSCRIPTION_ID, "a", sku="Premium", vnet="External"), "Standard_v2")
+        with self.assertRaises(ValueError):
+            check_target_tier(make_instance(SUBSCRIPTION_ID, "b", sku="Premium", vnet="External"), "Standard")
+        with self.assertRaises(ValueError):
+            check_target_tier(make_instance(SUBSCRIPTION_ID, "c", sku="Premium",
+                                            additional_locations=[{"location": "westus"}]), "Standard_v2")
+
+    def test_consolidation_scales_host_and_tags_the_rest(self):
+        rec = Recommendation("REC-C", "INSTANCE_CONSOLIDATE", SUBSCRIPTION_ID, payload={
+            "candidate_instances": ["/x/host", "/x/other"], "current_skus": {"/x/host": "Basic", "/x/other": "Basic"},
+            "recommended_sku": "Standard", "recommended_units": 2})
+        host, other = plan_changes(rec)
+
+        self.assertEqual((host.resource_id, host.sku_name, host.capacity), ("/x/host", "Standard", 2))
+        self.assertEqual(host.expected_sku, "Basic")
+        self.assertEqual(other.tags, {CONSOLIDATED_INTO_TAG: "/x/host"})
+
+    def test_batches_by_subscription_and_resource_group(self):
+        instances = [make_instance(SUBSCRIPTION_ID, name, sku="Premium", capacity=2) for name in ("a", "b")]
+        batches = batch_by_resource_group(Recommendation.from_dict(_tier_change(i)) for i in instances)
+        self.assertEqual(sorted(batches), ["sub-1/rg-a", "sub-1/rg-b"])
+
+class TestRemediationWorkflow(unittest.TestCase):
+
+    def setUp(self):
+        azure.clear_cache()
+        self.tmp = tempfile.TemporaryDirectory()
+        self.state = {"recommendation_store_path": os.path.join(self.tmp.name, "recommendations.sqlite"),
+                      "update_poll_seconds": 0.01}
+        self.store = recommendation_store.open_recommendation_store(self.state["recommendation_store_path"])
+
+    def tearDown(self):
+        azure.configure_client(None)
+        recommendation_store.close_recommendation_stores()
+        self.tmp.cleanup()
+
+    def _patches(self, server):
+        return [r for r in server.requests if r.startswith("PATCH")]
+
+    def test_dry_run_changes_nothing(self):
+        fleet = [make_instance(SUBSCRIPTION_ID, "a", sku="Premium", capacity=2)]
+        self.store.upsert(_tier_change(fleet[0]))
+        with FakeAzureServer(fleet) as server:
+            azure.configure_client(server.url)
+            final_state = build_remediation_graph().invoke({**self.state, "dry_run": True})
+
+        self.assertEqual(final_state["remediation_report"], {"planned": 1})
+        self.assertEqual(final_state["remediation_results"][0]["changes"][0]["patch"],
+                         {"sku": {"name": "Premium", "capacity": 1}})
+        self.assertEqual(self._patches(server), [])
+        self.assertEqual(self.store.get("REC-TR-a").status, "approved")
+
+    def test_applies_in_parallel(self):
+        """
+        Tests that independent changes overlap, but never more than
+        `max_parallel_changes` at once.
+        """
+        fleet = [make_instance(SUBSCRIPTION_ID, f"apim-{n:03d}", sku="Premium", capacity=2) for n in range(40)]
+        self.store.upsert_many(_tier_change(i) for i in fleet)
+        with FakeAzureServer(fleet, latency=0.05) as server:
+            azure.configure_client(server.url)
+            final_state = build_remediation_graph().invoke({**self.state, "max_parallel_changes": 8})
+
+        self.assertEqual(final_state["remediation_report"], {"applied": 40})
+        self.assertEqual({(i["sku"]["name"], i["sku"]["capacity"]) for i in server.instances.values()}, {("Premium", 1)})
+        self.assertEqual(len(self.store.find(status="applied")), 40)
+        self.assertGreater(server.max_concurrent_updates, 1)
+        self.assertLessEqual(server.max_concurrent_updates, 8)
+
+    def test_changes_to_one_instance_never_overlap(self):
+        instance = make_instance(SUBSCRIPTION_ID, "a", sku="Premium", capacity=2, vnet="External")
+        self.store.upsert_many([_tier_change(instance), _tier_change(instance, "Standard_v2", rec_id="REC-PREM-VNET-a")])
+        with FakeAzureServer([instance], latency=0.05) as server:
+            azure.configure_client(server.url)
+            final_state = build_remediation_graph().invoke(self.state)
+
+        self.assertEqual(server.overlapping_updates, 0)
+        # Whichever ran second found the instance changed under it.
+        self.assertEqual(sorted(final_state["remediation_report"].items()), [("applied", 1), ("stale", 1)])
+
+    def test_rerun_after_failure_does_not_redo_finished_changes(self):
+        fleet = [make_instance(SUBSCRIPTION_ID, f"apim-{n}", sku="Premium", capacity=2) for n in range(3)]
+        self.store.upsert_many(_tier_change(i) for i in fleet)
+        with FakeAzureServer(fleet) as server:
+            azure.configure_client(server.url)
+            server.fail_updates.add(fleet[0]["id"].lower())
+            first = build_remediation_graph().invoke(self.state)
+            patches_before = len(self._patches(server))
+
+            # The failed recommendation is approved again after review.
+            server.fail_updates.clear()
+            self.store.set_status("REC-TR-apim-0", "approved")
+            second = build_remediation_graph().invoke(self.state)
+
+        self.assertEqual(sorted(first["remediation_report"].items()), [("applied", 2), ("failed", 1)])
+        self.assertEqual(second["remediation_report"], {"applied": 1})
+        self.assertEqual(len(self._patches(server)) - patches_before, 1)
+
+    def test_waits_for_long_running_update(self):
+        fleet = [make_instance(SUBSCRIPTION_ID, "a", sku="Premium", capacity=2)]
+        self.store.upsert(_tier_change(fleet[0]))
+        with FakeAzureServer(fleet) as server:
+            azure.configure_client(server.url)
+            server.updating_reads = 2
+            final_state = build_remediation_graph().invoke(self.state)
+
+        self.assertEqual(final_state["remediation_report"], {"applied": 1})
+        # One read before the update, then two polls while it runs and one after it ended.
+        self.assertEqual(len([r for r in server.requests if r.startswith("GET")]), 4)
+
+    def test_consolidation_with_a_deleted_member_is_stale(self):
+        host, other = (make_instance(SUBSCRIPTION_ID, name) for name in ("host", "other"))
+        self.store.upsert({"id": "REC-C", "type": "INSTANCE_CONSOLIDATE", "resource_id": SUBSCRIPTION_ID,
+                           "status": "approved", "payload": {
+                               "candidate_instances": [host["id"], other["id"]],
+                               "current_skus": {host["id"]: "Basic", other["id"]: "Basic"},
+                               "recommended_sku": "Standard", "recommended_units": 1}})
+        with FakeAzureServer([host]) as server:
+            azure.configure_client(server.url)
+            final_state = build_remediation_graph().invoke(self.state)
+
+        self.assertEqual(final_state["remediation_report"], {"stale": 1})
+        self.assertIn("no longer exists", final_state["remediation_results"][0]["detail"])
+        self.assertEqual(self._patches(server), [])
+
+    def test_tier_that_drops_the_vnet_is_refused(self):
+        instance = make_instance(SUBSCRIPTION_ID, "a", sku="Premium", vnet="External")
+        self.store.upsert(_tier_change(instance, "Standard"))
+        with FakeAzureServer([instance]) as server:
+            azure.configure_client(server.url)
+            final_state = build_remediation_graph().invoke(self.state)
+
+        self.assertEqual(final_state["remediation_report"], {"failed": 1})
+        self.assertIn("virtual network", final_state["remediation_results"][0]["detail"])
+        self.assertEqual(self._patches(server), [])
+
+    def test_update_that_never_finishes_fails(self):
+        fleet = [make_instance(SUBSCRIPTION_ID, "a", sku="Premium", capacity=2)]
+        self.store.upsert(_tier_change(fleet[0]))
+        with FakeAzureServer(fleet) as server:
+            azure.configure_client(server.url)
+            server.updating_reads = 1000
+            final_state = build_remediation_graph().invoke({**self.state, "update_timeout_seconds": 0.1})
+
+        self.assertEqual(final_state["remediation_report"], {"failed": 1})
+        self.assertEqual(self.store.get("REC-TR-a").status, "failed")
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,132 @@
+import json
+import os
+import subprocess
+import tempfile
+import time
+import unittest
+from unittest.mock import patch
+
+from finops_agent.finops_agent import audit_log
+from finops_agent.finops_agent.orchestrator import build_graph
+
+def _commit_count(repo_dir: str) -> int:
+    out = subprocess.run(["git", "rev-list", "--count", "HEAD"], cwd=repo_dir, check=True, capture_output=True, text=True)
+    return int(out.stdout)
+
+class TestGitAuditLog(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.repo_dir = os.path.join(self.tmp.name, "audit")
+
+    def tearDown(self):
+        audit_log.close_audit_logs()
+        self.tmp.cleanup()
+
+    def test_records_are_committed_in_batches(self):
+        log = audit_log.GitAuditLog(self.repo_dir, batch_size=10, flush_interval=60)
+        for n in range(25):
+            log.record(f"REC-{n}", {"n": n})
+        self.assertTrue(log.flush(timeout=30))
+        log.close()
+
+        # Two full batches, then the remainder on flush.
+        self.assertEqual(_commit_count(self.repo_dir), 3)
+        self.assertEqual(log.stats.records_written, 25)
+        with open(os.path.join(self.repo_dir, audit_log.RECOMMENDATIONS_DIR, "REC-7.json")) as f:
+            self.assertEqual(json.load(f), {"n": 7})
+
+    def test_one_commit_per_run_without_batch_size(self):
+        log = audit_log.GitAuditLog(self.repo_dir, batch_size=None, flush_interval=60)
+        for n in range(50):
+            log.record(f"REC-{n}", {"n": n})
+        log.flush(timeout=30)
+        log.close()
+
+        self.assertEqual(_commit_count(self.repo_dir), 1)
+
+    def test_quiet_interval_does_not_commit_without_batch_size(self):
+        log = audit_log.GitAuditLog(self.repo_dir, batch_size=None, flush_interval=0.01)
+        log.record("REC-1", {})
+        time.sleep(0.1)
+        self.assertEqual(log.stats.commits, 0)
+        log.record("REC-2", {})
+        log.flush(timeout=30)
+        log.close()
+
+        self.assertEqual(_commit_count(self.repo_dir), 1)
+        self.assertEqual(log.stats.records_written, 2)
+
+    def test_writer_survives_unexpected_errors(self):
+        log = audit_log.GitAuditLog(self.repo_dir, batch_size=1, flush_interval=60)
+        real_commit = log._commit
+
+        def commit(batch):
+            if batch and batch[0][0] == "REC-1":
+                raise ValueError("bad record")
+            real_commit(batch)
+
+        with patch.object(log, "_commit", side_effect=commit):
+            log.record("REC-1", {})
+            log.record("REC-2", {})
+            self.assertTrue(log.flush(timeout=30))
+            log.close()
+
+        self.assertEqual(log.stats.errors, 1)
+        self.assertEqual(log.stats.records_written, 1)
+        self.assertEqual(log.last_error, "bad record")
+
+    def test_record_does_not_wait_for_git(self):
+        log = audit_log.GitAuditLog(self.repo_dir, batch_size=1, flush_interval=60)
+        slow_commit = lambda batch: time.sleep(0.2)
+        with patch.object(log, "_commit", side_effect=slow_commit):
+            start = time.perf_counter()
+            for n in range(5):
+                log.record(f"REC-{n}", {"n": n})
+            elapsed = time.perf_counter() - start
+            log.close()
+
+        self.assertLess(elapsed, 0.1)
+
+    def test_git_failure_is_counted_not_raised(self):
+        # A file where the repository directory should be makes every commit fail.
+        open(self.repo_dir, "w").close()
+        log = audit_log.GitAuditLog(self.repo_dir, batch_size=None, flush_interval=60)
+        log.record("REC-1", {})
+        log.flush(timeout=30)
+        log.close()
+
+        self.assertEqual(log.stats.errors, 1)
+        self.assertIsNotNone(log.last_error)
+
+    def test_ids_are_made_safe_for_filenames(self):
+        self.assertEqual(audit_log._safe_filename("REC-CONSOLIDATE-/sub/x"), "REC-CONSOLIDATE-_sub_x.json")
+
+    def test_audited_node_keeps_the_nodes_metadata(self):
+        def analysis_node(state):
+            """Finds nothing."""
+            return {"recommendations": []}
+        node = audit_log.audited("analysis", analysis_node)
+
+        self.assertEqual((node.__name__, node.__doc__, node.__wrapped__), ("analysis_node", "Finds nothing.", analysis_node))
+        self.assertEqual(node({}), {"recommendations": []})
+
+class TestGraphAuditLog(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        audit_log.close_audit_logs()
+        self.tmp.cleanup()
+
+    def test_finalize_flushes_the_runs_recommendations(self):
+        repo_dir = os.path.join(self.tmp.name, "audit")
+        final_state = build_graph().invoke({"resources": [], "recommendations": [], "git_log_dir": repo_dir})
+
+        files = os.listdir(os.path.join(repo_dir, audit_log.RECOMMENDATIONS_DIR))
+        self.assertEqual(len(files), len(final_state["recommendations"]))
+        self.assertGreaterEqual(_commit_count(repo_dir), 1)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,110 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from finops_agent.finops_agent import checkpoint
+from finops_agent.finops_agent.nodes.analysis import tier_rightsizing
+from finops_agent.finops_agent.orchestrator import run_analysis
+from finops_agent.finops_agent.tools import azure
+
+SUBSCRIPTION_ID = "sub-1"
+
+class TestProgressStore(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "checkpoints.sqlite")
+
+    def tearDown(self):
+        checkpoint.close_checkpoint_stores()
+        self.tmp.cleanup()
+
+    def test_progress_survives_reopening(self):
+        store = checkpoint.ProgressStore(self.path)
+        store.record("run-1", "node", {"r1": checkpoint.ChunkResult({"Capacity": 10.0}, [{"id": "REC-1"}])})
+        store.close()
+
+        progress = checkpoint.NodeProgress(checkpoint.ProgressStore(self.path), "run-1", "node")
+        self.assertEqual(progress.pending(["r1", "r2"]), ["r2"])
+        self.assertEqual(progress.completed(["r1", "r2"])["r1"].recommendations, [{"id": "REC-1"}])
+
+    def test_runs_and_nodes_are_separate(self):
+        store = checkpoint.open_progress_store(self.path)
+        store.record("run-1", "node", {"r1": checkpoint.ChunkResult({}, [])})
+
+        self.assertEqual(store.completed("run-2", "node"), {})
+        self.assertEqual(store.completed("run-1", "other"), {})
+        store.discard("run-1")
+        self.assertEqual(store.completed("run-1", "node"), {})
+
+class TestResume(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "checkpoints.sqlite")
+        self.initial_state = {"subscription_ids": [SUBSCRIPTION_ID], "resources": [], "recommendations": []}
+
+    def tearDown(self):
+        checkpoint.close_checkpoint_stores()
+        azure.clear_inventory()
+        azure.clear_cache()
+        self.tmp.cleanup()
+
+    def test_resume_skips_finished_nodes(self):
+        calls = {"steady": 0, "flaky": 0}
+
+        def steady(state):
+            calls["steady"] += 1
+            return {"recommendations": [{"id": "REC-steady", "resource_id": state["resources"][0]}]}
+
+        def flaky(state):
+            calls["flaky"] += 1
+            if calls["flaky"] == 1:
+                raise RuntimeError("Azure went away")
+            return {"recommendations": [{"id": "REC-flaky", "resource_id": state["resources"][0]}]}
+
+        nodes = {"steady": steady, "flaky": flaky}
+        with self.assertRaises(RuntimeError):
+            run_analysis(self.initial_state, "run-1", self.path, nodes)
+
+        with patch('finops_agent.finops_agent.tools.azure.load_inventory', wraps=azure.load_inventory) as discover:
+            final_state = run_analysis(self.initial_state, "run-1", self.path, nodes)
+            # A finished run is returned as is.
+            again = run_analysis(self.initial_state, "run-1", self.path, nodes)
+
+        self.assertEqual(discover.call_count, 0)
+        self.assertEqual(calls, {"steady": 1, "flaky": 2})
+        self.assertEqual(sorted(r["id"] for r in final_state["recommendations"]), ["REC-flaky", "REC-steady"])
+        self.assertEqual(again["recommendations"], final_state["recommendations"])
+
+    def test_resume_within_node_skips_finished_chunks(self):
+        resources = [rec["id"] for rec in azure.list_all_apim_instances(SUBSCRIPTION_ID)]
+        state = {"resources": resources, "run_id": "run-1", "checkpoint_path": self.path, "checkpoint_chunk_size": 2}
+        expected = tier_rightsizing.tier_rightsizing_analysis_node({"resources": resources})["recommendations"]
+
+        # The second chunk fails after the first one was saved.
+        chunks = []
+        original = tier_rightsizing.iter_resource_results
+
+        def failing_second_chunk(resource_ids, known_properties=None):
+            chunks.append(resource_ids)
+            if len(chunks) == 2:
+                raise RuntimeError("interrupted")
+            return original(resource_ids, known_properties)
+
+        azure.clear_cache()
+        with patch.object(tier_rightsizing, 'iter_resource_results', side_effect=failing_second_chunk):
+            with self.assertRaises(RuntimeError):
+                tier_rightsizing.tier_rightsizing_analysis_node(state)
+
+        azure.clear_cache()
+        with patch('finops_agent.finops_agent.tools.azure.get_apim_metric_series',
+                   wraps=azure.get_apim_metric_series) as series:
+            resumed = tier_rightsizing.tier_rightsizing_analysis_node(state)
+
+        self.assertEqual(series.call_count, len(resources) - 2)
+        self.assertEqual(sorted(r["id"] for r in resumed["recommendations"]), sorted(r["id"] for r in expected))
+
+if __name__ == '__main__':
+    unittest.main()
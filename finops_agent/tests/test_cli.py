@@ -0,0 +1,81 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from finops_agent.benchmarks.bench_startup import COMMANDS, measure_import
+from finops_agent.finops_agent import cli, export, orchestrator, sharding
+from finops_agent.finops_agent.tools import azure
+
+class TestCli(unittest.TestCase):
+
+    def setUp(self):
+        azure.clear_cache()
+
+    def test_import_loads_no_forbidden_package(self):
+        # Import times are left to benchmarks/bench_startup.py; they vary too much between machines.
+        for command in ("cli", "resource"):
+            module, _, forbidden = COMMANDS[command]
+            with self.subTest(command=command):
+                _, loaded = measure_import(module)
+                self.assertEqual(set(loaded) & set(forbidden), set())
+
+    def test_unknown_log_level_is_a_usage_error(self):
+        with patch("sys.stderr"), self.assertRaises(SystemExit) as raised:
+            cli.main(["--log-level", "LOUD", "analyze"])
+        self.assertEqual(raised.exception.code, 2)
+
+    def test_run_id_and_checkpoint_path_go_together(self):
+        for args in (["--run-id", "nightly"], ["--checkpoint-path", "/tmp/checkpoints.sqlite"]):
+            with self.subTest(args=args), patch("sys.stderr"), self.assertRaises(SystemExit) as raised:
+                cli.main(["analyze", *args])
+            self.assertEqual(raised.exception.code, 2)
+
+    def test_shard_size_needs_subscriptions_and_no_single_run_options(self):
+        for args in (["--shard-size", "2"], ["--shard-size", "0", "--subscription", "sub"],
+                     ["--shard-size", "2", "--subscription", "sub", "--stream"],
+                     ["--shard-size", "2", "--subscription", "sub", "--recommendation-store-path", "/tmp/recs.sqlite"]):
+            with self.subTest(args=args), patch("sys.stderr"), self.assertRaises(SystemExit) as raised:
+                cli.main(["analyze", *args])
+            self.assertEqual(raised.exception.code, 2)
+
+    def test_shard_size_runs_the_sharded_analysis(self):
+        with tempfile.TemporaryDirectory() as tmp, patch.object(sharding, "run_sharded_analysis",
+                                                                return_value=[]) as run_sharded_analysis:
+            path = os.path.join(tmp, "recs.jsonl")
+            self.assertEqual(cli.main(["--log-level", "WARNING", "analyze", "--subscription", "sub-a", "--subscription", "sub-b",
+                                       "--shard-size", "1", "--shard-workers", "2", "--git-log-dir", "",
+                                       "--export-path", path]), 0)
+
+        run_sharded_analysis.assert_called_once_with(["sub-a", "sub-b"], 1, 2, credential_factory=None, git_log_dir="")
+
+    def test_resource_mode_skips_the_graph(self):
+        resource_id = ("/subscriptions/xxxxxxxx-xxxx-xxxx-xxxx-xxxxxxxxxxxx/resourceGroups/rg-prod-1"
+                       "/providers/Microsoft.ApiManagement/service/apim-prod-eus")
+        with tempfile.TemporaryDirectory() as tmp, patch.object(orchestrator, "build_graph") as build_graph:
+            path = os.path.join(tmp, "recs.jsonl")
+            self.assertEqual(cli.main(["--log-level", "WARNING", "resource", resource_id, "--export-path", path]), 0)
+            recs = list(export.iter_jsonl(path))
+
+        build_graph.assert_not_called()
+        self.assertTrue(recs)
+        self.assertEqual({rec["resource_id"] for rec in recs}, {resource_id})
+
+    def test_stream_mode_exports_without_the_graph(self):
+        subscription_id = "xxxxxxxx-xxxx-xxxx-xxxx-xxxxxxxxxxxx"
+        with tempfile.TemporaryDirectory() as tmp, patch.object(orchestrator, "build_graph") as build_graph:
+            path = os.path.join(tmp, "recs.jsonl")
+            self.assertEqual(cli.main(["--log-level", "WARNING", "analyze", "--stream", "--subscription", subscription_id,
+                                       "--export-path", path]), 0)
+            recs = list(export.iter_jsonl(path))
+
+        build_graph.assert_not_called()
+        self.assertTrue(recs)
+        self.assertTrue(all(subscription_id in rec["resource_id"] for rec in recs))
+        self.assertEqual(cli.main(["--log-level", "WARNING", "analyze", "--stream"]), 2)
+
+    def test_compiled_graph_is_reused(self):
+        self.assertIs(orchestrator.get_graph(), orchestrator.get_graph())
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,68 @@
+import os
+import tempfile
+import tracemalloc
+import unittest
+
+from finops_agent.finops_agent import export
+from finops_agent.finops_agent.orchestrator import build_graph
+
+def _rec(n: int):
+    return {"id": f"REC-{n}", "type": "TIER_CHANGE", "resource_id": f"/subscriptions/s/resourceGroups/rg/apim-{n}",
+            "details": "Recommending a SKU downgrade.", "status": "pending_approval", "source_node": "TestNode",
+            "payload": {"current_sku": "Premium", "estimated_monthly_saving": float(n)}}
+
+class TestExport(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def _path(self, name):
+        return os.path.join(self.tmp.name, name)
+
+    def test_jsonl_round_trip_with_gzip(self):
+        path = self._path("recs.jsonl.gz")
+        count = export.export_recommendations((_rec(n) for n in range(5)), jsonl_path=path)
+
+        self.assertEqual(count, 5)
+        with open(path, "rb") as f:
+            self.assertEqual(f.read(2), b"\x1f\x8b")
+        self.assertEqual(list(export.iter_jsonl(path)), [_rec(n) for n in range(5)])
+
+    def test_columnar_row_groups(self):
+        path = self._path("recs.columnar")
+        export.export_recommendations((_rec(n) for n in range(5)), columnar_path=path, row_group_size=2)
+
+        groups = list(export.iter_row_groups(path, columns=["id", "estimated_monthly_saving"]))
+        self.assertEqual([group["id"] for group in groups], [["REC-0", "REC-1"], ["REC-2", "REC-3"], ["REC-4"]])
+        self.assertEqual(groups[2], {"id": ["REC-4"], "estimated_monthly_saving": [4.0]})
+        self.assertEqual(list(next(export.iter_row_groups(path))), list(export.COLUMNS))
+
+    def test_memory_stays_constant(self):
+        """
+        Tests that exporting 20x more recommendations does not raise peak
+        memory, as the generator's items are written and dropped one by one.
+        """
+        def peak(count):
+            tracemalloc.start()
+            try:
+                export.export_recommendations((_rec(n) for n in range(count)), jsonl_path=self._path("a.jsonl.gz"),
+                                              columnar_path=self._path("a.columnar.gz"), row_group_size=100)
+                return tracemalloc.get_traced_memory()[1]
+            finally:
+                tracemalloc.stop()
+
+        small, large = peak(1_000), peak(20_000)
+        self.assertLess(large, small * 1.5)
+
+    def test_graph_exports_after_finalize(self):
+        path = self._path("recs.jsonl")
+        final_state = build_graph().invoke({"resources": [], "recommendations": [], "export_path": path})
+
+        self.assertEqual(list(export.iter_jsonl(path)), final_state["recommendations"])
+        self.assertGreater(os.path.getsize(path), 0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,123 @@
+import copy
+import datetime
+import os
+import sqlite3
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from finops_agent.finops_agent import incremental
+from finops_agent.finops_agent.orchestrator import build_graph
+from finops_agent.finops_agent.tools import azure
+
+SUBSCRIPTION_ID = "sub-1"
+
+class TestSnapshotStore(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.store = incremental.SnapshotStore(os.path.join(self.tmp.name, "snapshots.sqlite"))
+
+    def tearDown(self):
+        self.store.close()
+        self.tmp.cleanup()
+
+    def test_plan_classifies_keys(self):
+        recs = [{"id": "REC-1"}]
+        self.store.put_many("node", {
+            "same": incremental.Snapshot("fp-same", 1000.0, recs),
+            "changed": incremental.Snapshot("fp-old", 1000.0, []),
+            "stale": incremental.Snapshot("fp-stale", 0.0, []),
+        })
+
+        plan = self.store.plan("node", {"same": "fp-same", "changed": "fp-new", "stale": "fp-stale", "brand-new": "fp"},
+                               window_shift=datetime.timedelta(seconds=500), now=1200.0)
+
+        self.assertEqual(list(plan.reuse), ["same"])
+        self.assertEqual(plan.changed, ["changed"])
+        self.assertEqual(plan.window_moved, ["stale"])
+        self.assertEqual(plan.new, ["brand-new"])
+        self.assertEqual(plan.reused_recommendations(), recs)
+        self.assertEqual(plan.report()["skipped_resources"], 1)
+
+    def test_namespaces_are_separate(self):
+        self.store.put_many("a", {"key": incremental.Snapshot("fp", 0.0, [])})
+        self.assertEqual(self.store.get_many("b", ["key"]), {})
+
+    def test_files_with_the_metrics_digest_column_still_work(self):
+        path = os.path.join(self.tmp.name, "old.sqlite")
+        with sqlite3.connect(path) as db:
+            db.execute("CREATE TABLE snapshots (namespace TEXT NOT NULL, key TEXT NOT NULL, inputs_fingerprint TEXT NOT NULL,"
+                       " metrics_digest TEXT, evaluated_at REAL NOT NULL, recommendations TEXT NOT NULL,"
+                       " PRIMARY KEY (namespace, key))")
+        db.close()
+        store = incremental.SnapshotStore(path)
+        store.put_many("a", {"key": incremental.Snapshot("fp", 0.0, [])})
+        self.assertEqual(store.get_many("a", ["key"]), {"key": incremental.Snapshot("fp", 0.0, [])})
+        store.close()
+
+    def test_fingerprint_is_key_order_independent(self):
+        self.assertEqual(incremental.fingerprint({"a": 1, "b": 2}), incremental.fingerprint({"b": 2, "a": 1}))
+
+class TestIncrementalRuns(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.initial_state = {
+            "subscription_ids": [SUBSCRIPTION_ID],
+            "resources": [],
+            "recommendations": [],
+            "snapshot_path": os.path.join(self.tmp.name, "snapshots.sqlite"),
+        }
+        self.fleet = azure.list_all_apim_instances(SUBSCRIPTION_ID)
+
+    def tearDown(self):
+        incremental.close_snapshot_stores()
+        azure.clear_inventory()
+        azure.clear_cache()
+        self.tmp.cleanup()
+
+    def _run(self, fleet):
+        # The cache is cleared so that only the snapshots can avoid metrics calls.
+        azure.clear_cache()
+        with patch('finops_agent.finops_agent.tools.azure.list_all_apim_instances', return_value=fleet), \
+             patch('finops_agent.finops_agent.tools.azure.get_apim_metrics', wraps=azure.get_apim_metrics) as metrics:
+            final_state = build_graph().invoke(self.initial_state)
+        return final_state, metrics.call_count
+
+    def test_unchanged_resources_are_skipped(self):
+        first, first_calls = self._run(self.fleet)
+        second, second_calls = self._run(self.fleet)
+
+        self.assertEqual(first["reanalysis_report"]["tier_rightsizing"]["new"], 4)
+        self.assertEqual(second["reanalysis_report"]["tier_rightsizing"]["skipped_resources"], 4)
+        self.assertEqual(second["reanalysis_report"]["instance_consolidation"]["skipped_resources"], 4)
+        self.assertGreater(first_calls, 0)
+        self.assertEqual(second_calls, 0)
+        self.assertEqual(second["recommendations"], first["recommendations"])
+
+    def test_changed_resource_is_reevaluated(self):
+        self._run(self.fleet)
+
+        changed_fleet = copy.deepcopy(self.fleet)
+        changed_fleet[0]["properties"]["additionalLocations"] = [{"location": "westus"}]
+        final_state, _ = self._run(changed_fleet)
+
+        report = final_state["reanalysis_report"]["tier_rightsizing"]
+        self.assertEqual(report["changed"], 1)
+        self.assertEqual(report["skipped_resources"], 3)
+        # The instance is now multi-region, so its Premium-to-Standard_v2 recommendation is gone.
+        ids = [rec["id"] for rec in final_state["recommendations"]]
+        self.assertNotIn("REC-PREM-VNET-apim-prod-eus", ids)
+        self.assertIn("REC-TR-apim-prod-eus", ids)
+
+    def test_moved_metrics_window_forces_reevaluation(self):
+        self._run(self.fleet)
+        self.initial_state["metrics_window_shift_seconds"] = 0
+        final_state, calls = self._run(self.fleet)
+
+        self.assertEqual(final_state["reanalysis_report"]["tier_rightsizing"]["window_moved"], 4)
+        self.assertGreater(calls, 0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,69 @@
+import time
+import unittest
+
+from finops_agent.finops_agent.orchestrator import build_graph, merge_recommendations
+
+# Fixed latency of each stand-in analysis node, in seconds.
+NODE_LATENCY = 0.3
+
+def _make_slow_node(name: str):
+    """Builds a stand-in analysis node that sleeps for NODE_LATENCY to simulate Azure calls."""
+    def node(state):
+        time.sleep(NODE_LATENCY)
+        return {"recommendations": [{"id": f"REC-{name}", "type": "TEST", "resource_id": state["resources"][0]}]}
+    return node
+
+class TestMergeRecommendations(unittest.TestCase):
+
+    def test_appends_new_recommendations(self):
+        merged = merge_recommendations([{"id": "a"}], [{"id": "b"}])
+        self.assertEqual([r["id"] for r in merged], ["a", "b"])
+
+    def test_replaces_recommendation_with_same_id(self):
+        merged = merge_recommendations([{"id": "a", "v": 1}, {"id": "b"}], [{"id": "a", "v": 2}])
+        self.assertEqual(merged, [{"id": "a", "v": 2}, {"id": "b"}])
+
+    def test_handles_missing_lists(self):
+        self.assertEqual(merge_recommendations(None, [{"id": "a"}]), [{"id": "a"}])
+        self.assertEqual(merge_recommendations([{"id": "a"}], None), [{"id": "a"}])
+
+class TestBuildGraph(unittest.TestCase):
+
+    def setUp(self):
+        self.analysis_nodes = {name: _make_slow_node(name) for name in ("first", "second", "third")}
+        self.initial_state = {"resources": [], "recommendations": [], "git_log_dir": ""}
+
+    def test_parallel_wall_time_close_to_slowest_node(self):
+        """
+        Tests that fanned-out analysis nodes overlap, so a run takes about as long
+        as the slowest node instead of the sum of all of them.
+        """
+        app = build_graph(self.analysis_nodes, parallel=True)
+
+        start = time.perf_counter()
+        final_state = app.invoke(self.initial_state)
+        elapsed = time.perf_counter() - start
+
+        self.assertEqual(len(final_state["recommendations"]), 3)
+        self.assertLess(elapsed, NODE_LATENCY * 2)
+
+    def test_sequential_wall_time_is_sum_of_nodes(self):
+        app = build_graph(self.analysis_nodes, parallel=False)
+
+        start = time.perf_counter()
+        final_state = app.invoke(self.initial_state)
+        elapsed = time.perf_counter() - start
+
+        self.assertEqual(len(final_state["recommendations"]), 3)
+        self.assertGreaterEqual(elapsed, NODE_LATENCY * 3)
+
+    def test_default_graph_runs_end_to_end(self):
+        final_state = build_graph().invoke(self.initial_state)
+
+        self.assertEqual(len(final_state["resources"]), 2)
+        ids = [rec["id"] for rec in final_state["recommendations"]]
+        self.assertEqual(len(ids), len(set(ids)))
+        self.assertIn("REC-TR-apim-prod-eus", ids)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,149 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from finops_agent.finops_agent import recommendation_store
+from finops_agent.finops_agent.orchestrator import build_graph
+from finops_agent.finops_agent.recommendation_store import Recommendation, RecommendationStore
+from finops_agent.finops_agent.tools import azure
+
+def _rec(rec_id: str, resource_id: str = "r1", rec_type: str = "TIER_CHANGE", status: str = "pending_approval"):
+    return {"id": rec_id, "type": rec_type, "resource_id": resource_id, "details": "", "status": status,
+            "source_node": "TestNode", "payload": {"current_sku": "Premium"}}
+
+class TestRecommendationStore(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "recommendations.sqlite")
+
+    def tearDown(self):
+        recommendation_store.close_recommendation_stores()
+        self.tmp.cleanup()
+
+    def test_find_by_secondary_indexes(self):
+        store = RecommendationStore.from_list([
+            _rec("A", "r1"), _rec("B", "r1", "INSTANCE_CONSOLIDATE"), _rec("C", "r2", status="approved")])
+
+        self.assertEqual([r.id for r in store.find(resource_id="r1")], ["A", "B"])
+        self.assertEqual([r.id for r in store.find(resource_id="r1", type="TIER_CHANGE")], ["A"])
+        self.assertEqual([r.id for r in store.find(status="approved")], ["C"])
+        self.assertEqual(store.find(resource_id="missing"), [])
+        with self.assertRaises(ValueError):
+            store.find(details="")
+
+    def test_upsert_replaces_and_reindexes(self):
+        store = RecommendationStore()
+        self.assertTrue(store.upsert(_rec("A", "r1")))
+        self.assertFalse(store.upsert(_rec("A", "r1")))
+        self.assertTrue(store.upsert(_rec("A", "r2")))
+
+        self.assertEqual(len(store), 1)
+        self.assertEqual(store.find(resource_id="r1"), [])
+        self.assertEqual(store.get("A").resource_id, "r2")
+
+        store.set_status("A", "approved")
+        self.assertEqual(store.find(status="pending_approval"), [])
+        self.assertTrue(store.remove("A"))
+        self.assertEqual(store.find(status="approved"), [])
+
+    def test_keep_status_preserves_review(self):
+        store = RecommendationStore.from_list([_rec("A")])
+        store.set_status("A", "approved")
+        store.upsert(_rec("A"), keep_status=True)
+
+        self.assertEqual(store.get("A").status, "approved")
+
+    def test_keep_status_resets_changed_recommendations(self):
+        store = RecommendationStore.from_list([_rec("A"), _rec("B")])
+        store.set_status("A", "approved")
+        store.set_status("B", "approved")
+        changed = dict(_rec("A"), payload={"current_sku": "Standard"})
+        store.upsert_many([changed, _rec("B", "r2")], keep_status=True)
+
+        self.assertEqual(store.get("A").status, "pending_approval")
+        self.assertEqual(store.get("B").status, "pending_approval")
+
+    def test_keep_status_ignores_drifting_payload_fields(self):
+        store = RecommendationStore.from_list([dict(_rec("A"), payload={"current_sku": "Premium", "p95_capacity": 20})])
+        store.set_status("A", "approved")
+        store.upsert(dict(_rec("A"), payload={"current_sku": "Premium", "p95_capacity": 21,
+                                              "estimated_monthly_saving": 10.0}), keep_status=True)
+
+        self.assertEqual(store.get("A").status, "approved")
+        self.assertEqual(store.get("A").payload["p95_capacity"], 21)
+
+    def test_supersede_missing_in_scope(self):
+        store = RecommendationStore.from_list([
+            _rec("kept", "r1", status="approved"), _rec("gone", "r1", status="approved"),
+            _rec("rejected", "r1", status="rejected"), _rec("other", "r2", status="approved")])
+
+        superseded = store.supersede_missing(["kept"], lambda rec: rec.resource_id == "r1")
+
+        self.assertEqual(superseded, 1)
+        self.assertEqual([r.id for r in store.find(status=recommendation_store.SUPERSEDED)], ["gone"])
+        self.assertEqual([r.id for r in store.find(status="approved")], ["kept", "other"])
+        # Produced again later, it needs a new review.
+        store.upsert(_rec("gone", "r1"), keep_status=True)
+        self.assertEqual(store.get("gone").status, "pending_approval")
+
+    def test_store_persists_across_reopening(self):
+        store = RecommendationStore(self.path)
+        store.upsert_many([_rec("A"), _rec("B")])
+        store.set_status("B", "approved")
+        store.remove("A")
+        store.close()
+
+        reopened = RecommendationStore(self.path)
+        self.assertEqual(reopened.to_list(), [_rec("B", status="approved")])
+        self.assertIsInstance(reopened.get("B"), Recommendation)
+
+    def test_runs_upsert_into_the_store(self):
+        state = {"resources": [], "recommendations": [], "recommendation_store_path": self.path}
+        first = build_graph().invoke(state)
+        store = recommendation_store.open_recommendation_store(self.path)
+        approved = first["recommendations"][0]["id"]
+        store.set_status(approved, "approved")
+
+        build_graph().invoke(state)
+
+        self.assertEqual(len(store), len(first["recommendations"]))
+        self.assertEqual(store.get(approved).status, "approved")
+
+    def test_runs_supersede_what_they_no_longer_produce(self):
+        state = {"resources": [], "recommendations": [], "recommendation_store_path": self.path}
+        first = build_graph().invoke(state)
+        store = recommendation_store.open_recommendation_store(self.path)
+        subscription_id = first["resources"][0].split("/")[2]
+        store.upsert_many([_rec("OLD", f"/subscriptions/{subscription_id}/resourceGroups/rg/providers/x/y/old", status="approved"),
+                           _rec("ELSEWHERE", "/subscriptions/other/resourceGroups/rg/providers/x/y/z", status="approved")])
+
+        build_graph().invoke(state)
+
+        self.assertEqual(store.get("OLD").status, recommendation_store.SUPERSEDED)
+        self.assertEqual(store.get("ELSEWHERE").status, "approved")
+        self.assertTrue(all(store.get(rec["id"]).status == "pending_approval" for rec in first["recommendations"]))
+
+    def test_failed_evaluations_do_not_supersede(self):
+        """
+        Tests that an approval survives a run that could not evaluate its
+        resource or list its subscription, as nothing disproved it.
+        """
+        state = {"resources": [], "recommendations": [], "recommendation_store_path": self.path}
+        first = build_graph().invoke(state)
+        store = recommendation_store.open_recommendation_store(self.path)
+        for rec in first["recommendations"]:
+            store.set_status(rec["id"], "approved")
+
+        with patch.object(azure, "get_metric_statistics_many",
+                          side_effect=lambda resource_ids: {rid: RuntimeError("throttled") for rid in resource_ids}), \
+             patch.object(azure, "list_all_apim_instances_many",
+                          side_effect=lambda subscription_ids: {sid: RuntimeError("throttled") for sid in subscription_ids}):
+            second = build_graph().invoke(state)
+
+        self.assertEqual(second["recommendations"], [])
+        self.assertTrue(all(store.get(rec["id"]).status == "approved" for rec in first["recommendations"]))
+
+if __name__ == '__main__':
+    unittest.main()
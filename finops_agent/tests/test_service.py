@@ -0,0 +1,106 @@
+import os
+import tempfile
+import threading
+import unittest
+from unittest.mock import patch
+
+from finops_agent.finops_agent import audit_log, service, telemetry
+from finops_agent.finops_agent.service import AnalysisService
+from finops_agent.finops_agent.tools import azure
+from finops_agent.tests.fake_azure import FakeAzureServer, make_instance
+
+SUBSCRIPTION_IDS = [f"sub-{n}" for n in range(4)]
+
+def _fleet():
+    return [make_instance(sid, f"apim-{sid}-{n}", sku="Premium", vnet="External") for sid in SUBSCRIPTION_IDS for n in range(3)]
+
+class TestAnalysisService(unittest.TestCase):
+
+    def setUp(self):
+        azure.clear_cache()
+        telemetry.REGISTRY.reset()
+
+    def tearDown(self):
+        azure.clear_inventory()
+        azure.configure_client(None)
+
+    def test_jobs_run_concurrently_and_stay_isolated(self):
+        with FakeAzureServer(_fleet(), latency=0.02) as server:
+            azure.configure_client(server.url)
+            with AnalysisService(max_workers=2) as analysis_service:
+                jobs = [analysis_service.submit([sid]) for sid in SUBSCRIPTION_IDS]
+                for job in jobs:
+                    self.assertTrue(job.wait(30))
+
+        for sid, job in zip(SUBSCRIPTION_IDS, jobs):
+            self.assertEqual(job.status, service.DONE)
+            self.assertTrue(job.recommendations)
+            self.assertTrue(all(f"/subscriptions/{sid}/" in rec["resource_id"] for rec in job.recommendations))
+            self.assertGreaterEqual(job.queue_wait_seconds, 0)
+            self.assertGreater(job.service_seconds, 0)
+
+        # Never more than two jobs at once, and two did overlap.
+        events = sorted([(job.started_at, 1) for job in jobs] + [(job.finished_at, -1) for job in jobs])
+        running = [sum(delta for _, delta in events[:n + 1]) for n in range(len(events))]
+        self.assertEqual(max(running), 2)
+        # The jobs after the first two waited for a worker.
+        self.assertGreater(max(job.queue_wait_seconds for job in jobs[2:]), min(job.service_seconds for job in jobs[:2]) / 2)
+        self.assertEqual(telemetry.REGISTRY.histogram(telemetry.SERVICE_QUEUE_WAIT).count, 4)
+
+    def test_finished_jobs_leave_the_shared_inventory_and_write_the_audit_log(self):
+        with tempfile.TemporaryDirectory() as tmp, FakeAzureServer(_fleet()) as server:
+            azure.configure_client(server.url)
+            with AnalysisService(max_workers=2, git_log_dir=tmp) as analysis_service:
+                jobs = [analysis_service.submit([sid]) for sid in SUBSCRIPTION_IDS[:2]]
+                for job in jobs:
+                    self.assertTrue(job.wait(30))
+            audit_log.close_audit_logs()
+
+            self.assertIsNone(azure.get_inventory())
+            self.assertEqual(analysis_service._inventory_users, {})
+            self.assertEqual(len(os.listdir(os.path.join(tmp, audit_log.RECOMMENDATIONS_DIR))),
+                             sum(len(job.recommendations) for job in jobs))
+
+    def test_a_failing_job_does_not_affect_the_others(self):
+        load_inventory = azure.load_inventory
+
+        def failing_for_sub_0(subscription_ids, *args, **kwargs):
+            if "sub-0" in subscription_ids:
+                raise RuntimeError("inventory query failed")
+            return load_inventory(subscription_ids, *args, **kwargs)
+
+        with patch.object(azure, "load_inventory", side_effect=failing_for_sub_0), AnalysisService(max_workers=2) as analysis_service:
+            failed, done = analysis_service.submit(["sub-0"]), analysis_service.submit(["sub-1"])
+            for job in (failed, done):
+                job.wait(30)
+            stats = analysis_service.stats()
+
+        self.assertEqual((failed.status, failed.error), (service.FAILED, "inventory query failed"))
+        self.assertEqual(done.status, service.DONE)
+        self.assertEqual((stats[service.FAILED], stats[service.DONE]), (1, 1))
+        with self.assertRaises(ValueError):
+            analysis_service.submit([])
+
+    def test_socket_api(self):
+        server = service.serve(AnalysisService(max_workers=1), port=0)
+        host, port = server.server_address[:2]
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        try:
+            submitted = service.request({"op": "submit", "subscription_ids": ["sub-a"], "wait": True}, host, port, timeout=30)
+            status = service.request({"op": "status", "job_id": submitted["job_id"], "recommendations": False}, host, port)
+            stats = service.request({"op": "stats"}, host, port)
+            unknown = service.request({"op": "status", "job_id": "job-404"}, host, port)
+        finally:
+            server.shutdown()
+            server.server_close()
+            server.service.close()
+
+        self.assertEqual(submitted["status"], service.DONE)
+        self.assertTrue(submitted["recommendations"])
+        self.assertIsNotNone(submitted["queue_wait_seconds"])
+        self.assertNotIn("recommendations", status)
+        self.assertEqual(stats[service.DONE], 1)
+        self.assertIn("error", unknown)
+
+if __name__ == '__main__':
+    unittest.main()
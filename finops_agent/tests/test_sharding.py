@@ -0,0 +1,84 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from finops_agent.finops_agent import audit_log, sharding
+from finops_agent.finops_agent.orchestrator import build_graph
+from finops_agent.finops_agent.tools import azure
+from finops_agent.tests.fake_azure import FakeAzureServer, StaticCredential, make_instance
+
+SUBSCRIPTION_IDS = [f"sub-{n}" for n in range(4)]
+
+def _fleet():
+    """Per subscription: three underutilized Basic instances and one Premium VNet instance."""
+    instances, metrics = [], {}
+    for sid in SUBSCRIPTION_IDS:
+        for n in range(3):
+            instance = make_instance(sid, f"apim-{sid}-basic-{n}")
+            instances.append(instance)
+            metrics[instance["id"].lower()] = {"Capacity": [10.0, 12.0]}
+        instances.append(make_instance(sid, f"apim-{sid}-prem", sku="Premium", vnet="Internal"))
+    return instances, metrics
+
+class TestShardSubscriptions(unittest.TestCase):
+
+    def test_shards_are_deterministic(self):
+        shards = sharding.shard_subscriptions(["c", "a", "B", "b", "d"], shard_size=2)
+        self.assertEqual(shards, [["a", "b"], ["c", "d"]])
+
+    def test_rejects_empty_shards(self):
+        with self.assertRaises(ValueError):
+            sharding.shard_subscriptions(["a"], shard_size=0)
+
+class TestRunShardedAnalysis(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        audit_log.close_audit_logs()
+        azure.clear_inventory()
+        azure.clear_cache()
+        azure.configure_client(None)
+        self.tmp.cleanup()
+
+    def test_sharded_run_matches_serial_run(self):
+        """
+        Tests that a run split across worker processes produces the same
+        recommendations as one serial run, with consolidation per subscription.
+        """
+        instances, metrics = _fleet()
+        with FakeAzureServer(instances, metrics=metrics) as server:
+            # Spawned workers pick the endpoint up from the environment.
+            with patch.dict(os.environ, {azure.ARM_ENDPOINT_ENV: server.url}):
+                sharded = sharding.run_sharded_analysis(SUBSCRIPTION_IDS, shard_size=1, max_workers=2)
+
+            azure.configure_client(server.url)
+            serial_state = build_graph().invoke({"subscription_ids": SUBSCRIPTION_IDS, "resources": [], "recommendations": []})
+
+        serial = sorted(serial_state["recommendations"], key=lambda rec: rec["id"])
+        self.assertEqual(sharded, serial)
+
+        consolidations = [rec for rec in sharded if rec["type"] == "INSTANCE_CONSOLIDATE"]
+        self.assertEqual([rec["resource_id"] for rec in consolidations], SUBSCRIPTION_IDS)
+        for rec in consolidations:
+            self.assertEqual(len(rec["payload"]["candidate_instances"]), 3)
+            self.assertTrue(all(f"/subscriptions/{rec['resource_id']}/" in c for c in rec["payload"]["candidate_instances"]))
+
+    def test_no_subscriptions(self):
+        self.assertEqual(sharding.run_sharded_analysis([]), [])
+
+    def test_workers_get_the_credential_and_the_parent_writes_the_audit_log(self):
+        instances, metrics = _fleet()
+        repo_dir = os.path.join(self.tmp.name, "audit")
+        with FakeAzureServer(instances, metrics=metrics) as server:
+            sharded = sharding.run_sharded_analysis(SUBSCRIPTION_IDS[:2], shard_size=1, max_workers=2, arm_endpoint=server.url,
+                                                    credential_factory=StaticCredential, git_log_dir=repo_dir)
+
+        self.assertEqual(server.authorizations, {f"Bearer {StaticCredential.TOKEN}"})
+        files = os.listdir(os.path.join(repo_dir, audit_log.RECOMMENDATIONS_DIR))
+        self.assertEqual(len(files), len(sharded))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,110 @@
+import contextlib
+import os
+import tracemalloc
+import unittest
+from unittest.mock import patch
+
+from finops_agent.finops_agent import streaming
+from finops_agent.finops_agent.tools import azure
+from finops_agent.finops_agent.tools.cache import DEFAULT_MAX_ENTRIES
+from finops_agent.tests.fake_azure import FakeAzureServer, make_instance
+
+def _synthetic_pages(count: int, page_size: int = 200):
+    """Lazily yields pages of a synthetic single-subscription fleet."""
+    for start in range(0, count, page_size):
+        yield [make_instance("sub-1", f"apim-{n:06d}", sku="Basic" if n % 2 else "Premium", capacity=1 if n % 2 else 2, vnet="None")
+               for n in range(start, min(start + page_size, count))]
+
+def _metrics(resource_id, *args):
+    # Every fifth instance is underutilized; half of those are Basic.
+    return {"Capacity": 10.0 if resource_id[-1] in "05" else 80.0}
+
+class TestChunked(unittest.TestCase):
+
+    def test_splits_into_fixed_size_chunks(self):
+        self.assertEqual(list(streaming.chunked(range(5), 2)), [[0, 1], [2, 3], [4]])
+
+    def test_rejects_empty_chunks(self):
+        with self.assertRaises(ValueError):
+            list(streaming.chunked([1], 0))
+
+class TestStreamRecommendations(unittest.TestCase):
+
+    def setUp(self):
+        # A small cache keeps its own memory bounded for the memory test.
+        azure.configure_cache(max_entries=64)
+
+    def tearDown(self):
+        azure.configure_cache(max_entries=DEFAULT_MAX_ENTRIES)
+
+    @patch('finops_agent.finops_agent.tools.azure.get_apim_metrics', side_effect=_metrics)
+    def test_recommendations_are_emitted_per_chunk(self, mock_get_metrics):
+        seen_pages = []
+
+        def pages():
+            for page in _synthetic_pages(100, page_size=20):
+                seen_pages.append(page)
+                yield page
+
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            stream = streaming.stream_recommendations(pages(), chunk_size=20)
+            first = next(stream)
+            # The first chunk's recommendations arrive before the rest of the fleet is discovered.
+            self.assertLessEqual(len(seen_pages), 2)
+            rest = list(stream)
+
+        recs = [first] + rest
+        # 10 underutilized two-unit Premium instances, and none has VNet enabled.
+        self.assertEqual(len([r for r in recs if r["type"] == "TIER_CHANGE"]), 10)
+        # The 10 underutilized Basic instances are consolidated once the stream ends.
+        self.assertEqual(recs[-1]["type"], "INSTANCE_CONSOLIDATE")
+        self.assertEqual(len(recs[-1]["payload"]["candidate_instances"]), 10)
+        # The consolidation pass reuses the chunk's cached metrics.
+        self.assertEqual(mock_get_metrics.call_count, 100)
+
+    # A plain function rather than a mock, which would record every call.
+    @patch('finops_agent.finops_agent.tools.azure.get_apim_metrics',
+           new=lambda resource_id, *args: {"Capacity": 10.0 if resource_id.endswith("0") else 80.0})
+    def test_peak_memory_is_bounded_by_chunk_size(self):
+        """
+        Tests that a fleet ten times larger does not need ten times the memory.
+        Only Premium instances are underutilized here, so no consolidation
+        candidates (which are kept until the end of the stream) accumulate.
+        """
+        def peak_for(count: int) -> int:
+            tracemalloc.start()
+            try:
+                with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+                    for _ in streaming.stream_recommendations(_synthetic_pages(count), chunk_size=100):
+                        pass
+                return tracemalloc.get_traced_memory()[1]
+            finally:
+                tracemalloc.stop()
+
+        small, large = peak_for(1000), peak_for(10000)
+        self.assertLess(large, small * 2)
+
+class TestStreamFleetRecommendations(unittest.TestCase):
+
+    def setUp(self):
+        azure.clear_cache()
+
+    def tearDown(self):
+        azure.configure_client(None)
+
+    def test_streams_resource_graph_pages(self):
+        fleet = [make_instance("sub-a", f"apim-{n:03d}", sku="Premium", vnet="External") for n in range(25)]
+        with FakeAzureServer(fleet) as server:
+            azure.configure_client(server.url)
+            with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+                recs = list(streaming.stream_fleet_recommendations(["sub-a"], chunk_size=10, page_size=10))
+
+        # Every instance is Premium with VNet and single-region.
+        self.assertEqual(len([r for r in recs if r["id"].startswith("REC-PREM-VNET-")]), 25)
+        graph_queries = [r for r in server.requests if r.startswith("POST")]
+        self.assertEqual(len(graph_queries), 3)
+        # Properties came from the pages, so no per-instance property reads were made.
+        self.assertFalse([r for r in server.requests if r.startswith("GET") and "metrics" not in r])
+
+if __name__ == '__main__':
+    unittest.main()
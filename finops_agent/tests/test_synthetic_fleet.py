@@ -0,0 +1,46 @@
+import unittest
+
+from finops_agent.benchmarks.bench_workflow import compare_to_baseline, run_benchmark
+from finops_agent.benchmarks.synthetic_fleet import FleetSpec, generate_fleet
+
+class TestGenerateFleet(unittest.TestCase):
+
+    def test_same_spec_builds_same_fleet(self):
+        spec = FleetSpec(size=200, instances_per_subscription=40, seed=7)
+        first, second = generate_fleet(spec), generate_fleet(spec)
+
+        self.assertEqual(list(first.instances()), list(second.instances()))
+        self.assertEqual(first.metrics, second.metrics)
+        self.assertEqual(len(first), 200)
+        self.assertEqual(len(first.subscription_ids), 5)
+
+    def test_sku_mix_and_flags_are_respected(self):
+        fleet = generate_fleet(FleetSpec(size=500, sku_mix={"Premium": 1.0}, vnet_ratio=1.0, multi_region_ratio=0.0))
+
+        for instance in fleet.instances():
+            self.assertEqual(instance["sku"]["name"], "Premium")
+            self.assertEqual(instance["properties"]["virtualNetworkType"], "External")
+            self.assertEqual(instance["properties"]["additionalLocations"], [])
+
+class TestBenchWorkflow(unittest.TestCase):
+
+    def test_run_reports_every_node(self):
+        result = run_benchmark(FleetSpec(size=100, instances_per_subscription=25), measure_memory=True)
+
+        self.assertEqual(result["size"], 100)
+        self.assertGreater(result["resources_per_second"], 0)
+        self.assertGreater(result["peak_memory_mb"], 0)
+        self.assertEqual(set(result["nodes"]), {"discover", "tier_rightsizing_analysis",
+                                                "instance_consolidation_analysis", "finalize", "export"})
+        self.assertGreater(result["recommendations"], 0)
+
+    def test_compare_flags_slower_runs_only(self):
+        baseline = {"runs": [{"size": 100, "latency": 0.0, "resources_per_second": 1000.0, "peak_memory_mb": 10.0}]}
+        steady = {"size": 100, "latency": 0.0, "resources_per_second": 900.0, "peak_memory_mb": 11.0}
+        slow = {"size": 100, "latency": 0.0, "resources_per_second": 500.0, "peak_memory_mb": 20.0}
+
+        self.assertEqual(compare_to_baseline([steady], baseline), [])
+        self.assertEqual(len(compare_to_baseline([slow], baseline)), 2)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,137 @@
+import asyncio
+import datetime
+import json
+import logging
+import os
+import tempfile
+import unittest
+
+from finops_agent.finops_agent import telemetry
+from finops_agent.finops_agent.orchestrator import build_graph
+from finops_agent.finops_agent.tools import azure
+
+class TestMetricsRegistry(unittest.TestCase):
+
+    def setUp(self):
+        self.registry = telemetry.MetricsRegistry()
+
+    def test_histogram_buckets_are_cumulative(self):
+        for value in (0.002, 0.002, 0.3, 100.0):
+            self.registry.observe("latency", value)
+
+        histogram = self.registry.histogram("latency")
+        buckets = dict(histogram.cumulative())
+        self.assertEqual(histogram.count, 4)
+        self.assertEqual(buckets["0.005"], 2)
+        self.assertEqual(buckets["0.5"], 3)
+        self.assertEqual(buckets["+Inf"], 4)
+
+    def test_prometheus_text_format(self):
+        self.registry.describe("calls_total", "Calls.")
+        self.registry.inc("calls_total", (("function", "get"),), 2)
+        self.registry.observe("latency", 0.02, (("function", "get"),))
+
+        text = self.registry.to_prometheus()
+        self.assertIn("# HELP calls_total Calls.", text)
+        self.assertIn("# TYPE calls_total counter", text)
+        self.assertIn('calls_total{function="get"} 2', text)
+        self.assertIn('latency_bucket{function="get",le="0.025"} 1', text)
+        self.assertIn('latency_count{function="get"} 1', text)
+
+    def test_since_keeps_only_later_series(self):
+        self.registry.inc("calls_total", (("function", "get"),), 2)
+        self.registry.inc("other_total")
+        self.registry.observe("latency", 0.002)
+        baseline = json.loads(json.dumps(self.registry.to_dict()))
+        self.registry.inc("calls_total", (("function", "get"),))
+        self.registry.observe("latency", 0.3)
+
+        delta = self.registry.since(baseline)
+        self.assertEqual(delta.counter_value("calls_total", (("function", "get"),)), 1)
+        self.assertNotIn("other_total", delta.to_dict()["counters"])
+        buckets = dict(delta.histogram("latency").cumulative())
+        self.assertEqual(delta.histogram("latency").count, 1)
+        self.assertEqual(buckets["0.005"], 0)
+        self.assertEqual(buckets["+Inf"], 1)
+
+class TestInstrumentation(unittest.TestCase):
+
+    def setUp(self):
+        telemetry.REGISTRY.reset()
+        azure.clear_cache()
+        azure.clear_inventory()
+
+    def test_tool_calls_and_errors_are_counted(self):
+        labels = (("function", "get_apim_properties"),)
+        azure.get_apim_properties("/subscriptions/s/resourceGroups/rg/providers/Microsoft.ApiManagement/service/x")
+        self.assertEqual(telemetry.REGISTRY.counter_value(telemetry.AZURE_CALLS, labels), 1)
+        self.assertEqual(telemetry.REGISTRY.histogram(telemetry.AZURE_DURATION, labels).count, 1)
+
+        @telemetry.instrument_tool
+        async def failing():
+            raise ValueError("boom")
+
+        with self.assertRaises(ValueError):
+            asyncio.run(failing())
+        self.assertEqual(telemetry.REGISTRY.counter_value(telemetry.AZURE_ERRORS, (("function", "failing"),)), 1)
+
+    def test_metric_series_fetch_is_counted_once(self):
+        azure.get_apim_metric_series("/subscriptions/s/resourceGroups/rg/providers/Microsoft.ApiManagement/service/x",
+                                     ["Capacity"], datetime.timedelta(days=1))
+        calls = {name: telemetry.REGISTRY.counter_value(telemetry.AZURE_CALLS, (("function", name),))
+                 for name in ("get_apim_metric_series", "get_apim_metrics")}
+        self.assertEqual(calls, {"get_apim_metric_series": 1, "get_apim_metrics": 0})
+
+    def test_graph_run_records_every_node_and_exports(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            build_graph().invoke({"resources": [], "recommendations": [], "git_log_dir": "", "telemetry_dir": tmp})
+            with open(os.path.join(tmp, "telemetry.json")) as f:
+                exported = json.load(f)
+            with open(os.path.join(tmp, "metrics.prom")) as f:
+                prometheus = f.read()
+
+        nodes = {series["labels"]["node"] for series in exported["counters"][telemetry.NODE_RUNS]}
+        # 'finalize' writes the export while it is still running, so only the earlier nodes appear.
+        self.assertEqual(nodes, {"discover", "tier_rightsizing_analysis", "instance_consolidation_analysis"})
+        functions = {series["labels"]["function"] for series in exported["counters"][telemetry.AZURE_CALLS]}
+        self.assertIn("get_metric_statistics_many", functions)
+        self.assertIn('finops_node_duration_seconds_count{node="discover"} 1', prometheus)
+        self.assertEqual(telemetry.REGISTRY.counter_value(telemetry.NODE_RUNS, (("node", "finalize"),)), 1)
+
+    def test_each_run_exports_only_its_own_telemetry(self):
+        graph = build_graph()
+        with tempfile.TemporaryDirectory() as tmp:
+            for _ in range(2):
+                graph.invoke({"resources": [], "recommendations": [], "git_log_dir": "", "telemetry_dir": tmp})
+            with open(os.path.join(tmp, "telemetry.json")) as f:
+                exported = json.load(f)
+
+        runs = {series["labels"]["node"]: series["value"] for series in exported["counters"][telemetry.NODE_RUNS]}
+        self.assertEqual(runs["discover"], 1)
+        self.assertEqual(telemetry.REGISTRY.counter_value(telemetry.NODE_RUNS, (("node", "discover"),)), 2)
+
+class TestLogging(unittest.TestCase):
+
+    def test_per_resource_messages_are_not_formatted_when_disabled(self):
+        class Exploding:
+            def __str__(self):
+                raise AssertionError("formatted a disabled log message")
+
+        logger = logging.getLogger("finops_agent.finops_agent.nodes.analysis.tier_rightsizing")
+        previous = logger.level
+        logger.setLevel(logging.INFO)
+        try:
+            logger.debug("Analyzing resource: %s", Exploding())
+        finally:
+            logger.setLevel(previous)
+
+    def test_json_formatter_includes_extra_fields(self):
+        record = logging.LogRecord("finops", logging.INFO, __file__, 1, "Analyzing %s", ("r1",), None)
+        record.resource_id = "r1"
+        entry = json.loads(telemetry.JsonFormatter().format(record))
+        self.assertEqual(entry["msg"], "Analyzing r1")
+        self.assertEqual(entry["resource_id"], "r1")
+        self.assertEqual(entry["level"], "INFO")
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,149 @@
+import asyncio
+import datetime
+import time
+import unittest
+
+from finops_agent.finops_agent.tools import azure
+from finops_agent.tests.fake_azure import FakeAzureServer, make_instance
+
+SUBSCRIPTION_ID = "sub-1"
+TIMESPAN = datetime.timedelta(days=90)
+
+def _fleet(count: int):
+    return [make_instance(SUBSCRIPTION_ID, f"apim-{n:03d}") for n in range(count)]
+
+class TestBatchCallsAgainstFakeServer(unittest.TestCase):
+
+    def setUp(self):
+        azure.clear_cache()
+
+    def tearDown(self):
+        # Restore the offline client so other tests keep using placeholder data.
+        azure.configure_client(None)
+
+    def test_properties_many_returns_every_resource(self):
+        fleet = _fleet(5)
+        with FakeAzureServer(fleet) as server:
+            azure.configure_client(server.url)
+            results = azure.get_apim_properties_many([i["id"] for i in fleet])
+
+        self.assertEqual(len(results), 5)
+        self.assertEqual(results[fleet[2]["id"]]["name"], "apim-002")
+
+    def test_metrics_many_computes_p95_from_datapoints(self):
+        fleet = _fleet(2)
+        metrics = {fleet[0]["id"].lower(): {"Capacity": [float(v) for v in range(1, 101)]}}
+        with FakeAzureServer(fleet, metrics=metrics) as server:
+            azure.configure_client(server.url)
+            results = azure.get_apim_metrics_many([i["id"] for i in fleet], ["Capacity"], TIMESPAN)
+
+        self.assertAlmostEqual(results[fleet[0]["id"]]["Capacity"], 95.05)
+        # No datapoints means no value, as with a metric Azure Monitor has not recorded.
+        self.assertEqual(results[fleet[1]["id"]], {})
+
+    def test_statistics_many_ingests_each_resource_once(self):
+        fleet = _fleet(3)
+        metrics = {i["id"].lower(): {"Capacity": [float(v) for v in range(1, 101)], "CpuPercentage": [50.0]}
+                   for i in fleet}
+        resource_ids = [i["id"] for i in fleet]
+        with FakeAzureServer(fleet, metrics=metrics) as server:
+            azure.configure_client(server.url)
+            # IDs differing only in case share one ingestion, and a later batch hits the cache.
+            first = azure.get_metric_statistics_many(resource_ids + [resource_ids[0].lower()])
+            second = azure.get_metric_statistics_many(resource_ids)
+
+        self.assertEqual(len(server.requests), 3)
+        stats = first[fleet[0]["id"]]
+        # Percentiles come from daily sketches, within their 1% relative accuracy.
+        self.assertAlmostEqual(stats.get("Capacity", 90, 95.0), 95.0, delta=0.95)
+        self.assertAlmostEqual(stats.get("Capacity", 7, 50.0), 50.0, delta=0.5)
+        self.assertEqual(stats.metrics(30, 99.0)["CpuPercentage"], 50.0)
+        self.assertIsNone(stats.get("Requests", 90, 95.0))
+        self.assertEqual(second[fleet[2]["id"]].to_dict(), first[fleet[2]["id"]].to_dict())
+
+    def test_failed_resource_is_returned_as_exception(self):
+        fleet = _fleet(1)
+        missing_id = f"/subscriptions/{SUBSCRIPTION_ID}/resourceGroups/rg/providers/Microsoft.ApiManagement/service/missing"
+        with FakeAzureServer(fleet) as server:
+            azure.configure_client(server.url)
+            results = azure.get_apim_properties_many([fleet[0]["id"], missing_id])
+
+        self.assertEqual(results[fleet[0]["id"]]["name"], "apim-000")
+        self.assertIsInstance(results[missing_id], Exception)
+
+    def test_listing_follows_next_link(self):
+        fleet = _fleet(7)
+        with FakeAzureServer(fleet, page_size=3) as server:
+            azure.configure_client(server.url)
+            results = azure.list_all_apim_instances_many([SUBSCRIPTION_ID])
+
+        self.assertEqual(len(results[SUBSCRIPTION_ID]), 7)
+        self.assertEqual(len(server.requests), 3)
+
+    def test_repeated_batch_is_served_from_cache(self):
+        fleet = _fleet(4)
+        resource_ids = [i["id"] for i in fleet]
+        with FakeAzureServer(fleet) as server:
+            azure.configure_client(server.url)
+            first = azure.get_apim_metrics_many(resource_ids, ["Capacity"], TIMESPAN)
+            second = azure.get_apim_metrics_many(resource_ids, ["Capacity"], TIMESPAN)
+            # A different timespan is a different cache key.
+            azure.get_apim_metrics_many(resource_ids[:1], ["Capacity"], datetime.timedelta(days=7))
+
+        self.assertEqual(first, second)
+        self.assertEqual(len(server.requests), 5)
+        stats = azure.cache_stats()
+        self.assertEqual(stats["misses"], 5)
+        self.assertEqual(stats["round_trips_saved"], 4)
+
+    def test_concurrency_limit_and_wall_time(self):
+        """
+        Tests that a batch overlaps its requests up to the concurrency limit, so
+        wall time is about (count / limit) * latency rather than count * latency.
+        """
+        fleet = _fleet(40)
+        latency, limit = 0.05, 8
+        with FakeAzureServer(fleet, latency=latency) as server:
+            azure.configure_client(server.url, max_concurrency=32)
+
+            start = time.perf_counter()
+            results = azure.get_apim_properties_many([i["id"] for i in fleet], max_concurrency=limit)
+            elapsed = time.perf_counter() - start
+
+        self.assertEqual(len(results), 40)
+        self.assertLessEqual(server.max_in_flight, limit)
+        self.assertLess(elapsed, len(fleet) * latency / 2)
+
+    def test_async_api_from_another_event_loop(self):
+        fleet = _fleet(3)
+        with FakeAzureServer(fleet) as server:
+            azure.configure_client(server.url)
+
+            async def run():
+                single = await azure.aget_apim_properties(fleet[0]["id"])
+                many = await azure.aget_apim_properties_many([i["id"] for i in fleet])
+                return single, many
+
+            single, many = asyncio.run(run())
+
+        self.assertEqual(single["name"], "apim-000")
+        self.assertEqual(len(many), 3)
+
+class TestOfflineMode(unittest.TestCase):
+
+    def setUp(self):
+        azure.configure_client(None)
+        azure.clear_cache()
+
+    def test_batch_falls_back_to_placeholder_data(self):
+        resource_id = "/subscriptions/x/resourceGroups/rg/providers/Microsoft.ApiManagement/service/apim-prod-eus"
+        results = azure.get_apim_metrics_many([resource_id], ["Capacity"], TIMESPAN)
+        self.assertEqual(results[resource_id]["Capacity"], 22.5)
+
+    def test_percentile(self):
+        self.assertIsNone(azure._percentile([], 95))
+        self.assertEqual(azure._percentile([5.0], 95), 5.0)
+        self.assertEqual(azure._percentile([0.0, 10.0], 50), 5.0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,101 @@
+import os
+import sqlite3
+import tempfile
+import time
+import unittest
+
+from finops_agent.finops_agent.tools.cache import TTLCache
+
+class FakeClock:
+    def __init__(self, now: float = 1000.0):
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+class TestTTLCache(unittest.TestCase):
+
+    def test_hit_and_miss_counters(self):
+        cache = TTLCache()
+        self.assertIsNone(cache.get("a"))
+        cache.set("a", {"Capacity": 10.0})
+        self.assertEqual(cache.get("a"), {"Capacity": 10.0})
+
+        stats = cache.stats.to_dict()
+        self.assertEqual(stats["misses"], 1)
+        self.assertEqual(stats["hits"], 1)
+        self.assertEqual(stats["round_trips_saved"], 1)
+
+    def test_entries_expire_after_ttl(self):
+        clock = FakeClock()
+        cache = TTLCache(ttl=60, clock=clock)
+        cache.set("a", 1)
+
+        clock.now += 59
+        self.assertEqual(cache.get("a"), 1)
+        clock.now += 2
+        self.assertIsNone(cache.get("a"))
+        self.assertEqual(cache.stats.expirations, 1)
+
+    def test_least_recently_used_entry_is_evicted(self):
+        cache = TTLCache(max_entries=2)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.get("a")  # "b" is now the least recently used
+        cache.set("c", 3)
+
+        self.assertEqual(cache.get("a"), 1)
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.stats.evictions, 1)
+
+    def test_disk_tier_survives_a_new_cache_instance(self):
+        clock = FakeClock()
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "cache.sqlite")
+            first = TTLCache(ttl=3600, disk_path=path, clock=clock)
+            first.set("a", {"Capacity": 10.0})
+            first.close()
+
+            second = TTLCache(ttl=3600, disk_path=path, clock=clock)
+            self.assertEqual(second.get("a"), {"Capacity": 10.0})
+            self.assertEqual(second.stats.disk_hits, 1)
+            # Promoted to memory, so the next read does not touch the disk.
+            second.get("a")
+            self.assertEqual(second.stats.hits, 1)
+
+            clock.now += 3601
+            self.assertIsNone(second.get("a"))
+            self.assertEqual(second.purge_expired(), 1)
+            second.close()
+
+    def test_disk_writes_are_committed_in_batches(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "cache.sqlite")
+            cache = TTLCache(max_entries=1, disk_path=path, disk_batch_size=1000, disk_flush_interval=60)
+            for n in range(10):
+                cache.set(f"k{n}", n)
+            # Nothing was written on `set`.
+            with sqlite3.connect(path) as db:
+                self.assertEqual(db.execute("SELECT COUNT(*) FROM cache").fetchone(), (0,))
+            # Evicted from memory and not yet on disk, an entry is still served.
+            self.assertEqual(cache.get("k0"), 0)
+
+            self.assertEqual(cache.flush(), 10)
+            cache.close()
+            reopened = TTLCache(disk_path=path)
+            self.assertEqual([reopened.get(f"k{n}") for n in range(10)], list(range(10)))
+            reopened.close()
+
+    def test_full_batch_is_committed_in_the_background(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            cache = TTLCache(disk_path=os.path.join(tmp, "cache.sqlite"), disk_batch_size=5, disk_flush_interval=60)
+            for n in range(5):
+                cache.set(f"k{n}", n)
+            deadline = time.monotonic() + 10
+            while cache._pending and time.monotonic() < deadline:
+                time.sleep(0.01)
+            self.assertEqual(cache._pending, {})
+            cache.close()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,79 @@
+import os
+import tempfile
+import unittest
+
+from finops_agent.finops_agent.orchestrator import finalize_node
+from finops_agent.finops_agent.tools import pricing
+from finops_agent.finops_agent.tools.pricing import PriceIndex, monthly_unit_prices, refresh_catalog
+
+def _row(sku_name: str, region: str, hourly: float, meter: str = None, unit: str = "1 Hour"):
+    return {"skuName": sku_name, "armRegionName": region, "retailPrice": hourly,
+            "meterName": meter or f"{sku_name} Unit", "unitOfMeasure": unit}
+
+class TestPriceIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        pricing.configure_price_index(None)
+        self.tmp.cleanup()
+
+    def test_region_price_falls_back_to_any_region(self):
+        index = PriceIndex.from_prices({("Premium", "*"): 2000.0, ("Premium", "westeurope"): 2500.0})
+
+        self.assertEqual(index.monthly_price("Premium", "West Europe"), 2500.0)
+        self.assertEqual(index.monthly_price("Premium", "eastus"), 2000.0)
+        self.assertEqual(index.monthly_price("Premium"), 2000.0)
+        self.assertIsNone(index.monthly_price("Isolated", "eastus"))
+        self.assertIsNone(index.monthly_price(None))
+
+    def test_saving_counts_capacity_units(self):
+        index = PriceIndex.default()
+
+        self.assertEqual(index.saving([("Premium", 2)], [("Standard", 2)]), round(2 * (2795.17 - 686.72), 2))
+        self.assertEqual(index.saving([("Basic", 1), ("Standard", 1)], [("Standard", 1)]), 147.17)
+        self.assertIsNone(index.saving([("Isolated", 1)], [("Standard", 1)]))
+
+    def test_only_hourly_unit_meters_are_compiled(self):
+        prices = monthly_unit_prices([
+            _row("Premium", "eastus", 3.0),
+            _row("Premium", "eastus", 1.0, meter="Premium Gateway Unit"),
+            _row("Standard v2", "eastus", 1.0),
+            _row("Consumption", "eastus", 0.035, unit="10K"),
+        ])
+
+        self.assertEqual(prices, {("Premium", "eastus"): 3.0 * pricing.HOURS_PER_MONTH,
+                                  ("Standard_v2", "eastus"): 1.0 * pricing.HOURS_PER_MONTH})
+
+    def test_catalog_round_trips_through_a_memory_mapped_file(self):
+        path = os.path.join(self.tmp.name, "prices.npy")
+        refresh_catalog(path, rows=[_row("Premium", "westeurope", 4.0)])
+
+        index = pricing.configure_price_index(path)
+        self.assertIs(pricing.get_price_index(), index)
+        self.assertEqual(index.monthly_price("Premium", "westeurope"), 4.0 * pricing.HOURS_PER_MONTH)
+        # The built-in prices stay as the fallback.
+        self.assertEqual(index.monthly_price("Premium", "eastus"), pricing.DEFAULT_MONTHLY_PRICES["Premium"])
+        self.assertEqual(len(index), len(pricing.DEFAULT_MONTHLY_PRICES) + 1)
+
+class TestTopRecommendations(unittest.TestCase):
+
+    def test_finalize_ranks_by_estimated_saving(self):
+        savings = [50.0, None, 700.0, 10.0, 300.0]
+        recs = [{"id": f"REC-{n}", "payload": {"estimated_monthly_saving": saving}} for n, saving in enumerate(savings)]
+
+        result = finalize_node({"recommendations": recs, "top_k": 3})
+
+        self.assertEqual([rec["id"] for rec in result["top_recommendations"]], ["REC-2", "REC-4", "REC-0"])
+
+    def test_missing_estimates_rank_below_negative_savings(self):
+        savings = [None, -20.0, 0.0, None]
+        recs = [{"id": f"REC-{n}", "payload": {"estimated_monthly_saving": saving}} for n, saving in enumerate(savings)]
+
+        result = finalize_node({"recommendations": recs, "top_k": 3})
+
+        self.assertEqual([rec["id"] for rec in result["top_recommendations"]], ["REC-2", "REC-1", "REC-0"])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,104 @@
+import unittest
+
+from finops_agent.finops_agent.orchestrator import discovery_node
+from finops_agent.finops_agent.tools import azure
+from finops_agent.finops_agent.tools.resource_graph import InventoryIndex
+from finops_agent.tests.fake_azure import FakeAzureServer, make_instance
+
+def _fleet(subscription_ids, per_subscription):
+    return [make_instance(sid, f"apim-{sid}-{n:04d}", sku="Premium" if n % 2 else "Basic", vnet="External" if n % 3 else "None")
+            for sid in subscription_ids for n in range(per_subscription)]
+
+class TestInventoryIndex(unittest.TestCase):
+
+    def test_lookup_is_case_insensitive(self):
+        instance = make_instance("Sub-A", "apim-1")
+        index = InventoryIndex([instance])
+
+        self.assertIs(index.get(instance["id"].upper()), instance)
+        self.assertIn(instance["id"].lower(), index)
+        self.assertTrue(index.covers_subscription("sub-a"))
+        self.assertEqual(index.instances_in("SUB-A"), [instance])
+
+    def test_empty_subscription_is_covered_once_marked(self):
+        index = InventoryIndex([])
+        index.mark_subscriptions(["sub-empty"])
+        self.assertTrue(index.covers_subscription("sub-empty"))
+        self.assertEqual(index.instances_in("sub-empty"), [])
+
+    def test_merged_replaces_only_the_newer_subscriptions(self):
+        kept, old, new = make_instance("sub-a", "apim-1"), make_instance("sub-b", "apim-2"), make_instance("sub-b", "apim-3")
+        older = InventoryIndex([kept, old])
+        merged = older.merged(InventoryIndex([new]))
+
+        self.assertEqual(merged.instances_in("sub-a"), [kept])
+        # The instance sub-b no longer has is gone.
+        self.assertEqual(merged.instances_in("sub-b"), [new])
+        self.assertIn(old["id"], older)
+
+    def test_updated_replaces_one_instance_in_a_copy(self):
+        other, old = make_instance("sub-a", "apim-1"), make_instance("sub-a", "apim-2")
+        index = InventoryIndex([other, old])
+        new = dict(old, sku={"name": "Premium", "capacity": 1})
+        updated = index.updated([new])
+
+        self.assertEqual(updated.instances_in("sub-a"), [other, new])
+        self.assertIs(index.get(old["id"]), old)
+        self.assertEqual(index.instances_in("sub-a"), [other, old])
+
+    def test_without_drops_only_the_given_subscriptions(self):
+        kept, dropped = make_instance("sub-a", "apim-1"), make_instance("sub-b", "apim-2")
+        index = InventoryIndex([kept, dropped])
+        remaining = index.without(["SUB-B"])
+
+        self.assertEqual((remaining.subscription_ids, remaining.resource_ids()), (["sub-a"], [kept["id"]]))
+        self.assertFalse(remaining.covers_subscription("sub-b"))
+        self.assertIn(dropped["id"], index)
+
+class TestBulkInventory(unittest.TestCase):
+
+    def setUp(self):
+        azure.clear_cache()
+
+    def tearDown(self):
+        azure.clear_inventory()
+        azure.configure_client(None)
+
+    def test_one_paged_query_replaces_point_reads(self):
+        """
+        Tests that discovery inventories a multi-subscription fleet with a few
+        paged queries, after which properties and listings need no Azure calls.
+        """
+        subscription_ids = ["sub-a", "sub-b", "sub-c"]
+        fleet = _fleet(subscription_ids, 700)
+        with FakeAzureServer(fleet) as server:
+            azure.configure_client(server.url)
+
+            result = discovery_node({"subscription_ids": subscription_ids, "resources": [], "recommendations": []})
+            # 2100 rows at 1000 rows per page.
+            self.assertEqual(len(server.requests), 3)
+            self.assertEqual(len(result["resources"]), 2100)
+
+            properties = azure.get_apim_properties_many(result["resources"])
+            listings = azure.list_all_apim_instances_many(subscription_ids)
+
+        self.assertEqual(len(server.requests), 3)
+        first = fleet[1]
+        self.assertEqual(properties[first["id"]]["sku"], {"name": "Premium", "capacity": 1})
+        self.assertEqual(properties[first["id"]]["properties"]["virtualNetworkType"], "External")
+        self.assertEqual(len(listings["sub-b"]), 700)
+
+    def test_offline_inventory_uses_placeholder_listing(self):
+        index = azure.load_inventory(["sub-offline"])
+        self.assertEqual(len(index), 4)
+        self.assertIs(azure.get_inventory(), index)
+
+    def test_discovery_without_subscriptions_clears_inventory(self):
+        azure.load_inventory(["sub-offline"])
+        result = discovery_node({"resources": [], "recommendations": []})
+
+        self.assertEqual(len(result["resources"]), 2)
+        self.assertIsNone(azure.get_inventory())
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,139 @@
+import asyncio
+import time
+import unittest
+
+import httpx
+
+from finops_agent.finops_agent.tools import azure
+from finops_agent.finops_agent.tools.arm_client import ArmClient
+from finops_agent.finops_agent.tools.scheduler import (
+    AdaptiveLimit, RateLimit, TokenBucket, endpoint_of, retry_after_seconds)
+from finops_agent.tests.fake_azure import FakeAzureServer, make_instance
+
+SUBSCRIPTION_ID = "sub-1"
+
+def _fleet(count: int):
+    return [make_instance(SUBSCRIPTION_ID, f"apim-{n:03d}") for n in range(count)]
+
+class TestSchedulingPrimitives(unittest.TestCase):
+
+    def test_endpoint_of(self):
+        rid = "/subscriptions/SUB-1/resourceGroups/rg/providers/Microsoft.ApiManagement/service/a"
+        self.assertEqual(endpoint_of(rid), "arm:sub-1")
+        self.assertEqual(endpoint_of(f"{rid}/providers/Microsoft.Insights/metrics"), "monitor:sub-1")
+        self.assertEqual(endpoint_of("/providers/Microsoft.ResourceGraph/resources"), "resource_graph")
+
+    def test_retry_after_forms(self):
+        self.assertEqual(retry_after_seconds({"retry-after": "7"}), 7.0)
+        self.assertEqual(retry_after_seconds({"x-ms-retry-after-ms": "250"}), 0.25)
+        self.assertEqual(retry_after_seconds({"retry-after": "Thu, 01 Jan 1970 00:00:10 GMT"}, now=4.0), 6.0)
+        self.assertIsNone(retry_after_seconds({}))
+
+    def test_token_bucket_paces_after_burst(self):
+        bucket = TokenBucket(RateLimit(rate=20.0, burst=2))
+
+        async def take(n):
+            for _ in range(n):
+                await bucket.acquire()
+
+        start = time.perf_counter()
+        asyncio.run(take(4))
+        # Two tokens from the burst, two more at 20/s.
+        self.assertGreaterEqual(time.perf_counter() - start, 0.09)
+
+    def test_adaptive_limit_halves_once_per_epoch(self):
+        limit = AdaptiveLimit(initial=16, maximum=16)
+        limit.on_throttle(epoch=0)
+        limit.on_throttle(epoch=0)  # Sent before the first cut; ignored.
+        self.assertEqual(limit.limit, 8.0)
+
+        for _ in range(8):
+            limit.on_success()
+        self.assertAlmostEqual(limit.limit, 9.0, delta=0.5)
+
+    def test_adaptive_limit_slow_starts_until_throttled(self):
+        limit = AdaptiveLimit(initial=2, maximum=16)
+        for _ in range(6):
+            limit.on_success()
+        self.assertEqual(limit.limit, 8.0)
+
+        # After the first throttle, growth is additive again.
+        limit.on_throttle(epoch=0)
+        for _ in range(4):
+            limit.on_success()
+        self.assertAlmostEqual(limit.limit, 5.0, delta=0.2)
+
+    def test_adaptive_limit_slow_start_stops_at_maximum(self):
+        limit = AdaptiveLimit(initial=2, maximum=16)
+        for _ in range(40):
+            limit.on_success()
+        self.assertEqual(limit.limit, 16.0)
+
+class TestThrottledServer(unittest.TestCase):
+
+    def setUp(self):
+        azure.clear_cache()
+
+    def tearDown(self):
+        azure.configure_client(None)
+
+    def test_batch_completes_under_throttling(self):
+        """
+        Tests that a batch sent to a service that throttles above 4 concurrent
+        requests gets every result, and that the adaptive limit backs off to
+        near the service's capacity instead of staying at the client maximum.
+        """
+        fleet = _fleet(60)
+        with FakeAzureServer(fleet, latency=0.02, throttle_in_flight=4, retry_after=0.05) as server:
+            client = azure.configure_client(server.url, max_concurrency=32)
+            results = azure.get_apim_properties_many([i["id"] for i in fleet], max_concurrency=32)
+
+        self.assertEqual([r for r in results.values() if isinstance(r, Exception)], [])
+        self.assertGreater(server.throttled, 0)
+        self.assertLess(client.scheduler.stats()[f"arm:{SUBSCRIPTION_ID}"]["concurrency_limit"], 16)
+
+    def test_retry_after_is_honored(self):
+        fleet = _fleet(1)
+        with FakeAzureServer(fleet, retry_after=0.2) as server:
+            azure.configure_client(server.url)
+            server.throttle_next = 2
+
+            start = time.perf_counter()
+            result = azure.get_apim_properties_many([fleet[0]["id"]])
+            elapsed = time.perf_counter() - start
+
+        self.assertEqual(result[fleet[0]["id"]]["name"], "apim-000")
+        self.assertEqual(len(server.requests), 3)
+        self.assertGreaterEqual(elapsed, 0.4)
+
+    def test_gives_up_after_max_retries(self):
+        fleet = _fleet(1)
+        with FakeAzureServer(fleet, retry_after=0) as server:
+            client = ArmClient(server.url, max_retries=2)
+            server.throttle_next = 10
+            try:
+                with self.assertRaises(httpx.HTTPStatusError):
+                    client.run(client.get_json(fleet[0]["id"]))
+            finally:
+                client.close()
+
+        self.assertEqual(len(server.requests), 3)
+
+    def test_identical_gets_in_flight_are_coalesced(self):
+        fleet = _fleet(1)
+        with FakeAzureServer(fleet, latency=0.1) as server:
+            client = ArmClient(server.url)
+
+            async def fetch_twice():
+                return await asyncio.gather(*(client.get_json(fleet[0]["id"]) for _ in range(2)))
+
+            try:
+                first, second = client.run(fetch_twice())
+            finally:
+                client.close()
+
+        self.assertEqual(first, second)
+        self.assertEqual(len(server.requests), 1)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,82 @@
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+from finops_agent.finops_agent.tools.sketch import QuantileSketch, SketchStore, daily_sketches
+from finops_agent.finops_agent.tools.timeseries import MetricStatistics
+
+DAY = 86400.0
+TODAY = 20000
+
+class TestQuantileSketch(unittest.TestCase):
+
+    def test_quantiles_within_relative_accuracy(self):
+        values = np.random.default_rng(3).lognormal(3, 1, 10_000)
+        sketch = QuantileSketch.from_values(values)
+
+        for p in (50.0, 95.0, 99.0):
+            exact = np.percentile(values, p, method="lower")
+            self.assertAlmostEqual(sketch.quantile(p), exact, delta=exact * 0.01)
+
+    def test_merge_equals_sketch_of_union(self):
+        rng = np.random.default_rng(5)
+        a, b = rng.uniform(0, 100, 500), rng.uniform(0, 100, 700)
+        merged = QuantileSketch.from_values(a)
+        merged.merge(QuantileSketch.from_values(b))
+        whole = QuantileSketch.from_values(np.concatenate([a, b]))
+
+        self.assertEqual(merged.count, 1200)
+        self.assertEqual(merged.quantiles([50.0, 95.0]), whole.quantiles([50.0, 95.0]))
+
+    def test_constant_and_zero_values_are_exact(self):
+        self.assertEqual(QuantileSketch.from_values(np.full(24, 22.5)).quantile(95.0), 22.5)
+        self.assertEqual(QuantileSketch.from_values(np.zeros(24)).quantile(95.0), 0.0)
+        self.assertIsNone(QuantileSketch().quantile(95.0))
+
+class TestSketchStore(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "sketches.db")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_sketches_persist_and_replace_from_a_day(self):
+        store = SketchStore(self.path)
+        timestamps = (TODAY - 2 + np.arange(3)) * DAY
+        store.replace("R1", TODAY - 2, {"Capacity": daily_sketches(timestamps, np.asarray([10.0, 20.0, 30.0]))}, 1.0)
+        store.replace("r1", TODAY, {"Capacity": daily_sketches(np.asarray([TODAY * DAY]), np.asarray([35.0]))}, 2.0)
+        store.close()
+
+        reopened = SketchStore(self.path)
+        days = reopened.load("r1", TODAY - 89)["Capacity"]
+        self.assertEqual(sorted(days), [TODAY - 2, TODAY - 1, TODAY])
+        self.assertEqual(days[TODAY].quantile(50.0), 35.0)
+        self.assertEqual(reopened.ingested_at("R1"), 2.0)
+        self.assertIsNone(reopened.ingested_at("r2"))
+
+    def test_merged_across_resources(self):
+        store = SketchStore()
+        for n, value in enumerate([10.0, 50.0, 90.0]):
+            store.replace(f"r{n}", TODAY, {"Capacity": daily_sketches(np.asarray([TODAY * DAY]), np.asarray([value]))}, 0.0)
+
+        merged = store.merged(["r0", "r1", "r2"], "Capacity", TODAY, TODAY)
+        self.assertEqual(merged.count, 3)
+        self.assertAlmostEqual(merged.quantile(50.0), 50.0, delta=0.5)
+
+    def test_statistics_from_daily_sketches(self):
+        # 90 days of one datapoint each, valued by age: today 0, yesterday 1, ...
+        ages = np.arange(90)
+        sketches = {"Capacity": daily_sketches((TODAY - ages) * DAY, ages.astype(np.float64))}
+        stats = MetricStatistics.from_sketches(sketches, TODAY)
+
+        self.assertAlmostEqual(stats.get("Capacity", 7, 99.0), 5.0, delta=0.05)
+        self.assertAlmostEqual(stats.get("Capacity", 30, 50.0), 14.0, delta=0.14)
+        self.assertAlmostEqual(stats.get("Capacity", 90, 95.0), 84.0, delta=0.84)
+        self.assertIsNone(stats.get("Requests", 90, 95.0))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,60 @@
+import unittest
+
+import numpy as np
+
+from finops_agent.finops_agent.tools.sketch import daily_sketches
+from finops_agent.finops_agent.tools.timeseries import (
+    INGESTED_METRICS, MetricStatistics, parse_timestamp, series_from_points)
+
+DAY = 86400.0
+TODAY = 20000
+
+class TestSeries(unittest.TestCase):
+
+    def test_points_without_value_are_dropped(self):
+        timestamps, values = series_from_points([(1.0, 10.0), (2.0, None), (None, 30.0)], now=5.0)
+        self.assertEqual(timestamps.tolist(), [1.0, 5.0])
+        self.assertEqual(values.tolist(), [10.0, 30.0])
+
+    def test_parse_timestamp(self):
+        self.assertIsNone(parse_timestamp(None))
+        self.assertEqual(parse_timestamp("1970-01-02T00:00:00Z"), DAY)
+
+def _statistics(series, today=TODAY):
+    return MetricStatistics.from_sketches({name: daily_sketches(timestamps, values) for name, (timestamps, values) in series.items()},
+                                          today)
+
+class TestMetricStatistics(unittest.TestCase):
+
+    def test_windows_are_within_sketch_accuracy_of_numpy_percentiles(self):
+        rng = np.random.default_rng(7)
+        # Hourly points over the 90 days up to the end of today.
+        timestamps = (TODAY + 1) * DAY - 1 - np.arange(90 * 24) * 3600.0
+        values = rng.uniform(1, 100, len(timestamps))
+        stats = _statistics({"Capacity": (timestamps, values)})
+
+        for days in (7, 30, 90):
+            recent = values[timestamps >= (TODAY - days + 1) * DAY]
+            for p in (50.0, 95.0, 99.0):
+                expected = np.percentile(recent, p)
+                self.assertAlmostEqual(stats.get("Capacity", days, p), expected, delta=0.01 * expected + 0.2)
+
+    def test_metric_without_points_is_missing(self):
+        old = (np.asarray([(TODAY - 60) * DAY]), np.asarray([42.0]))
+        stats = _statistics({"Capacity": old})
+
+        self.assertIsNone(stats.get("Capacity", 7, 95.0))
+        self.assertEqual(stats.get("Capacity", 90, 95.0), 42.0)
+        self.assertIsNone(stats.get("CpuPercentage", 90, 95.0))
+        self.assertEqual(stats.metrics(90, 95.0), {"Capacity": 42.0})
+
+    def test_round_trip_through_list(self):
+        series = {name: (np.asarray([TODAY * DAY]), np.asarray([float(n)])) for n, name in enumerate(INGESTED_METRICS)}
+        stats = _statistics(series)
+        restored = MetricStatistics.from_list(stats.to_list())
+
+        self.assertEqual(restored.to_dict(), stats.to_dict())
+        self.assertEqual(restored.to_dict()["Requests"]["30d"]["p99"], 3.0)
+
+if __name__ == '__main__':
+    unittest.main()